@@ -7,6 +7,23 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Param table of the modules with their calibrate parameters in a single table
+MODULE_PARAM_TABLES = {
+    "CFE-S": "cfe_params",
+    "CFE-X": "cfe_params",
+    "T-Route": "t_route_params",
+    "Noah-OWP-Modular": "noah_owp_modular_params",
+    "Snow-17": "snow17_params",
+    "Sac-SMA": "sac_sma_params",
+    "TopModel": "topmodel_params",
+    "LASAM": "lasam_params",
+    "UEB": "ueb_params",
+    "TopoFlow": "topoflow_params",
+}
+
+# Modules with calibrate parameters in the param tables of the modules they depend on
+DEPENDENT_MODULES = ["SFT", "SMP"]
+
 #This class is used to fetch data from the database, and the results are converted into OrderedDict instances to maintain order.
 # TODO Add logging an use try-except for failed requests remove dead imports
 class DatabaseManager:
@@ -349,26 +366,8 @@ class DatabaseManager:
 
 
     def selectModuleCalibrateData(self, model_type):
-        table_name = ""
-        if model_type in ["CFE-S", "CFE-X"]:
-            table_name = "cfe_params"
-        elif model_type == "T-Route":
-            table_name = "t_route_params"
-        elif model_type == "Noah-OWP-Modular":
-            table_name = "noah_owp_modular_params"
-        elif model_type == "Snow-17":
-            table_name = "snow17_params"
-        elif model_type == "Sac-SMA":
-            table_name = "sac_sma_params"
-        elif model_type == "TopModel":
-            table_name = "topmodel_params"
-        elif model_type == "LASAM":
-            table_name = "lasam_params"
-        elif model_type == "UEB":
-            table_name = "ueb_params"
-        elif model_type == "TopoFlow":
-            table_name = "topoflow_params"
-        else:
+        table_name = MODULE_PARAM_TABLES.get(model_type)
+        if table_name is None:
             return None, None
 
         query = f"""
@@ -436,6 +435,95 @@ class DatabaseManager:
 
 
 
+    def selectModuleCalibrateDataByTable(self, table_name, model_types):
+        # Calibrate data of all the modules of one param table, same rows as selectModuleCalibrateData
+        query = f"""
+        SELECT 
+            m.name AS module_name,
+            p.name, 
+            p.description, 
+            p.min, 
+            p.max, 
+            p.data_type, 
+            p.units, 
+            p.calibratable,
+            p.default_value 
+        FROM 
+            modules m
+        JOIN 
+            module_params_map map ON m.id = map.module_id
+        JOIN 
+            {table_name} p ON map.param_field_id = p.id
+        JOIN 
+            param_tables pt ON pt.id = m.param_id
+          WHERE 
+            m.name = ANY(%s) 
+            AND p.calibratable = true
+        """
+        self.cursor.execute(query, [list(model_types)])
+        rows = self.cursor.fetchall()
+        column_names = [desc[0] for desc in self.cursor.description]
+        return column_names, rows
+
+    def selectDependentModuleParamTables(self, model_types):
+        # Param tables of the dependent modules, as in selectDependentModuleCalibrateData
+        query = """
+            SELECT DISTINCT pt.id, pt.param_table_name
+            FROM param_tables pt
+            JOIN module_params_map mpm ON mpm.param_table_id = pt.id
+            JOIN modules mods ON mods.id = mpm.module_id
+            WHERE mods.name = ANY(%s)
+            ORDER BY pt.id
+        """
+        self.cursor.execute(query, [list(model_types)])
+        return self.cursor.fetchall()
+
+    def selectDependentModuleCalibrateDataByTable(self, table_id, table_name, model_types):
+        # Calibrate data of the dependent modules in one param table, same rows as selectDependentModuleCalibrateData
+        query = (f"SELECT mods.name AS module_name, p.name, p.description, p.min, p.max, p.data_type, p.units, "
+                 f"p.calibratable, p.default_value from {table_name} p "
+                 f"join module_params_map mpm on mpm.param_field_id = p.id "
+                 f"join modules mods on mods.id = mpm.module_id "
+                 f"where p.calibratable = true and mpm.param_table_id = %s and mods.name = ANY(%s)")
+        self.cursor.execute(query, [table_id, list(model_types)])
+        rows = self.cursor.fetchall()
+        column_names = [desc[0] for desc in self.cursor.description]
+        return column_names, rows
+
+    def selectAllModuleOutVariablesData(self):
+        # Output variables of all modules, same rows as selectModuleOutVariablesData
+        query = """
+            SELECT 
+                m.name AS module_name,
+                ov.name,
+                ov.description
+            FROM 
+                output_variables ov
+            JOIN 
+                modules m ON ov.module_id = m.id
+            ORDER BY 
+                m.name, ov.name;
+        """
+        self.cursor.execute(query)
+        rows = self.cursor.fetchall()
+        column_names = [desc[0] for desc in self.cursor.description]
+        return column_names, rows
+
+    def selectModuleMetadataStamp(self):
+        # Changes when the module metadata tables are migrated, reloaded or marked stale
+        query = """
+            SELECT
+                (SELECT max(id) FROM django_migrations),
+                (SELECT count(*) FROM modules),
+                (SELECT count(*) FROM module_params_map),
+                (SELECT count(*) FROM param_tables),
+                (SELECT count(*) FROM output_variables),
+                (SELECT max(version) FROM cache_stamps WHERE name = %s)
+        """
+        self.cursor.execute(query, ['module_metadata'])
+        return tuple(self.cursor.fetchone())
+
+
 # Usage test example
 if __name__ == "__main__":
     db = DatabaseManager('hydrofabric_db', 'raghav.vadhera', 'change_me', '10.6.0.173')
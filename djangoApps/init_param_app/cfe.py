@@ -1,3 +1,4 @@
+import re
 import subprocess
 import json
 import pandas as pd
@@ -5,6 +6,8 @@ import pandas as pd
 from .models import CfeParams
 from .util import utilities
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate, escape_template_text
+from .util.divide_params import read_divide_params
 from .util.utilities import *
 from .hf_attributes import *
 
@@ -12,15 +15,16 @@ from .hf_attributes import *
 # Setup logging
 logger = logging.getLogger(__name__)
 
-def cfe_ipe(module, version, gage_id, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt, dep_modules_included):
+def cfe_ipe(module, version, gage_id, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt, dep_modules_included, coupling=''):
     ''' 
     Build initial parameter estimates (IPE) for CFE-S and CFE-X 
 
     Parameters:
     gage_id (str):  The gage ID, e.g., 06710385
-    subset_dir (str):  Path to gage id directory where the module directory will be made. 
+    sink (OutputSink):  Output sink the module's config files are written to
     module (str): Module name to specify CFE-S or CFE-X
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
+    coupling (str):  Coupling key of the module in the request, see util.coupling
     
     Returns:
     dict: JSON output with cfg file URI, calibratable parameters initial values, output variables.
@@ -45,22 +49,19 @@ def cfe_ipe(module, version, gage_id, source, domain, subset_dir, gpkg_file, mod
     else:
         csv_path_filename = f'{input_dir}/CFE-X_params_{domain}_{version}.csv'
 
-    #Create empty list to store BMI config file names
-    filename_list = []
-
     #Get all parameters from the database    
     from_attr = CfeParams.objects.filter(source_file='attr').values('name', 'nwm_name', 'default_value', 'units')
     consts = CfeParams.objects.filter(source_file='const').values('name', 'nwm_name', 'default_value', 'units')
 
     #Get divide attributes from geopackage
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
     if('error' in divide_attr): return divide_attr
     catchments = divide_attr["divide_id"].tolist()
 
     #Read CSV file for CFE-X parameters
     if module == 'CFE-X':
         try:
-            parameters_df = pd.read_csv(csv_path_filename)
+            filtered_parameters = read_divide_params(csv_path_filename, catchments)
         except FileNotFoundError:
             error_str = f'CFE-X Parameters CSV file not found: {csv_path_filename}'
             error = {'error': error_str}
@@ -73,7 +74,6 @@ def cfe_ipe(module, version, gage_id, source, domain, subset_dir, gpkg_file, mod
             return error   
         
         #Make sure that catchements exist in CSV file
-        filtered_parameters = parameters_df[parameters_df['divide_id'].isin(catchments)]
         if filtered_parameters.empty:
             error_str = f'Catchments in geopackage not found in CFE-X CSV file'
             error = {'error': error_str}
@@ -92,68 +92,64 @@ def cfe_ipe(module, version, gage_id, source, domain, subset_dir, gpkg_file, mod
     else:
         df_all = divide_attr
 
-    #Loop through catchments and create BMI config files
-    for index, divide in df_all.iterrows():
-
-        #empty list for accumulate parameter strings
-        control_out = []
-        params_out = []
-        
-        #get control items            
-        control_out.append('forcing_file=BMI')
-        control_out.append('verbosity=1')
-        control_out.append(f'surface_partitioning_scheme={scheme}')
-        control_out.append('surface_runoff_scheme=GIUH')
-        control_out.append('DEBUG=0')
-        control_out.append('num_timesteps=1')
-        if module == 'CFE-S':
-            if 'SFT' in dep_modules_included:
-                control_out.append('is_sft_coupled=1')
-            else:
-                control_out.append('is_sft_coupled=0')
-            control_out.append('ice_content_threshold=0.15')
-
-        #get items from divide attributes and CFE-X csv file
-        for param in from_attr:
-            param_name = param['name']
-            if module == 'CFE-S' and param_name in cfe_x_params:
-                continue
-            attr_value = divide.filter(regex=param['nwm_name']).values
-            #If attribute has more than 1 layer, use the first.
-            if(len(attr_value > 1)):  attr_value = attr_value[0]
-            units = param['units']
-            if units is None: units = ''
-            cfg_line = f"{param_name}={attr_value}[{units}]"
-            params_out.append(cfg_line)
-
-        #get constants
-        for param in consts:
-            param_name = param['name']
-            if module == 'CFE-S' and param_name in cfe_x_params:
-                continue
-            attr_value = param['default_value']
-            units = param['units']
-            if units is None: units = ''
-            cfg_line = f"{param_name}={attr_value}[{units}]"
-            params_out.append(cfg_line)
-        
-        #sort parameters alphabetically and combine with control parameters
-        params_out = sorted(params_out, key=str.lower)
-        params_out = control_out + params_out
+    #Resolve the nwm_name attribute patterns to one column each of the joined frame
+    params = [param for param in from_attr if not (module == 'CFE-S' and param['name'] in cfe_x_params)]
+    column_plan, error = resolve_attribute_columns(params, df_all.columns)
+    if error:
+        logger.error(error['error'])
+        return error
+
+    #control items, the same for every catchment
+    control_out = []
+    control_out.append('forcing_file=BMI')
+    control_out.append('verbosity=1')
+    control_out.append(f'surface_partitioning_scheme={scheme}')
+    control_out.append('surface_runoff_scheme=GIUH')
+    control_out.append('DEBUG=0')
+    control_out.append('num_timesteps=1')
+    if module == 'CFE-S':
+        if 'SFT' in dep_modules_included:
+            control_out.append('is_sft_coupled=1')
+        else:
+            control_out.append('is_sft_coupled=0')
+        control_out.append('ice_content_threshold=0.15')
+
+    #Template lines of the parameters.  Values from divide attributes and the CFE-X csv file are bound to
+    #their column, constants are written into the template.
+    param_lines = []
+    bindings = {}
+    for param in params:
+        units = param['units']
+        if units is None: units = ''
+        field = f'attr{len(bindings)}'
+        bindings[field] = df_all[column_plan[param['name']]]
+        param_lines.append((param['name'], escape_template_text(f"{param['name']}=") + '{' + field + '}'
+                            + escape_template_text(f"[{units}]")))
+
+    #get constants
+    for param in consts:
+        param_name = param['name']
+        if module == 'CFE-S' and param_name in cfe_x_params:
+            continue
+        attr_value = param['default_value']
+        units = param['units']
+        if units is None: units = ''
+        param_lines.append((param_name, escape_template_text(f"{param_name}={attr_value}[{units}]")))
+
+    #sort parameters alphabetically
+    param_lines = sorted(param_lines, key=lambda name_line: (name_line[0] + '=').lower())
+
+    #Render a BMI config file for each catchment in the temp dir
+    template = ConfigTemplate('\n'.join([escape_template_text(line) for line in control_out]
+                                        + [line for _, line in param_lines]))
+    cfg_files = template.render(**bindings)
+    cfg_filenames = [f'{divide_id}_bmi_config_cfe.txt' for divide_id in df_all['divide_id'].tolist()]
+    filename_list = sink.write_files(cfg_filenames, cfg_files)
+    params_out = cfg_files[-1].split('\n')
 
-        #join all list items into single string with line breaks
-        params_out_all = '\n'.join(params_out)
-        
-        #write BMI cfg file for catchment to temp dir
-        divide_id = divide['divide_id']
-        cfg_filename = f'{divide_id}_bmi_config_cfe.txt'
-        filename_list.append(cfg_filename)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-            outfile.write(params_out_all)
-            
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list, module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list, module=module,
+                                          coupling=coupling).uri
     status_str = "Config files written to:  " + uri
     logger.info(status_str)
     
@@ -168,4 +164,34 @@ def cfe_ipe(module, version, gage_id, source, domain, subset_dir, gpkg_file, mod
         module_metadata["calibrate_parameters"][x]["initial_value"] = cfg_file_ipes[module_metadata["calibrate_parameters"][x]["name"]]
         
     module_metadata["parameter_file"]["uri"] = uri
-    return module_metadata
\ No newline at end of file
+    return module_metadata
+
+
+def resolve_attribute_columns(params, columns):
+    '''
+    Resolve the nwm_name pattern of each CfeParams attribute row to a single column
+
+    The pattern is a regular expression searched in the column names.  An exact name match wins,
+    a soil layered attribute (e.g. mode.bexp_soil_layers_stag=1 to =4) resolves to its first layer.
+
+    Parameters:
+    params (list):  CfeParams rows with name and nwm_name
+    columns (Index):  Columns of the attribute frame
+
+    Returns:
+    tuple: dict of parameter name to column name, and an error dict (None if all parameters resolved)
+    '''
+    column_plan = {}
+    for param in params:
+        pattern = param['nwm_name']
+        matches = [column for column in columns if re.search(pattern, column)]
+        if not matches:
+            return None, {'error': f"CFE parameter {param['name']}: no divide attribute matches '{pattern}'"}
+        if pattern in matches:
+            column_plan[param['name']] = pattern
+        elif len({re.sub(r'[=.]\d+$', '', column) for column in matches}) == 1:
+            column_plan[param['name']] = matches[0]
+        else:
+            return None, {'error': f"CFE parameter {param['name']}: divide attribute '{pattern}' is ambiguous, "
+                                   f"matches {', '.join(matches)}"}
+    return column_plan, None
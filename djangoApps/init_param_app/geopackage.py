@@ -1,14 +1,68 @@
 import inspect
-from subprocess import run
 import psycopg2
 from minio import S3Error
 
+from . import hf_subsetter
 from .util.gage_file_management import GageFileManagement
+from .util.gage_index import get_gage_index
+from .util.single_flight import SingleFlight
+from .util.workspace import scratch_workspace
+from .util.subsetter_pool import get_subsetter_pool
 from .util.utilities import *
 
 # setup logging
 logger = logging.getLogger(__name__)
 
+# Concurrent requests for the same geopackage share one subsetting
+geopackage_flights = SingleFlight('geopackage')
+
+
+def find_gage(gage_id, version, source, domain):
+    """
+    Looks the gage up in the gage index
+
+    Returns:
+    tuple: GageLocation of the gage (None if not indexed) and an error dictionary if the gage is known
+    not to exist in the hydrofabric (None otherwise)
+    """
+    gage_index = get_gage_index()
+    if gage_index is None:
+        return None, None
+    location = gage_index.lookup(gage_id, source, domain, version)
+    if location is None and gage_index.covers(source, domain, version):
+        error_str = f"Gage {gage_id} not found in hydrofabric version {version}, domain {domain}"
+        logger.error(error_str)
+        return None, {'error': error_str}
+    return location, None
+
+
+def ensure_geopackage(gage_id, version, source, domain, keep_file=False):
+    """
+    Returns the geopackage, subsetting the hydrofabric when it does not exist yet.  Concurrent calls for the same
+    geopackage wait for the one subsetting it, in this process or in another one.
+
+    Parameters:
+    gage_id (str):  The gage ID, e.g., 06710385
+    keep_file (bool):  Keep the local geopackage file in the request's workspace if this call creates it
+
+    Returns:
+    tuple: True if this call created the geopackage (the local file exists if keep_file), and the URI of the
+    geopackage or the error
+    """
+    def find_or_create():
+        # Another process may have built it while this one waited for the lock
+        file_found, results = GageFileManagement().file_exists(gage_id, version, domain, source, 'GEOPACKAGE')
+        if file_found:
+            logger.debug(f"Prexisting Geopackage found for gage_id - {gage_id}, version - {version}, domain - {domain}, source - {source}")
+            return False, results
+        # A kept file stays in the workspace of the calling request
+        with scratch_workspace(f"geopackage-{gage_id}"):
+            return True, get_geopackage(gage_id, version, source, domain, keep_file=keep_file)
+
+    (created, results), shared = geopackage_flights.do((gage_id, version, domain, source, 'GEOPACKAGE'),
+                                                       find_or_create)
+    return created and not shared, results
+
 
 def get_geopackage(gage_id, version, source, domain, keep_file=False):
     """
@@ -25,6 +79,10 @@ def get_geopackage(gage_id, version, source, domain, keep_file=False):
 
     #get paths, etc from config.yml
     config = get_config()
+    #reject gages that are not in the hydrofabric before any subsetting work
+    location, error = find_gage(gage_id, version, source, domain)
+    if error:
+        return error
     #temp dir for files
     loc_temp_dir = None
     try:
@@ -38,16 +96,7 @@ def get_geopackage(gage_id, version, source, domain, keep_file=False):
         # hydrofabric input data version type
         hydrofabric_type = config['hydrofabric_type']
         # hydrofabric v2.2 filename by domain
-        if domain == 'CONUS' and source != 'ENVCA':
-            hydrofabric_filename = config['hydrofabric_conus_filename']
-        elif domain == 'CONUS' and source == 'ENVCA':
-            hydrofabric_filename = config['hydrofabric_gl_filename']
-        elif domain == 'Alaska':
-            hydrofabric_filename = config['hydrofabric_ak_filename']
-        elif domain == 'Hawaii':
-            hydrofabric_filename = config['hydrofabric_hi_filename']
-        elif domain == 'Puerto_Rico':
-            hydrofabric_filename = config['hydrofabric_prvi_filename']
+        hydrofabric_filename = get_hydrofabric_filename(config, domain, source)
         # Tell the subsetter what to retrieve
         #Hydrofabric version 2.1 uses Gages, while 2.2 uses gages in the gage id hl_uri.
         subsetter_gage_id = gage_id
@@ -57,35 +106,30 @@ def get_geopackage(gage_id, version, source, domain, keep_file=False):
         if(hydrofabric_version == '2.1'): hydrofabric_version_subsetter = '2.1.1'
         
         gpkg_filename = gage_file_mgmt.get_geopackage_filename(gage_id)
-        status_str = "Calling HF Subsetter R code"
-        
-        #Call R code for subsetter
-        logger.debug(status_str)
-        
-        path_string = "R/run_subsetter.R"
-        grandparent_dir = os.path.dirname(settings.BASE_DIR)
-        r_code_file = os.path.join(grandparent_dir, path_string)
-        logger.debug(f"R code file = {r_code_file}")
-
-        #run_command = ["/usr/bin/Rscript", "../R/run_subsetter.R",
-        run_command = ["/usr/bin/Rscript", r_code_file,
-                       subsetter_gage_id,
-                       loc_temp_dir,
-                       gpkg_filename,
-                       hydrofabric_dir,
-                       hydrofabric_version_subsetter,
-                       hydrofabric_type,
-                       domain,
-                       hydrofabric_filename,
-                       source]
-        
-        
-        result = run(run_command, capture_output=True)
-        stderr = str(result.stderr.decode('utf-8'))
-        if len(stderr) > 0:
-            error_str = f'Hydrofabric subsetting failed: {stderr}'
+        subset_args = dict(gauge_id=subsetter_gage_id,
+                           outpath=loc_temp_dir,
+                           outfile=gpkg_filename,
+                           hydrofabric_data=hydrofabric_dir,
+                           hydrofabric_version=hydrofabric_version_subsetter,
+                           hydrofabric_type=hydrofabric_type,
+                           domain=domain,
+                           hydrofabric_filename=hydrofabric_filename,
+                           source=source)
+        if location is not None:
+            subset_args.update(location._asdict())
+
+        #The python subsetter only reads 2.2 data, 2.1 is always subset in R
+        if config.get('subsetter_engine', 'R') == 'python' and hydrofabric_version == '2.2':
+            logger.debug("Calling HF Subsetter python code")
+            result = hf_subsetter.hf_subset(**subset_args)
+        else:
+            #Run the subset on one of the long lived R workers
+            logger.debug("Calling HF Subsetter R code")
+            result = get_subsetter_pool().submit(**subset_args)
+        if result['status'] != 'ok':
+            error_str = f"Hydrofabric subsetting failed: {result['message']}"
             error = {'error': error_str}
-            logger.error(error_str)
+            logger.error(f"{error_str} ({result.get('error_class')})")
             return error
     except OSError as ose:
         current_filename = __file__
@@ -97,7 +141,7 @@ def get_geopackage(gage_id, version, source, domain, keep_file=False):
     # Write geopackage to s3 bucket
     try:
         # Put the gpkg_filename in list
-        uri = gage_file_mgmt.write_file_to_s3(gage_id, hydrofabric_version, domain, data_type, source, loc_temp_dir, [gpkg_filename])
+        uri = gage_file_mgmt.write_file_to_s3(gage_id, hydrofabric_version, domain, data_type, source, loc_temp_dir, [gpkg_filename]).uri
     # TODO PROPERLY HANDEL LOGGING "RESPONSE" FOR CAUGHT ERRORS
     except psycopg2.DatabaseError as psycopg2_error:
         logging.error(psycopg2_error)
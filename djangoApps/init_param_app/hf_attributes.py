@@ -1,13 +1,95 @@
 import os
 import logging
+import threading
+from functools import lru_cache
 
-import geopandas as gpd
+import pyogrio
 from pyproj import Transformer
 from .util.enums import FileTypeEnum
 
 logger = logging.getLogger(__name__)
 
-def get_hydrofabric_attributes(gpkg_file,version,domain):
+
+@lru_cache(maxsize=None)
+def get_wgs84_transformer(crs):
+    """
+    Transformer from a domain CRS to WGS84 (lat, lon order), created once per CRS for the life of the process
+    """
+    return Transformer.from_crs(crs, 4326)
+
+
+# Columns of the divides layer used by the module writers
+DIVIDE_COLUMNS = ['divide_id', 'areasqkm', 'lengthkm']
+
+
+def read_attribute_layer(gpkg_file, layer, columns=None):
+    """
+    Reads the attribute columns of a geopackage layer through Arrow, without decoding any geometry
+
+    :param columns: Columns to read, those missing from the layer are skipped.  All columns if None
+    :return: pandas DataFrame with numpy dtypes, as gpd.read_file returns
+    """
+    if columns is not None:
+        fields = set(pyogrio.read_info(gpkg_file, layer=layer)['fields'])
+        columns = [column for column in columns if column in fields]
+    return pyogrio.read_dataframe(gpkg_file, layer=layer, columns=columns, read_geometry=False, use_arrow=True)
+
+
+def read_layer_crs(gpkg_file, layer):
+    """
+    CRS of a geopackage layer, from the layer metadata
+    """
+    return pyogrio.read_info(gpkg_file, layer=layer)['crs']
+
+
+class HydrofabricAttributes:
+    """
+    Attribute layers of one subset geopackage, shared by every module of an IPE request.
+
+    The divides layer and the normalized divide attributes are read once, on first use.  Modules get
+    shallow copies sharing the same data, so they can add or drop columns but must not modify values in place.
+    """
+
+    def __init__(self, gpkg_file, version, domain):
+        self.gpkg_file = gpkg_file
+        self.version = version
+        self.domain = domain
+        self._divides = None
+        self._divide_attr = None
+        self._lock = threading.Lock()
+
+    def _read_divides(self):
+        if self._divides is None:
+            self._divides = read_attribute_layer(self.gpkg_file, 'divides', DIVIDE_COLUMNS)
+        return self._divides
+
+    def divides(self):
+        """
+        The DIVIDE_COLUMNS of the divides layer, without geometry
+        :raises: The error of reading the layer
+        """
+        with self._lock:
+            return self._read_divides().copy(deep=False)
+
+    def divide_attributes(self):
+        """
+        The divide attributes normalized by get_hydrofabric_attributes, or its error dictionary
+        """
+        with self._lock:
+            if self._divide_attr is None:
+                try:
+                    divide_layer = self._read_divides()
+                except Exception:
+                    # get_hydrofabric_attributes reports the error opening the geopackage
+                    divide_layer = None
+                self._divide_attr = get_hydrofabric_attributes(self.gpkg_file, self.version, self.domain,
+                                                               divide_layer=divide_layer)
+        if isinstance(self._divide_attr, dict):
+            return self._divide_attr
+        return self._divide_attr.copy(deep=False)
+
+
+def get_hydrofabric_attributes(gpkg_file,version,domain,divide_layer=None):
 
     attr_layer = 'divide-attributes'
     if version == '2.1':
@@ -68,8 +150,10 @@ def get_hydrofabric_attributes(gpkg_file,version,domain):
 
     # Get list of catchments from gpkg divides layer using geopandas
     try:
-        divide_attr = gpd.read_file(gpkg_file, layer = attr_layer)
-        divide_layer = gpd.read_file(gpkg_file, layer = 'divides')
+        divide_attr = read_attribute_layer(gpkg_file, attr_layer)
+        if divide_layer is None:
+            divide_layer = read_attribute_layer(gpkg_file, 'divides', DIVIDE_COLUMNS)
+        crs = read_layer_crs(gpkg_file, 'divides')
     except:# TODO: Replace 'except' with proper catch
         error_str = 'Error opening ' + gpkg_file
         error = dict(error = error_str)
@@ -107,14 +191,11 @@ def get_hydrofabric_attributes(gpkg_file,version,domain):
         
     #Convert centroid_x and centroid_y (lat/lon) from the domain's CRS to WGS84 for decimal degrees for 2.2.
     if version == '2.2':
-        crs = divide_layer.crs
-        transformer = Transformer.from_crs(crs, 4326)
-        for index, row in divide_attr.iterrows():
-            y = row['centroid_y']
-            x = row['centroid_x']
-            wgs84_latlon = transformer.transform(x,y)
-            divide_attr.loc[index, 'centroid_y'] = wgs84_latlon[0] #latitude
-            divide_attr.loc[index, 'centroid_x'] = wgs84_latlon[1] #longitude
+        transformer = get_wgs84_transformer(crs)
+        latitude, longitude = transformer.transform(divide_attr['centroid_x'].to_numpy(dtype='float64'),
+                                                    divide_attr['centroid_y'].to_numpy(dtype='float64'))
+        divide_attr['centroid_y'] = latitude
+        divide_attr['centroid_x'] = longitude
 
     #If a soil divide attribute less than the min value or greater than the max value, 
     #reset to min or max.
@@ -0,0 +1,222 @@
+"""
+Pure python hydrofabric subsetter.
+
+Alternative to the R hydrofabric get_subset used by R/subsetter.R.  Finds the origin flowpath of a gage
+from the hydrolocations layer (or the gages_xy.csv lat/lon), traces the network upstream and writes the same
+layers as the R code to a new geopackage.  Only hydrofabric v2.2 domain geopackages are supported, 2.1 data
+is still subset in R.  Upstream traces use the prebuilt upstream index of the domain (util/upstream_index.py),
+or an index built in memory once per process when none has been built.
+"""
+import os
+import logging
+import threading
+
+import pandas as pd
+import pyogrio
+from pyproj import Transformer
+from shapely.geometry import Point
+
+from .util.upstream_index import UpstreamIndex, as_poi_key, get_upstream_index_dir
+
+logger = logging.getLogger(__name__)
+
+# Layers written to the subset geopackage, same as R/subsetter.R
+LAYERS22 = ['flowpaths', 'divides', 'lakes', 'nexus', 'pois',
+            'hydrolocations', 'flowpath-attributes',
+            'flowpath-attributes-ml', 'network', 'divide-attributes']
+
+LAYERS22_OCONUS = ['flowpaths', 'divides', 'nexus', 'pois',
+                   'hydrolocations', 'flowpath-attributes', 'divide-attributes',
+                   'network']
+
+LAYERS22_GL = ['flowpaths', 'divides', 'nexus', 'pois',
+               'hydrolocations', 'flowpath-attributes',
+               'network', 'divide-attributes']
+
+# Column of each layer used to select the subset, and which set of subset ids it is matched against
+LAYER_FILTERS = {'flowpaths': ('id', 'flowpath_ids'),
+                 'divides': ('divide_id', 'divide_ids'),
+                 'lakes': ('poi_id', 'poi_ids'),
+                 'nexus': ('id', 'nexus_ids'),
+                 'pois': ('poi_id', 'poi_ids'),
+                 'hydrolocations': ('poi_id', 'poi_ids'),
+                 'flowpath-attributes': ('id', 'flowpath_ids'),
+                 'flowpath-attributes-ml': ('id', 'flowpath_ids'),
+                 'network': ('id', 'network_ids'),
+                 'divide-attributes': ('divide_id', 'divide_ids')}
+
+
+class SubsetError(Exception):
+    """
+    Raised when a gage can not be subset, the message is returned to the API caller
+    """
+
+
+_networks = {}
+_networks_lock = threading.Lock()
+
+
+def _load_upstream_index(gpkg_path, index_dir):
+    """
+    Memory maps the prebuilt index of the geopackage, or builds one in memory if none is current
+    """
+    if index_dir and os.path.exists(os.path.join(index_dir, 'meta.json')):
+        index = UpstreamIndex.load(index_dir)
+        if index.is_current(gpkg_path):
+            logger.debug(f"Using upstream index {index_dir}")
+            return index
+        logger.warning(f"Upstream index {index_dir} is older than {gpkg_path}, rebuild it with "
+                       f"manage.py build_upstream_index")
+    logger.debug(f"Loading hydrofabric network from {gpkg_path}")
+    return UpstreamIndex.from_geopackage(gpkg_path)
+
+
+def _get_domain_network(gpkg_path, index_dir=None):
+    """
+    Returns the cached upstream index for a domain geopackage, reloading it if the file changed
+    """
+    key = (gpkg_path, os.path.getmtime(gpkg_path), index_dir)
+    with _networks_lock:
+        network = _networks.get(gpkg_path)
+        if network is None or network[0] != key:
+            network = (key, _load_upstream_index(gpkg_path, index_dir))
+            _networks[gpkg_path] = network
+    return network[1]
+
+
+def _origin_from_poi(domain_network, poi_ids):
+    # The most downstream flowpath at the POI is the outlet of the subset
+    origin = domain_network.most_downstream(domain_network.nodes_for_pois(poi_ids))
+    if origin is None:
+        raise SubsetError('No origin found')
+    return origin
+
+
+def _origin_from_xy(domain_network, gpkg_path, lon, lat):
+    crs = pyogrio.read_info(gpkg_path, layer='divides')['crs']
+    x, y = Transformer.from_crs(4326, crs, always_xy=True).transform(lon, lat)
+    divides = pyogrio.read_dataframe(gpkg_path, layer='divides', columns=['divide_id'], bbox=(x, y, x, y))
+    divides = divides[divides.contains(Point(x, y))]
+    if divides.empty:
+        raise SubsetError('No origin found')
+    origin = domain_network.most_downstream(domain_network.nodes_for_divides(set(divides['divide_id'])))
+    if origin is None:
+        raise SubsetError('No origin found')
+    return origin
+
+
+def _find_gage_xy(gages_csv, gauge_id):
+    gages_xy = pd.read_csv(gages_csv, dtype={'gageid': str})
+    gage = gages_xy[gages_xy['gageid'] == gauge_id]
+    if gage.empty:
+        return None
+    return gage.iloc[0]['lon'], gage.iloc[0]['lat']
+
+
+def _quote_values(values):
+    return ','.join("'" + str(value).replace("'", "''") + "'" for value in sorted(values))
+
+
+def _write_layers(gpkg_path, outpathfile, layers, subset_ids):
+    if os.path.exists(outpathfile):
+        os.remove(outpathfile)
+
+    available = set(pyogrio.list_layers(gpkg_path)[:, 0])
+    for layer in layers:
+        if layer not in available:
+            logger.debug(f"Layer {layer} not found in {gpkg_path}")
+            continue
+        column, id_set = LAYER_FILTERS[layer]
+        ids = subset_ids[id_set]
+        if not ids:
+            continue
+        where = f'"{column}" IN ({_quote_values(ids)})'
+        if column == 'poi_id':
+            # poi_id is an integer column in some layers
+            where = f'CAST("{column}" AS TEXT) IN ({_quote_values(ids)})'
+        data = pyogrio.read_dataframe(gpkg_path, layer=layer, where=where)
+        if data.empty:
+            continue
+        pyogrio.write_dataframe(data, outpathfile, layer=layer, driver='GPKG')
+
+
+def subset(gauge_id, outpath, outfile, hydrofabric_data, hydrofabric_version, hydrofabric_type, domain,
+           hydrofabric_filename, source, poi_id=None, lon=None, lat=None, divide_id=None):
+    """
+    Subsets the hydrofabric upstream of a gage into a new geopackage.
+    Arguments are the same as hf_subset in R/subsetter.R.  poi_id, lon/lat and divide_id come from the
+    gage index, when given the hydrolocations layer and gages_xy.csv are not searched.
+
+    :return: The path of the subset geopackage
+    :raises SubsetError: If the gage or its origin can not be found
+    """
+    if hydrofabric_version != '2.2':
+        raise SubsetError(f'Hydrofabric version {hydrofabric_version} is not supported by the python subsetter')
+
+    version_dir = f'v{hydrofabric_version}'
+    gpkg_path = os.path.join(hydrofabric_data, version_dir, hydrofabric_type, domain, hydrofabric_filename)
+    gages_csv = os.path.join(hydrofabric_data, version_dir, hydrofabric_type, 'gages_xy.csv')
+    outpathfile = os.path.join(outpath, outfile)
+
+    #Difference in capitalization between CONUS and oCONUS for hl_reference value.
+    if domain == 'CONUS':
+        gages = 'gages'
+        layers = LAYERS22
+    else:
+        gages = 'Gages'
+        layers = LAYERS22_OCONUS
+    if source == 'ENVCA':
+        layers = LAYERS22_GL
+
+    index_dir = get_upstream_index_dir(hydrofabric_version, domain, hydrofabric_filename)
+    domain_network = _get_domain_network(gpkg_path, index_dir)
+
+    #All Alaska gages must use lat/lon because hydrolocations are incorrect
+    origin = None
+    if poi_id is not None and domain != 'Alaska':
+        origin = _origin_from_poi(domain_network, {poi_id})
+    elif divide_id is not None:
+        origin = domain_network.most_downstream(domain_network.nodes_for_divides({divide_id}))
+        if origin is None:
+            raise SubsetError('No origin found')
+    elif lon is not None and lat is not None:
+        origin = _origin_from_xy(domain_network, gpkg_path, lon, lat)
+    elif domain != 'Alaska':
+        gauge_quoted = gauge_id.replace("'", "''")
+        poi = pyogrio.read_dataframe(gpkg_path, layer='hydrolocations', columns=['poi_id'], read_geometry=False,
+                                     where=f"hl_reference = '{gages}' AND hl_link = '{gauge_quoted}'")
+        if not poi.empty:
+            origin = _origin_from_poi(domain_network, set(poi['poi_id'].map(as_poi_key)))
+    if origin is None:
+        xy = _find_gage_xy(gages_csv, gauge_id)
+        if xy is None:
+            raise SubsetError('Gage not found as hydrolocation or in gage lat/lon file')
+        origin = _origin_from_xy(domain_network, gpkg_path, *xy)
+
+    nodes = domain_network.upstream_of(origin)
+    network_ids = set(domain_network.ids[nodes])
+    subset_ids = {'network_ids': network_ids,
+                  'flowpath_ids': {i for i in network_ids if not i.startswith('nex-')},
+                  'nexus_ids': {i for i in network_ids if i.startswith('nex-')}
+                               | {i for i in domain_network.toid[nodes] if i.startswith('nex-')},
+                  'divide_ids': domain_network.divides_of(nodes),
+                  'poi_ids': domain_network.pois_of(nodes)}
+
+    _write_layers(gpkg_path, outpathfile, layers, subset_ids)
+    return outpathfile
+
+
+def hf_subset(**job_args):
+    """
+    Runs a python subset and reports the outcome like the R subsetter pool does
+    :param job_args: Arguments of subset()
+    :return: Result dictionary with a status of 'ok' (and the outfile) or 'error' (with error_class and message)
+    """
+    try:
+        outpathfile = subset(**job_args)
+    except SubsetError as subset_error:
+        return {'status': 'error', 'error_class': 'SubsetError', 'message': str(subset_error)}
+    except Exception as exception:
+        logger.exception("Python hydrofabric subset failed")
+        return {'status': 'error', 'error_class': type(exception).__name__, 'message': str(exception)}
+    return {'status': 'ok', 'outfile': outpathfile}
@@ -1,9 +1,10 @@
 import collections
+import functools
 from rest_framework.response import Response
 from rest_framework import status
 from django.db import connection
 from collections import OrderedDict
-from .DatabaseManager import DatabaseManager
+from .DatabaseManager import DatabaseManager, DEPENDENT_MODULES
 from .cfe import *
 from .noah_owp_modular import *
 from .t_route import *
@@ -17,145 +18,171 @@ from .lasam_ipe import *
 from .topoflow import TopoFlow
 from .pet_ipe import *
 from .lstm import *
+from .hf_attributes import HydrofabricAttributes
+from .util.output_sink import open_module_sink
+from .util.workspace import current_workspace
+from .util.coupling import coupling_key, MODULE_COUPLINGS
+from .util.module_scheduler import get_module_scheduler
+from .util.module_metadata import module_metadata_cache, calibrate_parameter, output_variable
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Modules run after the requested modules they are coupled with, all others are independent
+MODULE_DEPENDENCIES = {module: MODULE_COUPLINGS[module] for module in DEPENDENT_MODULES}
 
-def get_ipe(gage_id, version, source, domain, modules, gage_file_mgmt):
+
+def get_ipe(gage_id, version, source, domain, modules, gage_file_mgmt, found_modules=None):
     '''
     Build initial parameter estimates (IPE) for a module.  
 
     Parameters:
     gage_id (str):  The gage ID, e.g., 06710385
     modules (str): Module names
+    found_modules (dict): IPE json of the modules param_files_exists found, None to look each module up
 
     Returns:
     dict: JSON output with cfg file URI, calibratable parameters initial values, output variables.
     '''
 
-    # Build path for IPE temp directory
-    subset_dir = gage_file_mgmt.get_local_temp_directory(FileTypeEnum.PARAMS, gage_id)
-    gpkg_dir = gage_file_mgmt.get_local_temp_directory(FileTypeEnum.GEOPACKAGE, gage_id)
-    gpkg_file = gage_file_mgmt.get_geopackage_filename(gage_id)
-    gpkg_file = os.path.join(gpkg_dir, gpkg_file)
-    module_results = None
-
-    dependent_module_list = ["SFT","SMP"]
-    dep_modules_included = list(set(modules).intersection(set(dependent_module_list)))
-
-    module_output_list = []
+    # Temp directories and the geopackage are only needed for modules to calculate
+    subset_dir = gpkg_dir = hydrofabric = None
+    if found_modules is None or any(module not in found_modules for module in modules):
+        # Build path for IPE temp directory
+        subset_dir = gage_file_mgmt.get_local_temp_directory(FileTypeEnum.PARAMS, gage_id)
+        gpkg_dir = gage_file_mgmt.get_local_temp_directory(FileTypeEnum.GEOPACKAGE, gage_id)
+        gpkg_file = gage_file_mgmt.get_geopackage_filename(gage_id)
+        gpkg_file = os.path.join(gpkg_dir, gpkg_file)
+        # Attribute layers are read once and shared by all modules of the request
+        hydrofabric = HydrofabricAttributes(gpkg_file, version, domain)
+
+    dep_modules_included = list(set(modules).intersection(set(DEPENDENT_MODULES)))
+
+    def build_module(module):
+        # Modules run concurrently and share gage_file_mgmt, which holds no per-call state
+        coupling = coupling_key(module, modules)
+        if module in DEPENDENT_MODULES:
+            module_results, write_result = calculate_dependent_module_params(gage_id, version, source, domain, module,
+                                                                             modules, subset_dir, hydrofabric,
+                                                                             gage_file_mgmt, coupling)
+        else:
+            module_results, write_result = calculate_module_params(gage_id, version, source, domain, module, subset_dir, hydrofabric, gage_file_mgmt, dep_modules_included, coupling)
+
+        if 'error' not in module_results:
+            # TODO: Remove PET module stipulation when the module is implemented
+            if module != "PET":
+                # add ipe_json to the HFFILES row of the files written by the module
+                hffiles_id = write_result.hffiles_id if write_result is not None else None
+                if not gage_file_mgmt.save_ipe_json(hffiles_id, json.dumps(module_results)):
+                    logger.error(f"{module} IPE files were not recorded, uri - {module_results['parameter_file']['uri']}")
+        else:
+            error_str = module_results['error']
+            logger.error(error_str)
+        # Stop the modules not started yet if the files outgrew the request's workspace
+        workspace = current_workspace()
+        if workspace is not None:
+            workspace.check_quota()
+        return module_results
+
+    found_results = {}
+    tasks = OrderedDict()
     for module in modules:
-        found, ipe_json = gage_file_mgmt.ipe_files_exists(gage_id, version, domain, source, module)
-        if module == 'SMP':
-            found = False
-        if not found:
-            if module in dependent_module_list:
-                module_results = calculate_dependent_module_params(gage_id, version, source, domain, module, modules,
-                                                                   subset_dir, gpkg_file, gage_file_mgmt)
-            else:
-                module_results = calculate_module_params(gage_id, version, source, domain, module, subset_dir, gpkg_file, gage_file_mgmt, dep_modules_included)
-
-            if 'error' not in module_results:
-                # TODO: Remove PET module stipulation when the module is implemented
-                if module != "PET":
-                    # add ipe_json to Database
-                    hffiles_row = gage_file_mgmt.get_db_object()
-                    hffiles_row.ipe_json = json.dumps(module_results)
-                    hffiles_row.save()
-            else:
-                error_str = module_results['error']
-                logger.error(error_str)
+        if found_modules is not None:
+            found, ipe_json = module in found_modules, found_modules.get(module)
         else:
+            found, ipe_json = gage_file_mgmt.ipe_files_exists(gage_id, version, domain, source, module,
+                                                              coupling_key(module, modules))
+        if found:
             # Found IPE data file, clean and add to response list
             decoder = json.JSONDecoder(object_pairs_hook=collections.OrderedDict)
-            module_results = decoder.decode(ipe_json)
-
-        module_output_list.append(module_results)
+            found_results[module] = decoder.decode(ipe_json)
+        else:
+            tasks[module] = functools.partial(build_module, module)
 
+    module_results = {}
+    try:
+        if tasks:
+            module_results = get_module_scheduler().run(tasks, MODULE_DEPENDENCIES)
+    finally:
+        if subset_dir is not None:
+            gage_file_mgmt.delete_local_temp_directory(subset_dir)
+            gage_file_mgmt.delete_local_temp_directory(gpkg_dir)
+
+    module_output_list = [found_results[module] if module in found_results else module_results[module]
+                          for module in modules]
     module_output_list = {"modules": module_output_list}
-
-    gage_file_mgmt.delete_local_temp_directory(subset_dir)
-    gage_file_mgmt.delete_local_temp_directory(gpkg_dir)    
     return Response(module_output_list, status=status.HTTP_200_OK)
 
 
-def calculate_dependent_module_params(gage_id, version, source, domain, module, modules, subset_dir, gpkg_file, gage_file_mgmt):
-    subset_dir = os.path.join(subset_dir, module)
-    if not os.path.exists(subset_dir):
-        os.mkdir(subset_dir)
-    #Add the trailing /
-    subset_dir += "/"
-    module_metadata = get_module_metadata(module)
-    logger.debug(module_metadata)
-    logger.info(f"Get IPEs for {module} module")
-
-    if module == "SFT":
-        results = sft_ipe(module, gage_id, version, source, domain, subset_dir,
-                          gpkg_file, modules, module_metadata, gage_file_mgmt)
-    elif module == "SMP":
-        results = smp_ipe(module, gage_id, version, source, domain, subset_dir,
-                          gpkg_file, modules, module_metadata, gage_file_mgmt)
+def calculate_dependent_module_params(gage_id, version, source, domain, module, modules, subset_dir, hydrofabric, gage_file_mgmt, coupling=''):
+    # Config files go to the module's output sink and from there to S3
+    with open_module_sink(subset_dir, module) as sink:
+        module_metadata = get_module_metadata(module)
+        logger.debug(module_metadata)
+        logger.info(f"Get IPEs for {module} module")
 
-    else:
-        results = module_json(module, [], [], error=f"module '{module}' does not exist")
+        if module == "SFT":
+            results = sft_ipe(module, gage_id, version, source, domain, sink,
+                              hydrofabric, modules, module_metadata, gage_file_mgmt, coupling)
+        elif module == "SMP":
+            results = smp_ipe(module, gage_id, version, source, domain, sink,
+                              hydrofabric, modules, module_metadata, gage_file_mgmt, coupling)
 
-    return results
+        else:
+            results = module_json(module, [], [], error=f"module '{module}' does not exist")
+    return results, sink.write_result
 
 
-def calculate_module_params(gage_id, version, source, domain, module, subset_dir, gpkg_file, gage_file_mgmt, dep_modules_included):
-    subset_dir = os.path.join(subset_dir, module)
-    if not os.path.exists(subset_dir):
-        os.mkdir(subset_dir)
-    #Add the trailing /
-    subset_dir += "/"
-    # TODO: Remove this exception for PET once it's no longer returning empty an IPE list as a placeholder
-    if module == "PET":
-        module_metadata = OrderedDict()
-    else:
-        module_metadata = get_module_metadata(module)
-    logger.debug(module_metadata)
-    logger.info(f"Get IPEs for {module} module")
-
-    """
-    TODO Create a Base class for all modules below
-    TODO Replace with SWITCH or dict of module and function call
-    TODO Validate module name to a Enum to prevent string/case corruption
-
-    TODO: TopoFlow is not ready for implementation/integration at the is time. However the TopoFlow class is created as 
-          as a Stub and will output a "fake" JSON Response document with the information on parameters and the output 
-          variables the HF team has at this time. This work to date also includes the creation/update of database tables 
-          necessary for Stub to produce the BMI Files and the JSON Response list document.
-          Once the module is ready for implementation/integration, and the coding necessary to complete the actually 
-          BMI files and JSON Response List Document, just put the code snippet below back into else-if chain below      
-    elif module == "TopoFlow":
-        topoflow = TopoFlow()
-        results = topoflow.initial_parameters(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    """
-    if module == "CFE-S" or module == "CFE-X":
-        results = cfe_ipe(module, version, gage_id, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt, dep_modules_included)
-    elif module == "Noah-OWP-Modular":
-        results = noah_owp_modular_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == "T-Route":
-        results = t_route_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == "Snow-17":
-        results = snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == "Sac-SMA":
-        results = sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == "TopModel":
-        results = topmodel_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == 'UEB':
-        ueb = UEB()
-        results = ueb.initial_parameters(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == "LASAM":
-        results = lasam_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt, dep_modules_included)
-    elif module == "PET":
-        results = pet_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    elif module == "LSTM":
-        results = lstm_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt)
-    else:
-         results = module_json(module, [], [], error=f"module '{module}' does not exist")
-    return results
+def calculate_module_params(gage_id, version, source, domain, module, subset_dir, hydrofabric, gage_file_mgmt, dep_modules_included, coupling=''):
+    # Config files go to the module's output sink and from there to S3
+    with open_module_sink(subset_dir, module) as sink:
+        # TODO: Remove this exception for PET once it's no longer returning empty an IPE list as a placeholder
+        if module == "PET":
+            module_metadata = OrderedDict()
+        else:
+            module_metadata = get_module_metadata(module)
+        logger.debug(module_metadata)
+        logger.info(f"Get IPEs for {module} module")
+
+        """
+        TODO Create a Base class for all modules below
+        TODO Replace with SWITCH or dict of module and function call
+        TODO Validate module name to a Enum to prevent string/case corruption
+
+        TODO: TopoFlow is not ready for implementation/integration at the is time. However the TopoFlow class is created as 
+              as a Stub and will output a "fake" JSON Response document with the information on parameters and the output 
+              variables the HF team has at this time. This work to date also includes the creation/update of database tables 
+              necessary for Stub to produce the BMI Files and the JSON Response list document.
+              Once the module is ready for implementation/integration, and the coding necessary to complete the actually 
+              BMI files and JSON Response List Document, just put the code snippet below back into else-if chain below      
+        elif module == "TopoFlow":
+            topoflow = TopoFlow()
+            results = topoflow.initial_parameters(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        """
+        if module == "CFE-S" or module == "CFE-X":
+            results = cfe_ipe(module, version, gage_id, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt, dep_modules_included, coupling)
+        elif module == "Noah-OWP-Modular":
+            results = noah_owp_modular_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == "T-Route":
+            results = t_route_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == "Snow-17":
+            results = snow17_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == "Sac-SMA":
+            results = sac_sma_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == "TopModel":
+            results = topmodel_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == 'UEB':
+            ueb = UEB()
+            results = ueb.initial_parameters(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == "LASAM":
+            results = lasam_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt, dep_modules_included, coupling)
+        elif module == "PET":
+            results = pet_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        elif module == "LSTM":
+            results = lstm_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt)
+        else:
+             results = module_json(module, [], [], error=f"module '{module}' does not exist")
+    return results, sink.write_result
 
 def get_initial_parameters(model_type):
     if not isinstance(model_type, str) or len(model_type) > 20:
@@ -188,11 +215,16 @@ def get_initial_parameters(model_type):
 
 def get_module_metadata(module_name):
 
-    # Get initial parameter data
-    calibrate_data_response = module_calibrate_data(module_name)
+    # Metadata comes from the process-level cache, each request gets its own copy
+    cached = module_metadata_cache.get(module_name)
+    if cached is not None:
+        calibrate_data_response, out_variables_data_response = cached
+    else:
+        # Get initial parameter data
+        calibrate_data_response = module_calibrate_data(module_name)
 
-    # Get the output variables data
-    out_variables_data_response = module_out_variables_data(module_name)
+        # Get the output variables data
+        out_variables_data_response = module_out_variables_data(module_name)
 
     # Write JSON for module
     module_output = module_json(module_name, calibrate_data_response, out_variables_data_response)
@@ -220,18 +252,7 @@ def module_calibrate_data(model_type):
 
             if column_names and rows:
 
-                module_data = []
-                for row in rows:
-                    param_data = {
-                        "name": row[column_names.index("name")],
-                        "initial_value": row[column_names.index("default_value")],
-                        "description": row[column_names.index("description")],
-                        "min": row[column_names.index("min")],
-                        "max": row[column_names.index("max")],
-                        "data_type": row[column_names.index("data_type")],
-                        "units": row[column_names.index("units")]
-                    }
-                    module_data.append(param_data)
+                module_data = [calibrate_parameter(row, column_names) for row in rows]
                 return  module_data
             else:
                 module_data = []
@@ -251,12 +272,7 @@ def module_out_variables_data(model_type):
 
             module_data = []
             if column_names and rows:
-                for row in rows:
-                    output_var_data = {
-                        "variable": row[column_names.index("name")],
-                        "description": row[column_names.index("description")]
-                    }
-                    module_data.append(output_var_data)
+                module_data = [output_variable(row, column_names) for row in rows]
 
             return module_data
     except Exception as e:
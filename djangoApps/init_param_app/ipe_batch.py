@@ -0,0 +1,103 @@
+"""
+IPE requests for many gages at once.
+
+The requests of a batch are grouped by gage.  Identical requests are computed once, and the requests of a gage run
+one after another on the same worker so the geopackage is subset once (later requests find it in S3) and the
+parameter files of modules already built are reused.  Gages run concurrently on a pool of threads, each result is
+yielded as soon as its request finishes.
+"""
+import logging
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from rest_framework import status
+
+from .ipe_jobs import ipe_request_error, compute_ipe
+from .util.utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+REQUEST_FIELDS = ('gage_id', 'version', 'source', 'domain', 'modules')
+
+
+def plan_batch(requests):
+    """
+    Validates the shape of the batch requests and groups them for execution
+    :param requests: List of IPE request dictionaries
+    :return: List of (index, error) of malformed requests and the groups, an OrderedDict of gage_id to an
+             OrderedDict of (gage_id, version, source, domain, modules) to the indexes of the requests
+    """
+    errors = []
+    groups = OrderedDict()
+    for index, ipe_request in enumerate(requests):
+        if not isinstance(ipe_request, dict):
+            errors.append((index, {'error': 'IPE request must be an object'}))
+            continue
+        missing = [field for field in REQUEST_FIELDS if not ipe_request.get(field)]
+        if missing:
+            errors.append((index, {'error': f"IPE request missing {', '.join(missing)}"}))
+            continue
+        modules = ipe_request['modules']
+        if not isinstance(modules, list):
+            errors.append((index, {'error': 'IPE request modules must be a list'}))
+            continue
+        # Temp directories are per gage_id, so all requests of a gage run on the same worker
+        key = (str(ipe_request['gage_id']), ipe_request['version'], ipe_request['source'], ipe_request['domain'],
+               tuple(OrderedDict.fromkeys(modules)))
+        groups.setdefault(key[0], OrderedDict()).setdefault(key, []).append(index)
+    return errors, groups
+
+
+def _run_gage(tasks, results):
+    try:
+        for key, indexes in tasks.items():
+            gage_id, version, source, domain, modules = key
+            try:
+                request_error = ipe_request_error(gage_id, version, source, domain)
+                if request_error:
+                    outcome = (status.HTTP_422_UNPROCESSABLE_ENTITY, request_error)
+                else:
+                    response = compute_ipe(gage_id, version, source, domain, list(modules))
+                    outcome = (response.status_code, response.data)
+            except Exception as exception:
+                logger.error(f"Batch IPE request for gage_id - {gage_id} raised - {exception}")
+                outcome = (status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': str(exception)})
+            results.put((indexes, outcome))
+    finally:
+        # Worker threads hold their own connection, give it back before the thread is reused
+        connection.close()
+
+
+def run_ipe_batch(requests, workers=None):
+    """
+    Runs a batch of IPE requests
+    :param requests: List of IPE request dictionaries, as posted to return_ipe
+    :param workers: Number of gages computed at the same time, config ipe_batch_workers by default
+    :return: Generator of (index, http status, response data), in the order the requests finish
+    """
+    if workers is None:
+        workers = int(get_config().get('ipe_batch_workers', 4))
+    errors, groups = plan_batch(requests)
+    for index, error in errors:
+        logger.error(f"Batch IPE request {index}: {error['error']}")
+        yield index, status.HTTP_422_UNPROCESSABLE_ENTITY, error
+    if not groups:
+        return
+
+    pending = sum(len(tasks) for tasks in groups.values())
+    logger.info(f"Batch of {len(requests)} IPE requests: {pending} distinct requests for {len(groups)} gages")
+    results = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups))), thread_name_prefix='ipe-batch')
+    try:
+        for tasks in groups.values():
+            executor.submit(_run_gage, tasks, results)
+        while pending:
+            indexes, (http_status, data) = results.get()
+            pending -= 1
+            for index in indexes:
+                yield index, http_status, data
+    finally:
+        # A client that disconnects closes the generator, requests not started yet are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
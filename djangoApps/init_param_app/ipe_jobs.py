@@ -0,0 +1,241 @@
+"""
+Asynchronous IPE requests.
+
+Building the parameter files of a large basin (subsetting, module writers and S3 uploads) takes longer than a
+gateway waits for a response.  A job records the request in the ipe_jobs table and returns at once, a pool of
+threads runs the jobs and stores the response return_ipe would have given, which clients then poll for.
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .geopackage import ensure_geopackage, find_gage
+from .initial_parameters import get_ipe
+from .models import IpeJob
+from .util.enums import FileTypeEnum, StatusEnum
+from .util.gage_file_management import GageFileManagement
+from .util.single_flight import SingleFlight
+from .util.workspace import scratch_workspace, WorkspaceQuotaExceeded, process_alive
+from .util.utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+# Jobs not finished yet
+PENDING_STATUSES = (StatusEnum.SAVED, StatusEnum.READY, StatusEnum.RUNNING)
+# Jobs queued in or run by a job pool
+QUEUED_STATUSES = (StatusEnum.READY, StatusEnum.RUNNING)
+
+# Concurrent identical IPE requests share one computation
+ipe_flights = SingleFlight('ipe')
+
+
+def ipe_request_error(gage_id, version, source, domain):
+    """
+    Validates the hydrofabric version, domain and gage of an IPE request
+    :return: Error dictionary, None if the request is valid
+    """
+    if version != '2.1' and version != '2.2':
+        error_str = 'Hydrofabric version must be 2.2 or 2.1'
+        logger.error(error_str)
+        return {'error': error_str}
+    elif version == '2.1' and domain != 'CONUS':
+        error_str = 'oCONUS domains not availiable in Hydrofabric version 2.1'
+        logger.error(error_str)
+        return {'error': error_str}
+
+    _, gage_error = find_gage(gage_id, version, source, domain)
+    return gage_error
+
+
+def compute_ipe(gage_id, version, source, domain, modules):
+    """
+    Builds the initial parameter estimates of a validated request, creating the geopackage first when a module
+    needs it.  Concurrent identical requests share one computation.
+    :return: Response with the module list, or the error
+    """
+    (data, http_status), _ = ipe_flights.do((gage_id, version, domain, source, FileTypeEnum.PARAMS) + tuple(modules),
+                                            _compute_ipe, gage_id, version, source, domain, modules)
+    # Followers get their own response of the shared data
+    return Response(data, status=http_status)
+
+
+def _compute_ipe(gage_id, version, source, domain, modules):
+    gage_file_mgmt = GageFileManagement()
+
+    # Modules with valid param files are read from HFFILES, one query for all of them
+    modules_to_calculate, found_modules = gage_file_mgmt.param_files_exists(gage_id, version, domain, source, FileTypeEnum.PARAMS, modules)
+    if len(modules_to_calculate) == 0:
+        # Nothing to calculate, no geopackage or local files needed
+        response = get_ipe(gage_id, version, source, domain, modules, gage_file_mgmt, found_modules)
+        return response.data, response.status_code
+
+    # All local files of the request go to a workspace of its own, deleted when done
+    try:
+        with scratch_workspace(f"ipe-{gage_id}"):
+            return _compute_ipe_files(gage_file_mgmt, gage_id, version, source, domain, modules, found_modules)
+    except WorkspaceQuotaExceeded as exception:
+        logger.error(str(exception))
+        return {'error': str(exception)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+def _compute_ipe_files(gage_file_mgmt, gage_id, version, source, domain, modules, found_modules):
+    # Geopackage file needed, built from scratch unless it already exists
+    created, results = ensure_geopackage(gage_id, version, source, domain, keep_file=True)
+    if 'error' in results:
+        return results, status.HTTP_422_UNPROCESSABLE_ENTITY
+    if not created:
+        # Get the Geopackage file from S3 and put into local directory
+        gage_file_mgmt.get_file_from_s3(gage_id, version, domain, source, FileTypeEnum.GEOPACKAGE)
+
+    response = get_ipe(gage_id, version, source, domain, modules, gage_file_mgmt, found_modules)
+    return response.data, response.status_code
+
+
+def run_ipe_job(job_id):
+    """
+    Runs a job and stores its response.  A response with an error fails the job, an exception is a server error.
+    :param job_id: Primary key of the IpeJob
+    :return: The finished IpeJob
+    """
+    job = IpeJob.objects.get(pk=job_id)
+    job.status = StatusEnum.RUNNING
+    job.started_time = timezone.now()
+    job.save(update_fields=['status', 'started_time'])
+    logger.info(f"IPE job {job_id} started for gage_id - {job.gage_id}, modules - {job.modules}")
+
+    try:
+        response = compute_ipe(job.gage_id, job.hydrofabric_version, job.source, job.domain, job.modules)
+        job.result = response.data
+        job.http_status = response.status_code
+        if response.status_code == status.HTTP_200_OK:
+            job.status = StatusEnum.DONE
+        else:
+            job.status = StatusEnum.FAILED
+            job.error = response.data.get('error') if isinstance(response.data, dict) else None
+    except Exception as exception:
+        logger.error(f"IPE job {job_id} raised - {exception}")
+        job.status = StatusEnum.SERVER_ERROR
+        job.http_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+        job.error = str(exception)
+
+    job.finished_time = timezone.now()
+    job.save()
+    logger.info(f"IPE job {job_id} finished with status {job.status}")
+    return job
+
+
+def _run_in_worker(job_id):
+    try:
+        run_ipe_job(job_id)
+    except Exception as exception:
+        logger.error(f"IPE job {job_id} could not be run - {exception}")
+    finally:
+        # Worker threads hold their own connection, give it back before the thread is reused
+        connection.close()
+
+
+class IpeJobPool:
+    """
+    Bounded pool of threads running IPE jobs in the order they were submitted.  Each job records the pool it is
+    queued in as its owner, so the jobs of a process that exited before finishing them are found by recover().
+    """
+
+    def __init__(self, workers=2, max_age=21600):
+        """
+        :param workers: Number of jobs run at the same time
+        :param max_age: Seconds after which a job still queued by a pool of another host is failed
+        """
+        self.workers = max(1, workers)
+        self.max_age = max_age
+        # The pid alone is not unique, a restarted container reuses it
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ipe-job')
+
+    def submit(self, gage_id, version, source, domain, modules):
+        """
+        Records a validated IPE request and queues it
+        :return: The IpeJob, status READY
+        """
+        job = IpeJob.objects.create(gage_id=gage_id, hydrofabric_version=version, source=source, domain=domain,
+                                    modules=modules, status=StatusEnum.READY, owner=self.owner)
+        self._executor.submit(_run_in_worker, job.id)
+        logger.debug(f"IPE job {job.id} queued")
+        return job
+
+    def _owner_gone(self, owner):
+        """
+        :return: True if the pool of owner was on this host and is gone, None when it is on another host
+        """
+        if not owner:
+            # Queued before the jobs recorded their owner
+            return True
+        host, pid, _ = owner.rsplit(':', 2)
+        if host != socket.gethostname():
+            return None
+        if int(pid) == os.getpid():
+            return owner != self.owner
+        return not process_alive(int(pid))
+
+    def recover(self):
+        """
+        Queues again the jobs left queued or running by a pool of this host whose process exited, and fails the jobs
+        of other hosts queued for longer than max_age.  Without it their result would stay pending forever.
+        :return: Ids of the jobs queued again
+        """
+        requeued = []
+        expired = timezone.now() - timedelta(seconds=self.max_age)
+        for job in IpeJob.objects.filter(status__in=QUEUED_STATUSES).exclude(owner=self.owner).order_by('created_time'):
+            gone = self._owner_gone(job.owner)
+            jobs = IpeJob.objects.filter(pk=job.pk, owner=job.owner, status__in=QUEUED_STATUSES)
+            if gone:
+                # Another pool of this host may be recovering the same job, the first to update it takes it
+                if jobs.update(owner=self.owner, status=StatusEnum.READY, started_time=None):
+                    self._executor.submit(_run_in_worker, job.id)
+                    requeued.append(job.id)
+            elif gone is None and job.created_time < expired:
+                error = f"IPE job not finished by {job.owner} within {self.max_age} seconds"
+                if jobs.update(status=StatusEnum.SERVER_ERROR, http_status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                               error=error, finished_time=timezone.now()):
+                    logger.error(f"IPE job {job.id} failed - {error}")
+        if requeued:
+            logger.info(f"{len(requeued)} IPE jobs of exited processes queued again")
+        return requeued
+
+    def shutdown(self):
+        """
+        Stops the pool, the jobs still queued keep their status and are queued again by the next pool of this host
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ipe_job_pool():
+    """
+    Returns the process wide IPE job pool, creating it from config.yml on first use.  The new pool recovers the jobs
+    left pending by exited processes.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = get_config()
+            _pool = IpeJobPool(workers=int(config.get('ipe_job_workers', 2)),
+                               max_age=float(config.get('ipe_job_max_age', 21600)))
+            atexit.register(_pool.shutdown)
+            try:
+                _pool.recover()
+            except Exception as exception:
+                logger.error(f"IPE jobs not recovered - {exception}")
+        return _pool
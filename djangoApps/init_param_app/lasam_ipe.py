@@ -6,25 +6,26 @@ import pyarrow.parquet as pq
 import pyarrow as pa
 from .util.utilities import get_hydrofabric_input_attr_file, get_subset_dir_file_names, get_hydrus_data
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate, escape_template_text
 from .hf_attributes import *
 
 logger = logging.getLogger(__name__)
 
-def lasam_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt, dep_modules_included):
+def lasam_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt, dep_modules_included, coupling=''):
     ''' 
     Build initial parameter estimates (IPE) for the LASAM module
 
     Parameters:
     gage_id (str):  The gage ID, e.g., 06710385
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
+    sink (OutputSink):  Output sink the module's config files are written to
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
+    coupling (str):  Coupling key of the module in the request, see util.coupling
     
     Returns:
     dict: JSON output with cfg file URI, calibratable parameters initial values, output variables.
     '''
 
     module = "LASAM"
-    filename_list = []
     
     # Calibratable parameters
     # TODO - Use the system to get the "base" directory for uri below
@@ -35,7 +36,7 @@ def lasam_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_me
 
     # Skeleton for the config file. Needs layer soil types to be specified per-catchment
     lasam_lst = ['verbosity=none',
-                 'soil_params_file=' + soil_param_file.split("/")[-1],
+                 'soil_params_file=' + escape_template_text(soil_param_file.split("/")[-1]),
                  'layer_thickness=200.0[cm]',
                  'initial_psi=2000.0[cm]',
                  'timestep=300[sec]',
@@ -54,12 +55,8 @@ def lasam_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_me
                  'soil_z=' + soil_z
                 ]
     
-    # Make directory
-    if not os.path.isdir(subset_dir):
-        os.makedirs(subset_dir)
-    
     # Get divide attributes
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
     attr21 = {'soil_type':'ISLTYP'}
     attr22 = {'soil_type':'mode.ISLTYP'}
 
@@ -68,20 +65,15 @@ def lasam_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_me
     elif version == '2.2':
         attr=attr22
     
-    # Loop through catchments, get soil type
-    for index, row in divide_attr.iterrows():
-        catchment_id = str(row['divide_id'])
-        soil_type = str(row[attr['soil_type']])
-        lasam_lst_catID = lasam_lst.copy()
-        lasam_lst_catID[9] = lasam_lst_catID[9] + soil_type
-        
-        lasam_bmi_file = os.path.join(subset_dir, catchment_id + '_bmi_config_lasam.txt')
-        with open(lasam_bmi_file, "w") as f:
-            f.writelines('\n'.join(lasam_lst_catID))
-        filename_list.append(lasam_bmi_file.split('/')[-1])
+    # Render the config of all catchments with their soil type
+    lasam_lst[9] = lasam_lst[9] + '{soil_type}'
+    lasam_configs = ConfigTemplate('\n'.join(lasam_lst)).render(soil_type=divide_attr[attr['soil_type']])
+    lasam_filenames = [f'{catchment_id}_bmi_config_lasam.txt' for catchment_id in divide_attr['divide_id'].tolist()]
+    filename_list = sink.write_files(lasam_filenames, lasam_configs)
 
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list, module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list, module=module,
+                                          coupling=coupling).uri
     status_str = "Config files written to:  " + uri
     logger.info(status_str)
 
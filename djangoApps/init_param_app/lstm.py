@@ -3,17 +3,31 @@ import logging
 
 from .util.utilities import get_hydrofabric_input_attr_file, get_subset_dir_file_names
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate
 from .hf_attributes import *
 
 logger = logging.getLogger(__name__)
 
-def lstm_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+NAMELIST_TEMPLATE = ConfigTemplate('\n'.join(['area_sqkm: {area}',
+                                              'basin_id: {gage_id}',
+                                              'basin_name:',
+                                              'elev_mean: {elev}',
+                                              'initial_state: zero',
+                                              'lat: {lat}',
+                                              'lon: {lon}',
+                                              'slope_mean: {slope}',
+                                              'timestep: 1 hour',
+                                              'train_cfg_file:',
+                                              'verbose: 0'
+                                              ]) + '\n')
+
+def lstm_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     ''' 
     Build initial parameter estimates (IPE) for LSTM 
 
     Parameters:
     gage_id (str):  The gage ID, e.g., 06710385
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
+    sink (OutputSink):  Output sink the module's config files are written to
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     
     Returns:
@@ -21,9 +35,8 @@ def lstm_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_met
     '''
 
     module = 'LSTM'
-    filename_list = []
 
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
 
     attr22 = {'divide_id':'divide_id', 'slope':'mean.slope', 'elevation_mean':'mean.elevation', 
               'lat':'centroid_y', 'lon':'centroid_x', 'area':'areasqkm'}
@@ -37,39 +50,19 @@ def lstm_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_met
         attr = attr21
 
 
-    #Loop through catchments, get soil type, populate config file template, write config file to temp 
-    for index, row in divide_attr.iterrows():
-
-        catchment_id = row[attr['divide_id']]
-        area = str(row[attr['area']])
-        slope = str(row[attr['slope']])
-        elev = str(row[attr['elevation_mean']])
-        lat = str(row[attr['lat']])
-        lon = str(row[attr['lon']])
-
-        namelist = ['area_sqkm: ' + area,
-                    'basin_id: ' + gage_id,
-                    'basin_name:',
-                    'elev_mean: ' + elev,
-                    'initial_state: zero',
-                    'lat: ' + lat,
-                    'lon: ' + lon,
-                    'slope_mean: ' + slope,
-                    'timestep: 1 hour',
-                    'train_cfg_file:',
-                    'verbose: 0'
-                    ]
-
-        cfg_filename = f'{catchment_id}.yml'
-        filename_list.append(cfg_filename)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.writelines('\n'.join(namelist))
-                            outfile.write("\n")
+    #Render the config of all catchments from the attribute columns and write a config file for each
+    namelists = NAMELIST_TEMPLATE.render(area=divide_attr[attr['area']],
+                                         gage_id=gage_id,
+                                         elev=divide_attr[attr['elevation_mean']],
+                                         lat=divide_attr[attr['lat']],
+                                         lon=divide_attr[attr['lon']],
+                                         slope=divide_attr[attr['slope']])
+    cfg_filenames = [f'{catchment_id}.yml' for catchment_id in divide_attr[attr['divide_id']].tolist()]
+    filename_list = sink.write_files(cfg_filenames, namelists)
 
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list,
-                                          module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list,
+                                          module=module).uri
     status_str = 'Config files written to: ' + uri
     logger.info(status_str)
 
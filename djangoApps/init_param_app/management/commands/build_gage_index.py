@@ -0,0 +1,42 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...util.gage_index import build_gage_index, get_gage_index_file
+from ...util.utilities import get_config, get_hydrofabric_filename, HYDROFABRIC_DOMAIN_SOURCES
+
+
+class Command(BaseCommand):
+    help = "Builds the gage index of all hydrofabric domains, used to find subset origins and reject unknown gages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--version', dest='hydrofabric_version', default='2.2',
+                            help="Hydrofabric version, default 2.2")
+
+    def handle(self, *args, **options):
+        config = get_config()
+        index_file = get_gage_index_file()
+        if index_file is None:
+            raise CommandError("gage_index_file is not set in config.yml")
+
+        hydrofabric_version = options['hydrofabric_version']
+        grandparent_dir = os.path.dirname(settings.BASE_DIR)
+        type_dir = os.path.join(grandparent_dir, config['hydrofabric_dir'], f'v{hydrofabric_version}',
+                                config['hydrofabric_type'])
+
+        gpkg_paths = []
+        for domain, source in HYDROFABRIC_DOMAIN_SOURCES:
+            gpkg_path = os.path.join(type_dir, domain, get_hydrofabric_filename(config, domain, source))
+            if not os.path.exists(gpkg_path):
+                self.stderr.write(f"Skipping {domain} ({source}), {gpkg_path} does not exist")
+                continue
+            gpkg_paths.append((domain, source, gpkg_path))
+        if not gpkg_paths:
+            raise CommandError(f"No domain geopackages found in {type_dir}")
+
+        table = build_gage_index(gpkg_paths, os.path.join(type_dir, 'gages_xy.csv'), hydrofabric_version,
+                                 index_file)
+        for (domain, source), gages in table.groupby(['domain', 'source']).size().items():
+            self.stdout.write(f"{domain} ({source}): {gages} gages")
+        self.stdout.write(f"Gage index written to {index_file}")
@@ -0,0 +1,40 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...util.upstream_index import build_upstream_index, get_upstream_index_dir
+from ...util.utilities import get_config, get_hydrofabric_filename, HYDROFABRIC_DOMAIN_SOURCES
+
+
+class Command(BaseCommand):
+    help = "Builds the upstream network index of each hydrofabric domain geopackage used by the python subsetter"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--version', dest='hydrofabric_version', default='2.2',
+                            help="Hydrofabric version, default 2.2")
+        parser.add_argument('--domain', action='append', dest='domains',
+                            help="Only build the index of this domain, can be repeated")
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if not config.get('upstream_index_dir'):
+            raise CommandError("upstream_index_dir is not set in config.yml")
+
+        hydrofabric_version = options['hydrofabric_version']
+        grandparent_dir = os.path.dirname(settings.BASE_DIR)
+        domain_dir = os.path.join(grandparent_dir, config['hydrofabric_dir'], f'v{hydrofabric_version}',
+                                  config['hydrofabric_type'])
+
+        for domain, source in HYDROFABRIC_DOMAIN_SOURCES:
+            if options['domains'] and domain not in options['domains']:
+                continue
+            hydrofabric_filename = get_hydrofabric_filename(config, domain, source)
+            gpkg_path = os.path.join(domain_dir, domain, hydrofabric_filename)
+            if not os.path.exists(gpkg_path):
+                self.stderr.write(f"Skipping {domain} ({source}), {gpkg_path} does not exist")
+                continue
+            index_dir = get_upstream_index_dir(hydrofabric_version, domain, hydrofabric_filename)
+            index = build_upstream_index(gpkg_path, index_dir)
+            self.stdout.write(f"{domain} ({source}): {index.meta['nodes']} nodes, {index.meta['edges']} edges "
+                              f"-> {index_dir}")
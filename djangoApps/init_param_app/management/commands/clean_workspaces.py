@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...util.workspace import clean_orphaned_workspaces
+
+
+class Command(BaseCommand):
+    help = "Removes the request workspaces left behind by processes that exited without cleaning up"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=None,
+                            help="Seconds after which any workspace is removed, config workspace_max_age by default")
+
+    def handle(self, *args, **options):
+        removed = clean_orphaned_workspaces(max_age=options['max_age'])
+        for path in removed:
+            self.stdout.write(path)
+        self.stdout.write(f"{len(removed)} orphaned workspaces removed")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...util.divide_params import convert_divide_csv, find_divide_param_csvs, DEFAULT_ROW_GROUP_SIZE
+from ...util.utilities import get_config
+
+
+class Command(BaseCommand):
+    help = ("Converts the per-divide parameter CSV files of the module writers to Parquet files sorted by divide_id, "
+            "read instead of the CSV files by the IPE requests")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_files', nargs='*',
+                            help="CSV files to convert, all parameter CSV files of config input_dir by default")
+        parser.add_argument('--row-group-size', type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                            help=f"Divides per row group, default {DEFAULT_ROW_GROUP_SIZE}")
+
+    def handle(self, *args, **options):
+        csv_files = options['csv_files']
+        if not csv_files:
+            input_dir = get_config()['input_dir']
+            csv_files = find_divide_param_csvs(input_dir)
+            if not csv_files:
+                raise CommandError(f"No parameter CSV files found in {input_dir}")
+
+        failed = 0
+        for csv_file in csv_files:
+            try:
+                parquet_file, rows = convert_divide_csv(csv_file, row_group_size=options['row_group_size'])
+            except (OSError, ValueError) as exception:
+                self.stderr.write(f"{csv_file} not converted - {exception}")
+                failed += 1
+                continue
+            self.stdout.write(f"{csv_file}: {rows} rows written to {parquet_file}")
+        if failed:
+            raise CommandError(f"{failed} of {len(csv_files)} CSV files not converted")
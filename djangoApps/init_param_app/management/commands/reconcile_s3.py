@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...util.gage_file_management import GageFileManagement
+
+
+class Command(BaseCommand):
+    help = "Verifies the uri of every HFFILES row against S3 and lists the rows whose files are missing"
+
+    def handle(self, *args, **options):
+        missing = GageFileManagement().reconcile_s3_existence()
+        for uri in missing:
+            self.stdout.write(uri)
+        self.stdout.write(f"{len(missing)} HFFILES uris missing in S3")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...util.module_metadata import bump_module_metadata_stamp
+
+
+class Command(BaseCommand):
+    help = "Makes every process reload the cached module metadata after the module tables were changed"
+
+    def handle(self, *args, **options):
+        version = bump_module_metadata_stamp()
+        self.stdout.write(f"Module metadata stamp is now {version}")
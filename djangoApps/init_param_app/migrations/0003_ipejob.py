@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-17 11:52
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('init_param_app', '0002_cfeparams'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IpeJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('gage_id', models.CharField(max_length=64)),
+                ('hydrofabric_version', models.CharField(max_length=16)),
+                ('source', models.CharField(max_length=64)),
+                ('domain', models.CharField(max_length=64)),
+                ('modules', models.JSONField()),
+                ('status', models.CharField(choices=[('Saved', 'Saved'), ('Ready', 'Ready'), ('Running', 'Running'), ('Done', 'Done'), ('Cancelled', 'Cancelled'), ('Failed', 'Failed'), ('Resumed', 'Resumed'), ('Server error', 'Server error')], default='Saved', max_length=16)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('http_status', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_time', models.DateTimeField(blank=True, null=True)),
+                ('finished_time', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'ipe_jobs',
+                'indexes': [models.Index(fields=['status'], name='ipe_jobs_status_idx')],
+            },
+        ),
+    ]
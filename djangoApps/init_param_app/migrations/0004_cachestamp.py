@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('init_param_app', '0003_ipejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheStamp',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.IntegerField(default=0)),
+                ('updated_time', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'cache_stamps',
+            },
+        ),
+    ]
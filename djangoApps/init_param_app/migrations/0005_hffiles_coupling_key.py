@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# restapi_hffiles is not managed by Django, the column is added here for the PostgreSQL databases of the API.
+# Rows written before the column existed keep a NULL key and are calculated again, except for the modules
+# whose param files never depend on the other requested modules.
+COUPLED_MODULES = ('CFE-S', 'LASAM', 'SFT', 'SMP')
+
+
+def add_coupling_key(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("ALTER TABLE restapi_hffiles ADD COLUMN IF NOT EXISTS coupling_key varchar")
+    schema_editor.execute("UPDATE restapi_hffiles SET coupling_key = '' "
+                          "WHERE coupling_key IS NULL AND data_type = 'PARAMS' AND module_id NOT IN %s",
+                          params=[COUPLED_MODULES])
+
+
+def remove_coupling_key(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("ALTER TABLE restapi_hffiles DROP COLUMN IF EXISTS coupling_key")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('init_param_app', '0004_cachestamp'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_coupling_key, remove_coupling_key),
+    ]
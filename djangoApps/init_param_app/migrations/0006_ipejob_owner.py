@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('init_param_app', '0005_hffiles_coupling_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ipejob',
+            name='owner',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
@@ -1,6 +1,10 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
+from .util.enums import StatusEnum
+
 
 # Create your models here.
 class CfeParams(models.Model):
@@ -37,6 +41,8 @@ class HFFiles(models.Model):
     ipe_json = models.CharField()
     update_time = models.DateTimeField(default=timezone.now)
     api_version = models.CharField()
+    # Co-requested modules the param files depend on, see util.coupling
+    coupling_key = models.CharField(blank=True, null=True)
 
     class Meta:
         managed = False
@@ -45,3 +51,46 @@ class HFFiles(models.Model):
     # method to return all fields
     def __str__(self):
         return self.gage_id
+
+
+class IpeJob(models.Model):
+    """
+    An asynchronous IPE request, executed by the IPE job pool.  The result is the module list return_ipe responds with.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    gage_id = models.CharField(max_length=64)
+    hydrofabric_version = models.CharField(max_length=16)
+    source = models.CharField(max_length=64)
+    domain = models.CharField(max_length=64)
+    modules = models.JSONField()
+    status = models.CharField(max_length=16, choices=[(value, value) for value in StatusEnum.values()], default=StatusEnum.SAVED.value)
+    result = models.JSONField(blank=True, null=True)
+    http_status = models.IntegerField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_time = models.DateTimeField(default=timezone.now)
+    started_time = models.DateTimeField(blank=True, null=True)
+    finished_time = models.DateTimeField(blank=True, null=True)
+    # host:pid:pool of the job pool the job is queued in, see IpeJobPool.recover
+    owner = models.CharField(max_length=128, blank=True, null=True)
+
+    class Meta:
+        db_table = 'ipe_jobs'
+        indexes = [models.Index(fields=['status'], name='ipe_jobs_status_idx')]
+
+    def __str__(self):
+        return str(self.id)
+
+
+class CacheStamp(models.Model):
+    """
+    Version of a process-level cache, bumped to make every process reload it
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.IntegerField(default=0)
+    updated_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'cache_stamps'
+
+    def __str__(self):
+        return f"{self.name} {self.version}"
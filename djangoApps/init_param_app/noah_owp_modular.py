@@ -1,22 +1,94 @@
 import os
 import logging
 
+import numpy as np
 import geopandas as gpd
 import pyarrow.parquet as pq
 import pyarrow as pa
 from .util.utilities import get_hydrofabric_input_attr_file, get_subset_dir_file_names
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate
 from .hf_attributes import *
 
 logger = logging.getLogger(__name__)
 
-def noah_owp_modular_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+# Namelist of a catchment, land surface type (sfctyp) is 2 for a lake (vegetation type 16)
+NAMELIST_TEMPLATE = ConfigTemplate('\n'.join(['&timing',
+                                             "  " + "dt".ljust(19) +  "= 3600.0" + "                       ! timestep [seconds]",
+                                             "  " + "startdate".ljust(19) + "= '{startdate}'" + "               ! UTC time start of simulation (YYYYMMDDhhmm)",
+                                             "  " + "enddate".ljust(19) + "= '{enddate}'" + "               ! UTC time end of simulation (YYYYMMDDhhmm)",
+                                             "  " + "forcing_filename".ljust(19) + "= '.'" + "                          ! file containing forcing data",
+                                             "  " + "output_filename".ljust(19) + "= '.'",
+                                             '/',
+                                             "",
+                                             '&parameters',
+                                             "  " + "parameter_dir".ljust(19) + "= '{noah_input_dir}'",
+                                             "  " + "general_table".ljust(19) + "= 'GENPARM.TBL'" + "                ! general param tables and misc params",
+                                             "  " + "soil_table".ljust(19) + "= 'SOILPARM.TBL'" + "               ! soil param table",
+                                             "  " + "noahowp_table".ljust(19) + "= 'MPTABLE.TBL'" + "                ! model param tables (includes veg)",
+                                             "  " + "soil_class_name".ljust(19) + "= 'STAS'" + "                       ! soil class data source - 'STAS' or 'STAS-RUC'",
+                                             "  " + "veg_class_name".ljust(19) + "= 'USGS'" + "                       ! vegetation class data source - 'MODIFIED_IGBP_MODIS_NOAH' or 'USGS'",
+                                             '/',
+                                             "",
+                                             '&location',
+                                             "  " + "lat".ljust(19) + "= {lat}" + "            ! latitude [degrees]  (-90 to 90)",
+                                             "  " + "lon".ljust(19) + "= {lon}" + "          ! longitude [degrees] (-180 to 180)",
+                                             "  " + "terrain_slope".ljust(19) + "= {tslp}" + "            ! terrain slope [degrees]",
+                                             "  " + "azimuth".ljust(19) + "= {azimuth}" + "           ! terrain azimuth or aspect [degrees clockwise from north]",
+                                             '/',
+                                             "",
+                                             "&forcing",
+                                             "  " + "ZREF".ljust(19) + "= 10.0" + "                         ! measurement height for wind speed (m)",
+                                             "  " + "rain_snow_thresh".ljust(19) + "= 0.5" + "                          ! rain-snow temperature threshold (degrees Celcius)",
+                                             "/",
+                                             "",
+                                             "&model_options",
+                                             "  " + "precip_phase_option".ljust(34) + "= 6",
+                                             "  " + "snow_albedo_option".ljust(34) + "= 1",
+                                             "  " + "dynamic_veg_option".ljust(34) + "= 4",
+                                             "  " + "runoff_option".ljust(34) + "= 3",
+                                             "  " + "drainage_option".ljust(34) + "= 8",
+                                             "  " + "frozen_soil_option".ljust(34) + "= 1",
+                                             "  " + "dynamic_vic_option".ljust(34) + "= 1",
+                                             "  " + "radiative_transfer_option".ljust(34) + "= 3",
+                                             "  " + "sfc_drag_coeff_option".ljust(34) + "= 1",
+                                             "  " + "canopy_stom_resist_option".ljust(34) + "= 1",
+                                             "  " + "crop_model_option".ljust(34) + "= 0",
+                                             "  " + "snowsoil_temp_time_option".ljust(34) + "= 3",
+                                             "  " + "soil_temp_boundary_option".ljust(34) + "= 2",
+                                             "  " + "supercooled_water_option".ljust(34) + "= 1",
+                                             "  " + "stomatal_resistance_option".ljust(34) + "= 1",
+                                             "  " + "evap_srfc_resistance_option".ljust(34) + "= 4",
+                                             "  " + "subsurface_option".ljust(34) + "= 2",
+                                             "/",
+                                             "",
+                                             "&structure",
+                                             "  " + "isltyp".ljust(17) + "= {isltype}" + "              ! soil texture class",
+                                             "  " + "nsoil".ljust(17) + "= 4              ! number of soil levels",
+                                             "  " + "nsnow".ljust(17) + "= 3              ! number of snow levels",
+                                             "  " + "nveg".ljust(17) + "= 27             ! number of vegetation type",
+                                             "  " + "vegtyp".ljust(17) + "= {vegtype}" + "             ! vegetation type",
+                                             "  " + "croptype".ljust(17) + "= 0              ! crop type (0 = no crops; this option is currently inactive)",
+                                             "  " + "sfctyp".ljust(17) + "= {sfctype}" + "              ! land surface type, 1:soil, 2:lake",
+                                             "  " + "soilcolor".ljust(17) + "= 4              ! soil color code",
+                                             "/",
+                                             "",
+                                             "&initial_values",
+                                             "  " + "dzsnso".ljust(10) + "= 0.0, 0.0, 0.0, 0.1, 0.3, 0.6, 1.0      ! level thickness [m]",
+                                             "  " + "sice".ljust(10) + "= 0.0, 0.0, 0.0, 0.0                     ! initial soil ice profile [m3/m3]",
+                                             "  " + "sh2o".ljust(10) + "= 0.3, 0.3, 0.3, 0.3                     ! initial soil liquid profile [m3/m3]",
+                                             "  " + "zwt".ljust(10) + "= -2.0                                   ! initial water table depth below surface [m]",
+                                             "/",
+                                             ]) + '\n')
+
+
+def noah_owp_modular_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     ''' 
     Build initial parameter estimates (IPE) for NOAH-OWP-Modular 
 
     Parameters:
     gage_id (str):  The gage ID, e.g., 06710385
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
+    sink (OutputSink):  Output sink the module's config files are written to
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     
     Returns:
@@ -24,12 +96,11 @@ def noah_owp_modular_ipe(gage_id, version, source, domain, subset_dir, gpkg_file
     '''
 
     module = "Noah-OWP-Modular"
-    filename_list = []
 
     num_soil_type = 19
     num_veg_type = 27
 
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
 
     attr22 = {'divide_id':'divide_id', 'slope':'mean.slope', 'aspect': 'circ_mean.aspect',
               'lat':'centroid_y', 'lon':'centroid_x', 'soil_type':'mode.ISLTYP',
@@ -45,108 +116,28 @@ def noah_owp_modular_ipe(gage_id, version, source, domain, subset_dir, gpkg_file
         attr = attr21
 
  
-    #Loop through catchments, get soil type, populate config file template, write config file to temp 
-    for index, row in divide_attr.iterrows():
-
-        catchment_id = row[attr['divide_id']]
-
-        startdate = '202408260000'
-        enddate = '202408260000'
-        noah_input_dir = 'test'
-
-        # Define namelist template
-
-        tslp = row[attr['slope']]
-        azimuth = row[attr['aspect']]
-        lat = row[attr['lat']]
-        lon = row[attr['lon']]
-        isltype = row[attr['soil_type']]
-        vegtype = row[attr['veg_type']]
-        x = type(vegtype)
-        if vegtype == 16:
-            sfctype = '2'
-        else:
-            sfctype = '1'
-
-        namelist = ['&timing',
-                "  " + "dt".ljust(19) +  "= 3600.0" + "                       ! timestep [seconds]",
-                "  " + "startdate".ljust(19) + "= " + "'" + startdate + "'" + "               ! UTC time start of simulation (YYYYMMDDhhmm)",
-                "  " + "enddate".ljust(19) + "= " + "'" + enddate + "'" + "               ! UTC time end of simulation (YYYYMMDDhhmm)",
-                "  " + "forcing_filename".ljust(19) + "= '.'" + "                          ! file containing forcing data",
-                "  " + "output_filename".ljust(19) + "= '.'",
-                '/',
-                "",
-                '&parameters',
-                "  " + "parameter_dir".ljust(19) + "= " + "'" + noah_input_dir + "'",
-                "  " + "general_table".ljust(19) + "= 'GENPARM.TBL'" + "                ! general param tables and misc params",
-                "  " + "soil_table".ljust(19) + "= 'SOILPARM.TBL'" + "               ! soil param table",
-                "  " + "noahowp_table".ljust(19) + "= 'MPTABLE.TBL'" + "                ! model param tables (includes veg)",
-                "  " + "soil_class_name".ljust(19) + "= 'STAS'" + "                       ! soil class data source - 'STAS' or 'STAS-RUC'",
-                "  " + "veg_class_name".ljust(19) + "= 'USGS'" + "                       ! vegetation class data source - 'MODIFIED_IGBP_MODIS_NOAH' or 'USGS'",
-                '/',
-                "",
-                '&location',
-                "  " + "lat".ljust(19) + "= " + str(lat) + "            ! latitude [degrees]  (-90 to 90)",
-                "  " + "lon".ljust(19) + "= " + str(lon) + "          ! longitude [degrees] (-180 to 180)",
-                "  " + "terrain_slope".ljust(19) + "= " + str(tslp) + "            ! terrain slope [degrees]",
-                "  " + "azimuth".ljust(19) + "= " + str(azimuth) + "           ! terrain azimuth or aspect [degrees clockwise from north]",
-                '/',
-                "",
-                "&forcing",
-                "  " + "ZREF".ljust(19) + "= 10.0" + "                         ! measurement height for wind speed (m)",
-                "  " + "rain_snow_thresh".ljust(19) + "= 0.5" + "                          ! rain-snow temperature threshold (degrees Celcius)",
-                "/",
-                "",
-                "&model_options",
-                "  " + "precip_phase_option".ljust(34) + "= 6",
-                "  " + "snow_albedo_option".ljust(34) + "= 1",
-                "  " + "dynamic_veg_option".ljust(34) + "= 4",
-                "  " + "runoff_option".ljust(34) + "= 3",
-                "  " + "drainage_option".ljust(34) + "= 8",
-                "  " + "frozen_soil_option".ljust(34) + "= 1",
-                "  " + "dynamic_vic_option".ljust(34) + "= 1",
-                "  " + "radiative_transfer_option".ljust(34) + "= 3",
-                "  " + "sfc_drag_coeff_option".ljust(34) + "= 1",
-                "  " + "canopy_stom_resist_option".ljust(34) + "= 1",
-                "  " + "crop_model_option".ljust(34) + "= 0",
-                "  " + "snowsoil_temp_time_option".ljust(34) + "= 3",
-                "  " + "soil_temp_boundary_option".ljust(34) + "= 2",
-                "  " + "supercooled_water_option".ljust(34) + "= 1",
-                "  " + "stomatal_resistance_option".ljust(34) + "= 1",
-                "  " + "evap_srfc_resistance_option".ljust(34) + "= 4",
-                "  " + "subsurface_option".ljust(34) + "= 2",
-                "/",
-                "",
-                "&structure",
-                "  " + "isltyp".ljust(17) + "= " + str(isltype) + "              ! soil texture class",
-                "  " + "nsoil".ljust(17) + "= 4              ! number of soil levels",
-                "  " + "nsnow".ljust(17) + "= 3              ! number of snow levels",
-                "  " + "nveg".ljust(17) + "= 27             ! number of vegetation type",
-                "  " + "vegtyp".ljust(17) + "= " + str(vegtype) + "             ! vegetation type",
-                "  " + "croptype".ljust(17) + "= 0              ! crop type (0 = no crops; this option is currently inactive)",
-                "  " + "sfctyp".ljust(17) + "= " + str(sfctype) + "              ! land surface type, 1:soil, 2:lake",
-                "  " + "soilcolor".ljust(17) + "= 4              ! soil color code",
-                "/",
-                "",
-                "&initial_values",
-                "  " + "dzsnso".ljust(10) + "= 0.0, 0.0, 0.0, 0.1, 0.3, 0.6, 1.0      ! level thickness [m]",
-                "  " + "sice".ljust(10) + "= 0.0, 0.0, 0.0, 0.0                     ! initial soil ice profile [m3/m3]",
-                "  " + "sh2o".ljust(10) + "= 0.3, 0.3, 0.3, 0.3                     ! initial soil liquid profile [m3/m3]",
-                "  " + "zwt".ljust(10) + "= -2.0                                   ! initial water table depth below surface [m]",
-                "/",
-                ]
-
-
-        cfg_filename = f"{catchment_id}_calib.input"
-        filename_list.append(cfg_filename)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.writelines('\n'.join(namelist))
-                            outfile.write("\n")
+    #Render the namelist of all catchments from the attribute columns and write a config file for each
+    vegtype = divide_attr[attr['veg_type']]
+    namelists = NAMELIST_TEMPLATE.render(startdate='202408260000',
+                                         enddate='202408260000',
+                                         noah_input_dir='test',
+                                         lat=divide_attr[attr['lat']],
+                                         lon=divide_attr[attr['lon']],
+                                         tslp=divide_attr[attr['slope']],
+                                         azimuth=divide_attr[attr['aspect']],
+                                         isltype=divide_attr[attr['soil_type']],
+                                         vegtype=vegtype,
+                                         sfctype=np.where(vegtype == 16, '2', '1'))
+    cfg_filenames = [f"{catchment_id}_calib.input" for catchment_id in divide_attr[attr['divide_id']].tolist()]
+    filename_list = sink.write_files(cfg_filenames, namelists)
+
+    #Soil and vegetation type of the last catchment select the calibratable initial values
+    isltype = divide_attr[attr['soil_type']].tolist()[-1]
+    vegtype = vegtype.tolist()[-1]
 
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list,
-                                          module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list,
+                                          module=module).uri
     status_str = "Config files written to:  " + uri
     logger.info(status_str)
 
@@ -2,13 +2,13 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def pet_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+def pet_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     """
     Build initial parameter estimates (IPE) for the PET module
 
     Parameters:
         gage_id (str):  The gage ID, e.g., 06710385
-        subset_dir (str):  Path to gage id directory where the module directory will be made.
+        sink (OutputSink):  Output sink the module's config files are written to
         module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     
     Returns:
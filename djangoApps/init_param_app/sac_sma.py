@@ -7,13 +7,65 @@ import math
 from .util.enums import FileTypeEnum
 from .util.utilities import *
 from .util import utilities
+from .util.bmi_config import ConfigTemplate, carry_forward
+from .util.divide_params import read_divide_params
 
 
 #setup logging
 logger = logging.getLogger(__name__)
 
-
-def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+# Sac-SMA parameter file of a catchment
+PARAM_TEMPLATE = ConfigTemplate('\n'.join(['hru_id {hru_id}',
+                                           'hru_area {hru_area}',
+                                           'uztwm {uztwm}',
+                                           'uzfwm {uzfwm}',
+                                           'lztwm {lztwm}',
+                                           'lzfpm {lzfpm}',
+                                           'lzfsm {lzfsm}',
+                                           'adimp {adimp}',
+                                           'uzk {uzk}',
+                                           'lzpk {lzpk}',
+                                           'lzsk {lzsk}',
+                                           'zperc {zperc}',
+                                           'rexp {rexp}',
+                                           'pctim {pctim}',
+                                           'pfree {pfree}',
+                                           'riva {riva}',
+                                           'side {side}',
+                                           'rserv {rserv}']) + '\n')
+
+# Sac-SMA control file of a catchment
+CONTROL_TEMPLATE = ConfigTemplate('\n'.join(['&SAC_CONTROL',
+                                             '! === run control file for sac17bmi v. 1.x ===',
+                                             '',
+                                             '! -- basin config and path information',
+                                             'main_id             = "{main_id}"     ! basin label or gage id',
+                                             'n_hrus              = 1                   ! number of sub-areas in model',
+                                             'forcing_root        = ""',
+                                             'output_root         = ""',
+                                             'sac_param_file      = "{param_file}"',
+                                             'output_hrus         = 0            ! output HRU results? (1=yes; 0=no)',
+                                             '',
+                                             '! -- run period information',
+                                             'start_datehr        = 2015120112   ! start date time, backward looking (check)',
+                                             'end_datehr          = 2015123012   ! end date time',
+                                             'model_timestep      = 3600        ! in seconds (86400 seconds = 1 day)',
+                                             '',
+                                             '! -- state start/write flags and files',
+                                             'warm_start_run        = 0  ! is this run started from a start file? (no=0 yes=1)',
+                                             'write_states          = 0  ! write the restart/state files for "warm_start" runs (no=0 yes=1)',
+                                             '',
+                                             '! -- filenames only needed if warm_start_run = 1',
+                                             'sac_state_in_root   = "data/state/sac_states."  ! input state filename root',
+                                             '',
+                                             '! -- filenames only needed if write_states = 1',
+                                             'sac_state_out_root = "data/state/sac_states."  ! output states filename root',
+                                             '/',
+                                             ''
+                                             ]) + '\n')
+
+
+def sac_sma_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     '''
     Build initial parameter estimates (IPE) for Sac-SMA
 
@@ -21,8 +73,8 @@ def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
     gage_id (str):  The gage ID, e.g., 06710385
     source (str):  Gage source, e.g., USGS
     domain (str):  Gage domain, e.g., CONUS
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
-    gpkg_file (str):  Path and filename of geopackage file 
+    sink (OutputSink):  Output sink the module's config files are written to
+    hydrofabric (HydrofabricAttributes):  Attribute layers of the subset geopackage 
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     gage_file_mgmt (object):  gage file management object
     
@@ -37,9 +89,6 @@ def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
     #Set Sac-SMA parameter CSV filename based on hydrofabric version
     csv_path_filename = f'{input_dir}/sac_sma_params_{version}.csv'
     
-    #Create empty list for collecting config files
-    filename_list = []
-
     module = 'Sac-SMA'
 
     #Set default values for parameters per InitialParameterValueSources.xlsx
@@ -61,20 +110,20 @@ def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
     rserv = 0.3
   
     try:
-        divides_layer = gpd.read_file(gpkg_file, layer = "divides")
+        divides_layer = hydrofabric.divides()
         try:
             catchments = divides_layer["divide_id"].tolist()
             area = divides_layer[['divide_id','areasqkm']]
         except:
             # TODO: Replace 'except' with proper catch
-            error_str = 'Error reading divides layer in ' + gpkg_file
+            error_str = 'Error reading divides layer in ' + hydrofabric.gpkg_file
             error = dict(error = error_str) 
             print(error_str)
             logger.error(error_str)
             return error
     except:
         # TODO: Replace 'except' with proper catch
-        error_str = 'Error opening ' + gpkg_file
+        error_str = 'Error opening ' + hydrofabric.gpkg_file
         error = dict(error = error_str) 
         print(error_str)
         logger.error(error_str)
@@ -84,7 +133,7 @@ def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
     #Catchment specific parameters are only available for CONUS.  Use default values for oCONUS and ENVCA.
     if domain == 'CONUS' and source != 'ENVCA':
         try:
-            parameters_df = pd.read_csv(csv_path_filename)
+            filtered_parameters = read_divide_params(csv_path_filename, catchments)
         except FileNotFoundError:
             error_str = f'Sac-SMA Parameters CSV file not found: {csv_path_filename}'
             error = {'error': error_str}
@@ -96,7 +145,6 @@ def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
             logger.error(error_str)
             return error   
     
-        filtered_parameters = parameters_df[parameters_df['divide_id'].isin(catchments)]
         if filtered_parameters.empty:
             error_str = f'Catchments in geopackage not found in Sac-SMA CSV file'
             error = {'error': error_str}
@@ -115,104 +163,57 @@ def sac_sma_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
     else:
           df_all = area
 
-    #Loop through divide IDs, get values and set NA values (represented as NaNs in Pandas) to default values.
-    #Create parameter config file.
-    for index, row in df_all.iterrows():
-
-        hru_id = row['divide_id']
-        hru_area = row['areasqkm']
-
-        #Skip for oCONUS and ENVCA -- use default values
-        if domain == 'CONUS' and source != 'ENVCA':
-            if not math.isnan(row['UZTWM']):  uztwm = row['UZTWM']
-            if not math.isnan(row['UZFWM']) : uzfwm = row['UZFWM']
-            if not math.isnan(row['LZTWM']):  lztwm = row['LZTWM']
-            if not math.isnan(row['LZFPM']): lzfpm = row['LZFPM']
-            if not math.isnan(row['LZFSM']): lzfsm = row['LZFSM']
-            if not math.isnan(row['UZK']): uzk = row['UZK']  
-            if not math.isnan(row['LZPK']): lzpk = row['LZPK']
-            if not math.isnan(row['LZSK']): lzsk = row['LZSK'] 
-            if not math.isnan(row['ZPERC']): zperc = row['ZPERC']
-            if not math.isnan(row['REXP']): rexp = row['REXP']
-            if not math.isnan(row['PFREE']): pfree = row['PFREE']
-
-        param_list = ['hru_id ' + hru_id,
-                      'hru_area ' + str(hru_area),
-                      'uztwm ' + str(uztwm),
-                      'uzfwm ' + str(uzfwm),
-                      'lztwm ' + str(lztwm),
-                      'lzfpm ' + str(lzfpm),
-                      'lzfsm ' + str(lzfsm),
-                       'adimp ' + str(adimp),
-                       'uzk ' + str(uzk),
-                       'lzpk ' + str(lzpk),
-                       'lzsk ' + str(lzsk),
-                       'zperc ' + str(zperc),
-                       'rexp ' + str(rexp),
-                       'pctim ' + str(pctim),
-                       'pfree ' + str(pfree),
-                       'riva ' + str(riva),
-                       'side ' + str(side),
-                       'rserv '+ str(rserv)
-                       ]
-        
-        cfg_filename = f'sac_params_{hru_id}.txt'
-        filename_list.append(cfg_filename)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.writelines('\n'.join(param_list))
-                            outfile.write("\n")
-
-        # Create Sac-SMA control file for each catchment
-        input_list = ['&SAC_CONTROL',
-                    '! === run control file for sac17bmi v. 1.x ===',
-                    '',
-                    '! -- basin config and path information',
-                    'main_id             = "' + str(hru_id) + '"     ! basin label or gage id',
-                    'n_hrus              = 1                   ! number of sub-areas in model',
-                    'forcing_root        = ""',
-                    'output_root         = ""',
-                    'sac_param_file      = "' + cfg_filename.rsplit('/')[-1] + '"',
-                    'output_hrus         = 0            ! output HRU results? (1=yes; 0=no)',
-                    '',
-                    '! -- run period information',
-                    'start_datehr        = 2015120112   ! start date time, backward looking (check)',
-                    'end_datehr          = 2015123012   ! end date time',
-                    'model_timestep      = 3600        ! in seconds (86400 seconds = 1 day)',
-                    '',
-                    '! -- state start/write flags and files',
-                    'warm_start_run        = 0  ! is this run started from a start file? (no=0 yes=1)',
-                    'write_states          = 0  ! write the restart/state files for "warm_start" runs (no=0 yes=1)',
-                    '',
-                    '! -- filenames only needed if warm_start_run = 1',
-                    'sac_state_in_root   = "data/state/sac_states."  ! input state filename root',
-                    '',
-                    '! -- filenames only needed if write_states = 1',
-                    'sac_state_out_root = "data/state/sac_states."  ! output states filename root',
-                    '/',
-                    ''
-                    ]
-        ctl_filename = f'sac-init-{hru_id}.namelist.input'
-        filename_list.append(ctl_filename)
-        cfg_filename_path = os.path.join(subset_dir, ctl_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.writelines('\n'.join(input_list))
-                            outfile.write("\n")
+    #Skip for oCONUS and ENVCA -- use default values.  NA values (represented as NaNs in Pandas) are set
+    #to the value of the previous catchment or the default value.
+    if domain == 'CONUS' and source != 'ENVCA':
+        uztwm = carry_forward(df_all['UZTWM'], uztwm)
+        uzfwm = carry_forward(df_all['UZFWM'], uzfwm)
+        lztwm = carry_forward(df_all['LZTWM'], lztwm)
+        lzfpm = carry_forward(df_all['LZFPM'], lzfpm)
+        lzfsm = carry_forward(df_all['LZFSM'], lzfsm)
+        uzk = carry_forward(df_all['UZK'], uzk)
+        lzpk = carry_forward(df_all['LZPK'], lzpk)
+        lzsk = carry_forward(df_all['LZSK'], lzsk)
+        zperc = carry_forward(df_all['ZPERC'], zperc)
+        rexp = carry_forward(df_all['REXP'], rexp)
+        pfree = carry_forward(df_all['PFREE'], pfree)
+
+    #Render the parameter and control files of all catchments
+    hru_ids = df_all['divide_id'].tolist()
+    cfg_filenames = [f'sac_params_{hru_id}.txt' for hru_id in hru_ids]
+    ctl_filenames = [f'sac-init-{hru_id}.namelist.input' for hru_id in hru_ids]
+    param_files = PARAM_TEMPLATE.render(hru_id=hru_ids,
+                                        hru_area=df_all['areasqkm'],
+                                        uztwm=uztwm,
+                                        uzfwm=uzfwm,
+                                        lztwm=lztwm,
+                                        lzfpm=lzfpm,
+                                        lzfsm=lzfsm,
+                                        adimp=adimp,
+                                        uzk=uzk,
+                                        lzpk=lzpk,
+                                        lzsk=lzsk,
+                                        zperc=zperc,
+                                        rexp=rexp,
+                                        pctim=pctim,
+                                        pfree=pfree,
+                                        riva=riva,
+                                        side=side,
+                                        rserv=rserv)
+    control_files = CONTROL_TEMPLATE.render(main_id=hru_ids, param_file=cfg_filenames)
+    sink.write_files(cfg_filenames, param_files)
+    sink.write_files(ctl_filenames, control_files)
+    filename_list = [filename for filenames in zip(cfg_filenames, ctl_filenames) for filename in filenames]
 
-    
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list, module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list, module=module).uri
     status_str = "Config files written to:  " + uri
     logger.info(status_str)
 
-    #write s3 location and ipe values from one of the parameter config files to output json
-    file = os.path.join(subset_dir, cfg_filename)
-    with open(file, 'r') as file:
-        lines = file.readlines()
-
+    #write s3 location and ipe values from the parameter config file of the last catchment to output json
     cfg_file_ipes = {}
 
-    for line in lines:
+    for line in param_files[-1].splitlines():
         key, value = line.strip().split(' ')
         cfg_file_ipes[key.strip()] = value.strip()
 
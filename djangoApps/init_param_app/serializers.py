@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import HFFiles
+from .models import HFFiles, IpeJob
 
 class ModelSerializer(serializers.Serializer):
     model_id = serializers.IntegerField()
@@ -52,3 +52,13 @@ class HFFilesSerializers(serializers.ModelSerializer):
     class Meta:
         model = HFFiles
         fields = '__all__'
+
+
+class IpeJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    version = serializers.CharField(source='hydrofabric_version', read_only=True)
+
+    class Meta:
+        model = IpeJob
+        fields = ['job_id', 'status', 'gage_id', 'version', 'source', 'domain', 'modules', 'error',
+                  'created_time', 'started_time', 'finished_time']
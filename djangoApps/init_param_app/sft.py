@@ -11,18 +11,20 @@ import pyarrow as pa
 from .util.utilities import *
 #from utilities import *
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate
 from .hf_attributes import *
 
 logger = logging.getLogger(__name__)
 
 #def sft_ipe(gage_id, subset_dir, module_metadata_list, module_metadata, gpkg_file):
-def sft_ipe(module, gage_id, version, source, domain, subset_dir, gpkg_file, modules, module_metadata, gage_file_mgmt):
+def sft_ipe(module, gage_id, version, source, domain, sink, hydrofabric, modules, module_metadata, gage_file_mgmt, coupling=''):
     '''
         Description: Build initial parameter estimates (IPE) for snow freeze thaw (SFT)
         Parameters:
             gage_id (str):  The gage ID, e.g., 06710385
-            subset_dir (str):  Path to gage id directory where the module directory will be made.
+            sink (OutputSink):  Output sink the module's config files are written to
             module_metadata_list (dict):  list dictionary containing URI, initial parameters, output variables
+            coupling (str):  Coupling key of the module in the request, see util.coupling
         Returns:
             dict: JSON output with cfg file URI, calibratable parameters initial values, output variables.
     '''
@@ -46,31 +48,24 @@ def sft_ipe(module, gage_id, version, source, domain, subset_dir, gpkg_file, mod
     ##areas = divides_layer["areasqkm"].tolist()
 
     try:
-        divides_layer = gpd.read_file(gpkg_file, layer="divides")
+        divides_layer = hydrofabric.divides()
         try:
             catchments = divides_layer["divide_id"].tolist()
             areas = divides_layer["areasqkm"].tolist()
         except:
-            error_str = 'Error reading divides layer in ' + gpkg_file
+            error_str = 'Error reading divides layer in ' + hydrofabric.gpkg_file
             error = dict(error=error_str)
             print(error_str)
             logger.error(error_str)
             return error
     except:
-        error_str = 'Error opening ' + gpkg_file
+        error_str = 'Error opening ' + hydrofabric.gpkg_file
         error = dict(error=error_str)
         print(error_str)
         logger.error(error_str)
         return error
 
-    # data = gpd.read_file(gpkg_file, layer="divides") #This info is a dupe of divides_layer above
-    catch_dict = {}
-    #for index, row in data.iterrows():
-    for index, row in divides_layer.iterrows():
-        #print(row['divide_id'], row['areasqkm'])
-        catch_dict[str(catchments[index])] = {"areasqkm": str(areas[index])}
-
-    response = create_sft_input(gage_id, version, source, domain, catch_dict, gpkg_file, subset_dir, modules, module_metadata, gage_file_mgmt)
+    response = create_sft_input(gage_id, version, source, domain, hydrofabric, sink, modules, module_metadata, gage_file_mgmt, coupling)
     logger.info("sft::sft_ipe:returning response as " + str(response))
 
     # TODO Returning just the "first" record, does not match Swagger docs. Verify!
@@ -78,14 +73,11 @@ def sft_ipe(module, gage_id, version, source, domain, subset_dir, gpkg_file, mod
     return response[0]
 
 
-def create_sft_input(gage_id, version, source, domain, catch_dict, gpkg_file, output_dir, modules, module_metadata, gage_file_mgmt):
+def create_sft_input(gage_id, version, source, domain, hydrofabric, sink, modules, module_metadata, gage_file_mgmt, coupling=''):
     #os.makedirs(sft_dir, exist_ok=True)
     #os.makedirs(smp_dir, exist_ok=True)
-    #this dir should exist here already, but just in case...
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir, exist_ok=True)
 
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
 
     attr21 = {'smcmax':'smcmax', 'bexp':'bexp', 'psisat':'psisat', 'quartz':'quartz'}
     attr22 = {'smcmax':'mean.smcmax', 'bexp':'mode.bexp', 'psisat':'geom_mean.psisat', 'quartz':'quartz'}
@@ -116,43 +108,42 @@ def create_sft_input(gage_id, version, source, domain, catch_dict, gpkg_file, ou
         icefscheme = 'Xinanjiang'
 
     response = []
-    s3_file_list = []
-
-    # for key in catch_dict.keys(): LOOP CATCH_IDs HERE (from filtered dataframe)!!
-    for index, row in divide_attr.iterrows():
-
-        catID = row['divide_id']
-
-        # This value is just a reasonable estimate per new direction (Edwin)
-        mtemp = (45 - 32) * 5/9 + 273.15  ##this is avg soil temp of 45 degrees F converted to Kelvin
-
-        # Create sft param list
-        param_list = ['verbosity=none',
-                      'soil_moisture_bmi=1',
-                      'end_time=1.[d]',
-                      'dt=1.0[h]',
-                      'soil_params.smcmax=' + str(row['mean.smcmax_soil_layers_stag=1']),
-                      'soil_params.b=' + str(row['mode.bexp_soil_layers_stag=1']),
-                      'soil_params.satpsi=' + str(row['geom_mean.psisat_soil_layers_stag=1']),
-                      'soil_params.quartz=' + str(row['quartz']),
-                      'ice_fraction_scheme=' + icefscheme,
-                      'soil_z=0.1,0.3,1.0,2.0[m]',
-                      'soil_temperature=' + ','.join([str(mtemp)] * 4) + '[K]',
-                      ]
-
-        module_metadata_rec = set_ipe_json_values(param_list, module_metadata, sep="=")
-
-        sft_bmi_file = os.path.join(output_dir, f'{catID}_bmi_config_sft.txt')
-        with open(sft_bmi_file, "w") as f:
-            f.writelines('\n'.join(param_list))
 
-        # put all files to write to S3 in a list to write to S3 outside of loop
-        s3_file_list.append(os.path.basename(sft_bmi_file))
+    # This value is just a reasonable estimate per new direction (Edwin)
+    mtemp = (45 - 32) * 5/9 + 273.15  ##this is avg soil temp of 45 degrees F converted to Kelvin
+
+    # Create sft param list
+    param_list = ['verbosity=none',
+                  'soil_moisture_bmi=1',
+                  'end_time=1.[d]',
+                  'dt=1.0[h]',
+                  'soil_params.smcmax={smcmax}',
+                  'soil_params.b={bexp}',
+                  'soil_params.satpsi={psisat}',
+                  'soil_params.quartz={quartz}',
+                  'ice_fraction_scheme=' + icefscheme,
+                  'soil_z=0.1,0.3,1.0,2.0[m]',
+                  'soil_temperature=' + ','.join([str(mtemp)] * 4) + '[K]',
+                  ]
+
+    # Render the config of all catchments from the attribute columns
+    sft_configs = ConfigTemplate('\n'.join(param_list)).render(
+        smcmax=divide_attr['mean.smcmax_soil_layers_stag=1'],
+        bexp=divide_attr['mode.bexp_soil_layers_stag=1'],
+        psisat=divide_attr['geom_mean.psisat_soil_layers_stag=1'],
+        quartz=divide_attr['quartz'])
+    sft_filenames = [f'{catID}_bmi_config_sft.txt' for catID in divide_attr['divide_id'].tolist()]
+
+    # Initial values are taken from the config of the last catchment
+    module_metadata_rec = set_ipe_json_values(sft_configs[-1].split('\n'), module_metadata, sep="=")
+
+    # put all files to write to S3 in a list to write to S3 outside of loop
+    s3_file_list = sink.write_files(sft_filenames, sft_configs)
 
     # Now write files to db AND S3 via GageFileManagement class
     module_name = module_metadata["module_name"]
     uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source,
-                                          output_dir, s3_file_list, module=module_name)
+                                          sink, s3_file_list, module=module_name, coupling=coupling).uri
 
     # log the S3 path to the files
     module_metadata_rec['parameter_file']['uri'] = uri
@@ -7,14 +7,74 @@ import math
 from .util.enums import FileTypeEnum
 from .util.utilities import *
 from .util import utilities
+from .util.bmi_config import ConfigTemplate, carry_forward
+from .util.divide_params import read_divide_params
 from .hf_attributes import *
 
 
 #setup logging
 logger = logging.getLogger(__name__)
 
-
-def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+# Snow17 parameter file of a catchment
+PARAM_TEMPLATE = ConfigTemplate('\n'.join(['hru_id {hru_id}',
+                                           'hru_area {hru_area}',
+                                           'latitude {latitude}',
+                                           'elev {elev}',
+                                           'scf 1.100',
+                                           'mfmax {mfmax}',
+                                           'mfmin {mfmin}',
+                                           'uadj {uadj}',
+                                           'si 500.00',
+                                           'pxtemp 1.000',
+                                           'nmf 0.150',
+                                           'tipm 0.100',
+                                           'mbase 0.000',
+                                           'plwhc 0.030',
+                                           'daygm 0.000',
+                                           'adc1 0.050',
+                                           'adc2 0.100',
+                                           'adc3 0.200',
+                                           'adc4 0.300',
+                                           'adc5 0.400',
+                                           'adc6 0.500',
+                                           'adc7 0.600',
+                                           'adc8 0.700',
+                                           'adc9 0.800',
+                                           'adc10 0.900',
+                                           'adc11 1.000']) + '\n')
+
+# Snow17 control file of a catchment
+CONTROL_TEMPLATE = ConfigTemplate('\n'.join(['&SNOW17_CONTROL',
+                                             '! === run control file for snow17bmi v. 1.x ===',
+                                             '',
+                                             '! -- basin config and path information',
+                                             'main_id             = "{main_id}"     ! basin label or gage id',
+                                             'n_hrus              = 1            ! number of sub-areas in model',
+                                             'forcing_root        = "extern/snow17/test_cases/ex1/input/forcing/forcing.snow17bmi."',
+                                             'output_root         = "data/output/output.snow17bmi."',
+                                             'snow17_param_file   = "{param_file}"',
+                                             'output_hrus         = 1            ! output HRU results? (1=yes; 0=no)',
+                                             '',
+                                             '! -- run period information',
+                                             'start_datehr        = 2017120101   ! start date time, backward looking (check)',
+                                             'end_datehr          = 2017120123   ! end date time',
+                                             'model_timestep      = 3600        ! in seconds (86400 seconds = 1 day)',
+                                             '',
+                                             '! -- state start/write flags and files',
+                                             'warm_start_run      = 0  ! is this run started from a state file?  (no=0 yes=1)',
+                                             "write_states        = 0  ! write restart/state files for 'warm_start' runs (no=0 yes=1)",
+                                             '',
+                                             '! -- filenames only needed if warm_start_run = 1',
+                                             'snow_state_in_root  = "data/state/snow17_states."  ! input state filename root',
+                                             '',
+                                             '! -- filenames only needed if write_states = 1',
+                                             'snow_state_out_root = "data/state/snow17_states."  ! output states filename root',
+                                             '/',
+                                             ''
+                                             ]) + '\n')
+
+
+def snow17_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     '''
     Build initial parameter estimates (IPE) for Sac-SMA
 
@@ -22,8 +82,8 @@ def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_m
     gage_id (str):  The gage ID, e.g., 06710385
     source (str):  Gage source, e.g., USGS
     domain (str):  Gage domain, e.g., CONUS
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
-    gpkg_file (str):  Path and filename of geopackage file 
+    sink (OutputSink):  Output sink the module's config files are written to
+    hydrofabric (HydrofabricAttributes):  Attribute layers of the subset geopackage 
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     gage_file_mgmt (object):  gage file management object
     
@@ -38,19 +98,16 @@ def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_m
     #Set Sac-SMA parameter CSV filename based on hydrofabric version
     csv_path_filename = f'{input_dir}/snow17_params_{version}.csv'
     
-    #Create empty list for collecting config files
-    filename_list = []
-
     module = 'Snow-17'
 
     try:
-        divides_layer = gpd.read_file(gpkg_file, layer = "divides")
+        divides_layer = hydrofabric.divides()
         try:
             catchments = divides_layer["divide_id"].tolist()
             area = divides_layer[['divide_id','areasqkm']]
         except:
             # TODO: Replace 'except' with proper catch
-            error_str = 'Error reading divides layer in ' + gpkg_file
+            error_str = 'Error reading divides layer in ' + hydrofabric.gpkg_file
             error = dict(error = error_str) 
             print(error_str)
             logger.error(error_str)
@@ -58,13 +115,13 @@ def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_m
 
     except:
         # TODO: Replace 'except' with proper catch
-        error_str = 'Error opening ' + gpkg_file
+        error_str = 'Error opening ' + hydrofabric.gpkg_file
         error = dict(error = error_str) 
         print(error_str)
         logger.error(error_str)
         return error
     
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
 
     attr21 = {'elevation_mean':'elevation_mean', 'lat':'Y'}
     attr22 = {'elevation_mean':'mean.elevation', 'lat':'centroid_y'}
@@ -78,7 +135,7 @@ def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_m
     #These are only available for CONUS (except for ENVCA)
     if domain == 'CONUS' and source != 'ENVCA':
         try:
-            parameters_df = pd.read_csv(csv_path_filename)
+            filtered_parameters = read_divide_params(csv_path_filename, catchments)
         except FileNotFoundError:
             error_str = f'Snow-17 Parameters CSV file not found: {csv_path_filename}'
             error = {'error': error_str}
@@ -90,7 +147,6 @@ def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_m
             logger.error(error_str)
             return error   
 
-        filtered_parameters = parameters_df[parameters_df['divide_id'].isin(catchments)]
         if filtered_parameters.empty:
             error_str = f'Catchments in geopackage not found in Snow-17 CSV file'
             error = {'error': error_str}
@@ -115,104 +171,38 @@ def snow17_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_m
     mfmin = 0.20
     uadj = 0.05
 
-    #Loop through divide IDs, get values, and set NA values (represented as NaNs in Pandas) to default values in param_list
-    #Create parameter config file.
-    for index, row in df_all.iterrows():
-
-        hru_id = row['divide_id']  # need this for filenames as well as parameters
-        #hru_area = row['areasqkm']
-        #Only use values from CSV file if CONUS and not ENVCA
-        if domain == 'CONUS' and source != 'ENVCA':
-            if not math.isnan(row['MFMIN']):  mfmin = row['MFMIN']
-            if not math.isnan(row['MFMAX']): mfmax = row['MFMAX']
-            if not math.isnan(row['UADJ']):  uadj = row['UADJ']
-
-        param_list = ['hru_id ' + str(row['divide_id']),
-                      'hru_area ' + str(row['areasqkm']),
-                      'latitude ' + str(row[attr['lat']]),
-                      'elev ' + str(row[attr['elevation_mean']]),  # elevation_mean[1]
-                      'scf 1.100',
-                      'mfmax ' + str(mfmax),
-                      'mfmin ' + str(mfmin),
-                      'uadj ' + str(uadj),
-                      'si 500.00',
-                      'pxtemp 1.000',
-                      'nmf 0.150',
-                      'tipm 0.100',
-                      'mbase 0.000',
-                      'plwhc 0.030',
-                      'daygm 0.000',
-                      'adc1 0.050',
-                      'adc2 0.100',
-                      'adc3 0.200',
-                      'adc4 0.300',
-                      'adc5 0.400',
-                      'adc6 0.500',
-                      'adc7 0.600',
-                      'adc8 0.700',
-                      'adc9 0.800',
-                      'adc10 0.900',
-                      'adc11 1.000']
-
-
-        cfg_filename = f'snow17_params-{hru_id}.txt'
-        filename_list.append(cfg_filename)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-            outfile.writelines('\n'.join(param_list))
-            outfile.write("\n")
-
-        # Create Snow17 control file for each catchment
-        input_list = ['&SNOW17_CONTROL',
-                      '! === run control file for snow17bmi v. 1.x ===',
-                      '',
-                      '! -- basin config and path information',
-                      'main_id             = "' + str(hru_id) + '"     ! basin label or gage id',
-                      'n_hrus              = 1            ! number of sub-areas in model',
-                      'forcing_root        = "extern/snow17/test_cases/ex1/input/forcing/forcing.snow17bmi."',
-                      'output_root         = "data/output/output.snow17bmi."',
-                      'snow17_param_file   = "' + cfg_filename.rsplit('/')[-1] + '"',
-                      'output_hrus         = 1            ! output HRU results? (1=yes; 0=no)',
-                      '',
-                      '! -- run period information',
-                      'start_datehr        = 2017120101   ! start date time, backward looking (check)',
-                      'end_datehr          = 2017120123   ! end date time',
-                      'model_timestep      = 3600        ! in seconds (86400 seconds = 1 day)',
-                      '',
-                      '! -- state start/write flags and files',
-                      'warm_start_run      = 0  ! is this run started from a state file?  (no=0 yes=1)',
-                      "write_states        = 0  ! write restart/state files for 'warm_start' runs (no=0 yes=1)",
-                      '',
-                      '! -- filenames only needed if warm_start_run = 1',
-                      'snow_state_in_root  = "data/state/snow17_states."  ! input state filename root',
-                      '',
-                      '! -- filenames only needed if write_states = 1',
-                      'snow_state_out_root = "data/state/snow17_states."  ! output states filename root',
-                      '/',
-                      ''
-                      ]
-
-        ctl_filename = f'snow17-init-{hru_id}.namelist.input'
-        filename_list.append(ctl_filename)
-        cfg_filename_path = os.path.join(subset_dir, ctl_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-            outfile.writelines('\n'.join(input_list))
-            outfile.write("\n")
+    #Only use values from CSV file if CONUS and not ENVCA, NA values (represented as NaNs in Pandas) are set
+    #to the value of the previous catchment or the default value
+    if domain == 'CONUS' and source != 'ENVCA':
+        mfmin = carry_forward(df_all['MFMIN'], mfmin)
+        mfmax = carry_forward(df_all['MFMAX'], mfmax)
+        uadj = carry_forward(df_all['UADJ'], uadj)
+
+    #Render the parameter and control files of all catchments
+    hru_ids = df_all['divide_id'].tolist()
+    cfg_filenames = [f'snow17_params-{hru_id}.txt' for hru_id in hru_ids]
+    ctl_filenames = [f'snow17-init-{hru_id}.namelist.input' for hru_id in hru_ids]
+    param_files = PARAM_TEMPLATE.render(hru_id=hru_ids,
+                                        hru_area=df_all['areasqkm'],
+                                        latitude=df_all[attr['lat']],
+                                        elev=df_all[attr['elevation_mean']],
+                                        mfmax=mfmax,
+                                        mfmin=mfmin,
+                                        uadj=uadj)
+    control_files = CONTROL_TEMPLATE.render(main_id=hru_ids, param_file=cfg_filenames)
+    sink.write_files(cfg_filenames, param_files)
+    sink.write_files(ctl_filenames, control_files)
+    filename_list = [filename for filenames in zip(cfg_filenames, ctl_filenames) for filename in filenames]
 
-    
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list, module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list, module=module).uri
     status_str = "Config files written to:  " + uri
     logger.info(status_str)
 
-    #write s3 location and ipe values from one of the parameter config files to output json
-    file = os.path.join(subset_dir, cfg_filename)
-    with open(file, 'r') as file:
-        lines = file.readlines()
-
+    #write s3 location and ipe values from the parameter config file of the last catchment to output json
     cfg_file_ipes = {}
 
-    for line in lines:
+    for line in param_files[-1].splitlines():
         key, value = line.strip().split(' ')
         cfg_file_ipes[key.strip()] = value.strip()
 
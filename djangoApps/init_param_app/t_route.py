@@ -5,13 +5,13 @@ from .util.utilities import *
 logger = logging.getLogger(__name__)
 
 
-def t_route_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+def t_route_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     '''
     Build initial parameter estimates (IPE) for T-Route 
 
     Parameters:
     gage_id (str):  The gage ID, e.g., 06710385
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
+    sink (OutputSink):  Output sink the module's config files are written to
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     
     Returns:
@@ -80,11 +80,11 @@ def t_route_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
                 ]
 
     nwtopo_param = {"supernetwork_parameters": {"network_type": "HYFeaturesNetwork",
-                                                "geo_file_path": gpkg_file, 
+                                                "geo_file_path": hydrofabric.gpkg_file, 
                                                 "columns": columns, 
                                                 "duplicate_wb_segments": dupseg},
                     "waterbody_parameters": {"break_network_at_waterbodies": True,
-                                                "level_pool": {"level_pool_waterbody_parameter_file_path": gpkg_file}},
+                                                "level_pool": {"level_pool_waterbody_parameter_file_path": hydrofabric.gpkg_file}},
                     }
 
     # compute_parameters
@@ -142,14 +142,12 @@ def t_route_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_
     # Save configuration into yaml file
     # TODO: Make constant or StrEnum
     output_filename = 'troute.yml'
-    output_full_path = os.path.join(subset_dir, output_filename)
-    with open(output_full_path, 'w') as file:
-        yaml.dump(config, file, sort_keys=False, default_flow_style=False, indent=4)
+    sink.write(output_filename, yaml.dump(config, sort_keys=False, default_flow_style=False, indent=4))
 
     # GageFileManagement needs input files as a list
     filename_list = [output_filename]
     # Write files to DB and S3
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list, module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list, module=module).uri
     status_str = "Config files written to:  " + uri
     print(status_str)
     logger.info(status_str)
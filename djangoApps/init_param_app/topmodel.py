@@ -1,6 +1,7 @@
 import os
 import logging
 import json
+import math
 
 import geopandas as gpd
 import pandas as pd
@@ -9,11 +10,54 @@ import pyarrow as pa
 from collections import OrderedDict
 from .util.utilities import get_hydrofabric_input_attr_file, get_subset_dir_file_names, get_config
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate
 from .hf_attributes import *
 
 logger = logging.getLogger(__name__)
 
-def topmodel_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+# Subcatchment file of a catchment:  num_sub_catchments, imap, yes_print_output, the TWI distribution,
+# num_channels, cum_dist_area_with_dist and dist_from_outlet.  Area is 1.
+SUBCAT_TEMPLATE = ConfigTemplate("1 1 1 \n"
+                                 "Extracted study basin:  {divide_id} \n"
+                                 "{num_topodex_values} 1 \n"
+                                 "{twi_table}"
+                                 "1\n"
+                                 "1.0 {dist_from_outlet}\n")
+
+# Primary configuration file of a catchment, stand_alone is set to false (0) for BMI
+RUN_TEMPLATE = ConfigTemplate("0\n"
+                              "{divide_id}\n"
+                              "input.dat\n"
+                              "data/{subcat_file}\n"
+                              "data/{params_file}\n"
+                              "{divide_id}_topmod.out\n"
+                              "{divide_id}_hyd.out\n")
+
+
+def format_twi_table(twi_json):
+    '''
+    Formats the TWI distribution of a catchment as lines of frequency and TWI value (v)
+
+    Values are formatted as pandas DataFrame.to_csv formats them:  a column holding only integers is written
+    as integers, otherwise as floats with missing values left empty.
+
+    Parameters:
+    twi_json (str):  JSON list of the TWI distribution, e.g. [{"v": 2.5, "frequency": 0.25}, ...]
+
+    Returns:
+    tuple: number of TWI values, lines of the TWI distribution
+    '''
+    twi = json.loads(twi_json)
+    columns = []
+    for key in ['frequency', 'v']:
+        values = [item.get(key) for item in twi]
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            columns.append([str(value) for value in values])
+        else:
+            columns.append(['' if value is None or math.isnan(value) else str(float(value)) for value in values])
+    return len(twi), ''.join(f'{frequency} {v}\n' for frequency, v in zip(*columns))
+
+def topmodel_ipe(gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
     ''' 
     Build initial parameter estimates (IPE) for TopModel
 
@@ -21,8 +65,8 @@ def topmodel_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module
     gage_id (str):  The gage ID, e.g., 06710385
     source (str):  Gage source, e.g., USGS
     domain (str):  Gage domain, e.g., CONUS
-    subset_dir (str):  Path to gage id directory where the module directory will be made.
-    gpkg_file (str):  Path and filename of geopackage file 
+    sink (OutputSink):  Output sink the module's config files are written to
+    hydrofabric (HydrofabricAttributes):  Attribute layers of the subset geopackage 
     module_metadata (dict):  dictionary containing URI, initial parameters, output variables
     gage_file_mgmt (object):  gage file management object
     
@@ -31,26 +75,25 @@ def topmodel_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module
     '''
 
     module = "TopModel"
-    filename_list = []
  
     # Get flowpath lengths from gpkg divides layer using geopandas
     try:
-        divides_layer = gpd.read_file(gpkg_file, layer = "divides")
+        divides_layer = hydrofabric.divides()
         try:
             flowpath_length = divides_layer[['divide_id','lengthkm']]
         except:
             # TODO: Replace 'except' with proper catch
-            error_str = 'Error reading divides layer in ' + gpkg_file
+            error_str = 'Error reading divides layer in ' + hydrofabric.gpkg_file
             error = dict(error = error_str) 
             logger.error(error_str)
             return error
     except:# TODO: Replace 'except' with proper catch
-        error_str = 'Error opening ' + gpkg_file
+        error_str = 'Error opening ' + hydrofabric.gpkg_file
         error = dict(error = error_str) 
         logger.error(error_str)
         return error
     
-    divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+    divide_attr = hydrofabric.divide_attributes()
     #Join parameters from csv and area into single dataframe.
     df_all = divide_attr.join(flowpath_length.set_index('divide_id'), on='divide_id')
 
@@ -62,94 +105,50 @@ def topmodel_ipe(gage_id, version, source, domain, subset_dir, gpkg_file, module
     elif version == '2.2':
         attr=attr22
 
-    for index, row in df_all.iterrows():
-
-        #build subcatchment data
-        #TWI values are from Hydrofabric divide attributes, num_channels, cum_dist_area_with_dist,
-        #dist_from_outlet set per InitialParametersValueSources.xlsx
-        num_sub_catchments = 1
-        imap = 1
-        yes_print_output = 1
-        divide_id = row['divide_id']
-        area = 1
-        twi = json.loads(row[attr['twi']])
-        num_topodex_values = len(twi)
-        num_channels = 1
-        cum_dist_area_with_dist = 1.0
-        dist_from_outlet = round(row['lengthkm']*1000) #convert km to m
-
-        subcat_line1 = f"{num_sub_catchments} {imap} {yes_print_output} \n"
-        subcat_line2 = f"Extracted study basin:  {divide_id} \n"
-        subcat_line3 = f"{num_topodex_values} {area} \n"
-        subcat_line5 = f"{num_channels}\n"
-        subcat_line6 = f"{cum_dist_area_with_dist} {dist_from_outlet}\n"
-
-        df = pd.DataFrame(twi)
-
-        cfg_filename_subcat = f'{divide_id}_topmodel_subcat.dat'
-        filename_list.append(cfg_filename_subcat)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename_subcat)
-    
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.write(subcat_line1)
-                            outfile.write(subcat_line2)
-                            outfile.write(subcat_line3)
-        df.to_csv(cfg_filename_path, mode='a', sep=' ', columns=['frequency', 'v'], index=False, header=False)
-        with open(cfg_filename_path, 'a') as outfile:
-            outfile.write(subcat_line5)
-            outfile.write(subcat_line6)
-
-        #Parameter values are set per InitialParametersValueSources.xlsx
-        #sr0 set to 0 recommended in email with Deltares.
-        #Q0 set to initial value used in the example param file in the TopModel repo.
-        params = OrderedDict()
-        params['szm'] = "0.0125"
-        params['t0'] = "0.000075"
-        params['td'] = "20"
-        params['chv'] = "1000"
-        params['rv'] = "1000"
-        params['srmax'] = "0.04"
-        params['Q0'] = "0.0000328"
-        params['sr0'] = "0"
-        params['infex'] = "0"
-        params['xk0'] = "2"
-        params['hf'] = "0.1"
-        params['dth'] = "0.1"
-
-        line1 = divide_id + '\n'
-        line2 = " ".join(f'{v}' for k,v in params.items())
-
-        cfg_filename = f'{divide_id}_topmodel_params.dat'
-        filename_list.append(cfg_filename)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename)
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.write(line1)
-                            outfile.write(line2)
-
-        # Create primary configuration file
-        stand_alone = '0\n'  #  Set to false for BMI
-        title = f'{divide_id}\n'
-        input_fptr = 'input.dat\n'
-        subcat_fptr = f'data/{cfg_filename_subcat}\n'
-        params_fptr = f'data/{cfg_filename}\n'
-        output_fptr = f'{divide_id}_topmod.out\n'
-        out_hyd_fptr = f'{divide_id}_hyd.out\n'
-
-        cfg_filename_run = f'{divide_id}_topmodel.run'
-        filename_list.append(cfg_filename_run)
-        cfg_filename_path = os.path.join(subset_dir, cfg_filename_run)
-        with open(cfg_filename_path, 'w') as outfile:
-                            outfile.write(stand_alone)
-                            outfile.write(title)
-                            outfile.write(input_fptr)
-                            outfile.write(subcat_fptr)
-                            outfile.write(params_fptr)
-                            outfile.write(output_fptr)
-                            outfile.write(out_hyd_fptr)
-         
+    #Parameter values are set per InitialParametersValueSources.xlsx
+    #sr0 set to 0 recommended in email with Deltares.
+    #Q0 set to initial value used in the example param file in the TopModel repo.
+    params = OrderedDict()
+    params['szm'] = "0.0125"
+    params['t0'] = "0.000075"
+    params['td'] = "20"
+    params['chv'] = "1000"
+    params['rv'] = "1000"
+    params['srmax'] = "0.04"
+    params['Q0'] = "0.0000328"
+    params['sr0'] = "0"
+    params['infex'] = "0"
+    params['xk0'] = "2"
+    params['hf'] = "0.1"
+    params['dth'] = "0.1"
+
+    #build subcatchment data
+    #TWI values are from Hydrofabric divide attributes, num_channels, cum_dist_area_with_dist,
+    #dist_from_outlet set per InitialParametersValueSources.xlsx
+    divide_ids = df_all['divide_id'].tolist()
+    twi_tables = [format_twi_table(twi) for twi in df_all[attr['twi']].tolist()]
+    subcat_files = SUBCAT_TEMPLATE.render(divide_id=divide_ids,
+                                          num_topodex_values=[num_topodex_values for num_topodex_values, _ in twi_tables],
+                                          twi_table=[twi_table for _, twi_table in twi_tables],
+                                          dist_from_outlet=[round(lengthkm*1000) for lengthkm in df_all['lengthkm'].tolist()]) #convert km to m
+    params_files = ConfigTemplate('{divide_id}\n' + " ".join(f'{v}' for k,v in params.items())).render(divide_id=divide_ids)
+
+    cfg_filenames_subcat = [f'{divide_id}_topmodel_subcat.dat' for divide_id in divide_ids]
+    cfg_filenames = [f'{divide_id}_topmodel_params.dat' for divide_id in divide_ids]
+    cfg_filenames_run = [f'{divide_id}_topmodel.run' for divide_id in divide_ids]
+
+    # Create primary configuration file
+    run_files = RUN_TEMPLATE.render(divide_id=divide_ids, subcat_file=cfg_filenames_subcat, params_file=cfg_filenames)
+
+    sink.write_files(cfg_filenames_subcat, subcat_files)
+    sink.write_files(cfg_filenames, params_files)
+    sink.write_files(cfg_filenames_run, run_files)
+    filename_list = [filename for filenames in zip(cfg_filenames_subcat, cfg_filenames, cfg_filenames_run)
+                     for filename in filenames]
+
     # Write files to DB and S3
     print(FileTypeEnum.PARAMS)
-    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list, module=module)
+    uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list, module=module).uri
     status_str = "Config files written to:  " + uri
     logger.info(status_str)
  
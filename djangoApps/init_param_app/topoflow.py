@@ -8,6 +8,7 @@ import pyarrow as pa
 from ambiance import Atmosphere
 from .util.utilities import get_config, get_hydrofabric_input_attr_file, get_subset_dir_file_names
 from .util.enums import FileTypeEnum
+from .util.divide_params import read_divide_params
 from .hf_attributes import get_hydrofabric_attributes
 
 logger = logging.getLogger(__name__)
@@ -24,15 +25,15 @@ class TopoFlow:
         self.config = get_config()
         self.input_dir = self.config['input_dir']
 
-    def initial_parameters(self, gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+    def initial_parameters(self, gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
         """
         Builds initial parameter estimates (IPE) for UEB (Utah Energy Balance) Module
         :param gage_id: The gage ID, e.g., 06710385
         :param version: The hydrofabric version
         :param source: The gage provider or agency
         :param domain: The NWM region the gage belongs to (Ex CONUS)
-        :param subset_dir: Path to gage id directory where the module directory will be made.
-        :param gpkg_file:
+        :param sink: Output sink the module's config files are written to
+        :param hydrofabric:
         :param module_metadata: Dictionary containing URI, initial parameters, output variables
         :param gage_file_mgmt:
         :return: JSON output with cfg file URI, calibratable parameters initial values, output variables.
@@ -43,17 +44,17 @@ class TopoFlow:
         # Get list of catchments from gpkg divides layer using geopandas
         # TODO: This code needs to be moved to a geopackage file utility it is duplicated all over
         try:
-            divides_layer = gpd.read_file(gpkg_file, layer="divides")
+            divides_layer = hydrofabric.divides()
             try:
                 catchments = divides_layer["divide_id"].tolist()
             except:
                 # TODO: Replace 'except' with proper catch
-                error_str = 'Error reading divides layer in ' + gpkg_file
+                error_str = 'Error reading divides layer in ' + hydrofabric.gpkg_file
                 error = dict(error=error_str)
                 logger.error(error_str)
                 return error
         except:  # TODO: Replace 'except' with proper catch
-            error_str = 'Error opening ' + gpkg_file
+            error_str = 'Error opening ' + hydrofabric.gpkg_file
             error = dict(error=error_str)
             logger.error(error_str)
             return error
@@ -61,8 +62,7 @@ class TopoFlow:
         # Read model attributes Hive partitioned Parquet dataset using pyarrow, remove rows containing null, convert to pandas dataframe
         try:
             # Read parameters from CSV file into dataframe and filter on divide ids in geopackage.
-            parameters_df = pd.read_csv(f'{self.input_dir}/deltat.csv')
-            filtered_parameters = parameters_df[parameters_df['divide_id'].isin(catchments)]
+            filtered_parameters = read_divide_params(f'{self.input_dir}/deltat.csv', catchments)
 
         except FileNotFoundError as fnfe:
             logger.error(fnfe)
@@ -75,7 +75,7 @@ class TopoFlow:
             logger.error(error_str, exc)
             return error
 
-        divide_attr = get_hydrofabric_attributes(gpkg_file, version)
+        divide_attr = hydrofabric.divide_attributes()
 
         attr21 = {'slope':'slope_mean', 'aspect':'aspect_c_mean', 'elevation':'elevation_mean', 'lat':'Y','lon':'X'}
         attr22 = {'slope':'mean.slope', 'aspect':'circ_mean.aspect', 'elevation':'mean.elevation', 'lat':'centroid_y','lon':'centroid_y'}
@@ -89,7 +89,7 @@ class TopoFlow:
         # End   Build/Calc IPE files for topoflow
 
         # Write files to DB and S3
-        # uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list,
+        # uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list,
         #                                    module=self.module)
         uri = "s3://ngwpc-hydrofabric/2.2/CONUS/06710385_fake/PARAMS/USGS/TopoFlow_fake/2025_Jan_23_19_28_32"
         
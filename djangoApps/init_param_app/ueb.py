@@ -2,6 +2,7 @@ import os
 import logging
 import math
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import pyarrow.parquet as pq
@@ -9,6 +10,8 @@ import pyarrow as pa
 from ambiance import Atmosphere
 from .util.utilities import get_config, get_hydrofabric_input_attr_file, get_subset_dir_file_names
 from .util.enums import FileTypeEnum
+from .util.bmi_config import ConfigTemplate, carry_forward
+from .util.divide_params import read_divide_params
 from .hf_attributes import *
 
 logger = logging.getLogger(__name__)
@@ -133,43 +136,43 @@ class UEB:
                                       "longitude: A 2-D grid that contains the longitude at each grid\n"
                                       "0\n"
                                       "{longitude}")
+        self.sitevar_template = ConfigTemplate(self.sitevar_file_template)
 
-    def initial_parameters(self, gage_id, version, source, domain, subset_dir, gpkg_file, module_metadata, gage_file_mgmt):
+    def initial_parameters(self, gage_id, version, source, domain, sink, hydrofabric, module_metadata, gage_file_mgmt):
         """
         Builds initial parameter estimates (IPE) for UEB (Utah Energy Balance) Module
         :param gage_id: The gage ID, e.g., 06710385
         :param source: The gage provider or agency
         :param domain: The NWM region the gage belongs to (Ex CONUS)
-        :param subset_dir: Path to gage id directory where the module directory will be made.
-        :param gpkg_file:
+        :param sink: Output sink the module's config files are written to
+        :param hydrofabric:
         :param module_metadata: Dictionary containing URI, initial parameters, output variables
         :param gage_file_mgmt:
         :return: JSON output with cfg file URI, calibratable parameters initial values, output variables.
         """
         self.gage_id = gage_id
-        filename_list = []
 
         csv_path_filename = f'{self.input_dir}/ueb_deltat_{version}.csv'
 
         # Get list of catchments from gpkg divides layer using geopandas
         # TODO: This code needs to be moved to a geopackage file utility it is duplicated all over
         try:
-            divides_layer = gpd.read_file(gpkg_file, layer="divides")
+            divides_layer = hydrofabric.divides()
             try:
                 catchments = divides_layer["divide_id"].tolist()
             except:
                 # TODO: Replace 'except' with proper catch
-                error_str = 'Error reading divides layer in ' + gpkg_file
+                error_str = 'Error reading divides layer in ' + hydrofabric.gpkg_file
                 error = dict(error=error_str)
                 logger.error(error_str)
                 return error
         except:  # TODO: Replace 'except' with proper catch
-            error_str = 'Error opening ' + gpkg_file
+            error_str = 'Error opening ' + hydrofabric.gpkg_file
             error = dict(error=error_str)
             logger.error(error_str)
             return error
 
-        divide_attr = get_hydrofabric_attributes(gpkg_file, version, domain)
+        divide_attr = hydrofabric.divide_attributes()
 
         if len(divide_attr) == 0:
             error_str = 'No matching catchments in attribute file'
@@ -189,7 +192,7 @@ class UEB:
         #Temperature deltas are only available for CONUS (except for ENVCA).  Use defaults otherwise.
         if domain == 'CONUS' and source != 'ENVCA':
             try: 
-                parameters_df = pd.read_csv(csv_path_filename)
+                filtered_parameters = read_divide_params(csv_path_filename, catchments)
             except FileNotFoundError:
                 error_str = f'Temperature delta CSV file not found: {csv_path_filename}'
                 error = {'error': error_str}
@@ -201,7 +204,6 @@ class UEB:
                 logger.error(error_str)
                 return error   
 
-            filtered_parameters = parameters_df[parameters_df['divide_id'].isin(catchments)]
             if filtered_parameters.empty:
                 error_str = f'Catchments in geopackage not found in temperature delta CSV file'
                 error = {'error': error_str}
@@ -222,73 +224,53 @@ class UEB:
         
         #Set month temperature delta to the average if a catchment is NA.  The average
         #is taken monthy for all catchments in the csv file.
-        jan_temp_range = 11.04395
-        feb_temp_range = 11.79382
-        mar_temp_range = 12.72711
-        apr_temp_range = 13.67701
-        may_temp_range = 13.70334
-        jun_temp_range = 13.76782
-        jul_temp_range = 13.90212
-        aug_temp_range = 13.9958
-        sep_temp_range = 14.04895
-        oct_temp_range = 13.44001
-        nov_temp_range = 11.90162
-        dec_temp_range = 10.71597
+        temp_ranges = {'jan': 11.04395,
+                       'feb': 11.79382,
+                       'mar': 12.72711,
+                       'apr': 13.67701,
+                       'may': 13.70334,
+                       'jun': 13.76782,
+                       'jul': 13.90212,
+                       'aug': 13.9958,
+                       'sep': 14.04895,
+                       'oct': 13.44001,
+                       'nov': 11.90162,
+                       'dec': 10.71597}
 
-        #Loop through catchments, get soil type, populate config file template, write config file to temp 
-        for index, row in df_all.iterrows():
+        #If not CONUS or ENVCA, use defaults.  A catchment with NA takes the value of the previous catchment.
+        if domain == 'CONUS' and source != 'ENVCA':
+            for month, month_temp_ranges in self.get_monthly_temp_ranges(df_all).items():
+                temp_ranges[month] = carry_forward(month_temp_ranges, temp_ranges[month])
 
-            catchment_id = row['divide_id']
-            slpe = round(row[attr['slope']], 4)
-            aspct = round(row[attr['aspect']], 4)
-            lat = round(row[attr['lat']], 4)
-            lon = round(row[attr['lon']], 4)
-            elevation = round(row[attr['elevation']], 4)
-            standard_atm_pressure = round(Atmosphere(elevation).pressure[0], 4)
-            
-            #If not CONUS or ENVCA, use defaults
-            if domain == 'CONUS' and source != 'ENVCA':
-                temp_ranges = self.get_monthly_temp_ranges(row)
-                if not math.isnan(temp_ranges['jan']): jan_temp_range = temp_ranges['jan']
-                if not math.isnan(temp_ranges['feb']): feb_temp_range = temp_ranges['feb']
-                if not math.isnan(temp_ranges['mar']): mar_temp_range = temp_ranges['mar']
-                if not math.isnan(temp_ranges['apr']): apr_temp_range = temp_ranges['apr']
-                if not math.isnan(temp_ranges['may']): may_temp_range = temp_ranges['may']
-                if not math.isnan(temp_ranges['jun']): jun_temp_range = temp_ranges['jun']
-                if not math.isnan(temp_ranges['jul']): jul_temp_range = temp_ranges['jul']
-                if not math.isnan(temp_ranges['aug']): aug_temp_range = temp_ranges['aug']
-                if not math.isnan(temp_ranges['sep']): sep_temp_range = temp_ranges['sep']
-                if not math.isnan(temp_ranges['oct']): oct_temp_range = temp_ranges['oct']
-                if not math.isnan(temp_ranges['nov']): nov_temp_range = temp_ranges['nov']
-                if not math.isnan(temp_ranges['dec']): dec_temp_range = temp_ranges['dec']
+        #Get the catchment attributes, populate the config file template for all catchments, write config files to temp
+        elevation = round_values(df_all[attr['elevation']])
+        standard_atm_pressure = np.round(Atmosphere(np.array(elevation)).pressure, 4)
 
-            filename = self.sitevar_filename_template.format(catchment = catchment_id)
-            file_string = self.sitevar_file_template.format(std_atm_pressure = standard_atm_pressure, 
-                                                            slope = slpe,
-                                                            aspect = aspct, 
-                                                            latitude = lat, 
-                                                            longitude = lon, 
-                                                            jan_temp_range = jan_temp_range,
-                                                            feb_temp_range = feb_temp_range,
-                                                            mar_temp_range = mar_temp_range,
-                                                            apr_temp_range = apr_temp_range,
-                                                            may_temp_range = may_temp_range,
-                                                            jun_temp_range = jun_temp_range,
-                                                            jul_temp_range = jul_temp_range,
-                                                            aug_temp_range = aug_temp_range,
-                                                            sep_temp_range = sep_temp_range,
-                                                            oct_temp_range = oct_temp_range,
-                                                            nov_temp_range = nov_temp_range,
-                                                            dec_temp_range = dec_temp_range
-                                                            )
-            cfg_filename_path = os.path.join(subset_dir, filename)
-            with open(cfg_filename_path, 'w') as outfile:
-                outfile.write(file_string)
-            filename_list.append(filename)
+        file_strings = self.sitevar_template.render(std_atm_pressure = standard_atm_pressure,
+                                                    slope = round_values(df_all[attr['slope']]),
+                                                    aspect = round_values(df_all[attr['aspect']]),
+                                                    latitude = round_values(df_all[attr['lat']]),
+                                                    longitude = round_values(df_all[attr['lon']]),
+                                                    jan_temp_range = temp_ranges['jan'],
+                                                    feb_temp_range = temp_ranges['feb'],
+                                                    mar_temp_range = temp_ranges['mar'],
+                                                    apr_temp_range = temp_ranges['apr'],
+                                                    may_temp_range = temp_ranges['may'],
+                                                    jun_temp_range = temp_ranges['jun'],
+                                                    jul_temp_range = temp_ranges['jul'],
+                                                    aug_temp_range = temp_ranges['aug'],
+                                                    sep_temp_range = temp_ranges['sep'],
+                                                    oct_temp_range = temp_ranges['oct'],
+                                                    nov_temp_range = temp_ranges['nov'],
+                                                    dec_temp_range = temp_ranges['dec']
+                                                    )
+        filenames = [self.sitevar_filename_template.format(catchment = catchment_id)
+                     for catchment_id in df_all['divide_id'].tolist()]
+        filename_list = sink.write_files(filenames, file_strings)
             
         # Write files to DB and S3
-        uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, subset_dir, filename_list,
-                                            module=self.module)
+        uri = gage_file_mgmt.write_file_to_s3(gage_id, version, domain, FileTypeEnum.PARAMS, source, sink, filename_list,
+                                            module=self.module).uri
         status_str = "Config files written to:  " + uri
         logger.info(status_str)
 
@@ -297,19 +279,15 @@ class UEB:
         return module_metadata
         
             
-    def get_monthly_temp_ranges(self, row):
-        temp_ranges = {}
-        temp_ranges['jan'] = round(row['january'], 4)
-        temp_ranges['feb'] = round(row['february'], 4)
-        temp_ranges['mar'] = round(row['march'], 4)
-        temp_ranges['apr'] = round(row['april'], 4)
-        temp_ranges['may'] = round(row['may'], 4)
-        temp_ranges['jun'] = round(row['june'], 4)
-        temp_ranges['jul'] = round(row['july'], 4)
-        temp_ranges['aug'] = round(row['august'], 4)
-        temp_ranges['sep'] = round(row['september'], 4)
-        temp_ranges['oct'] = round(row['october'], 4)
-        temp_ranges['nov'] = round(row['november'], 4)
-        temp_ranges['dec'] = round(row['december'], 4)
+    def get_monthly_temp_ranges(self, df_all):
+        months = {'jan': 'january', 'feb': 'february', 'mar': 'march', 'apr': 'april', 'may': 'may', 'jun': 'june',
+                  'jul': 'july', 'aug': 'august', 'sep': 'september', 'oct': 'october', 'nov': 'november',
+                  'dec': 'december'}
+        return {month: pd.Series(round_values(df_all[column])) for month, column in months.items()}
+
 
-        return temp_ranges
\ No newline at end of file
+def round_values(values):
+    """
+    Rounds a column to 4 decimals with python's round, as UEB has always rounded each catchment's value
+    """
+    return [round(value, 4) for value in values.tolist()]
@@ -1,10 +1,15 @@
 from django.urls import path
-from .views import version, modules, return_geopackage, return_ipe, GetObservationalData, HFFilesCreate, HFFilesList, \
+from .views import version, modules, return_geopackage, return_ipe, return_ipe_batch, submit_ipe_job, ipe_job_status, \
+    ipe_job_result, GetObservationalData, HFFilesCreate, HFFilesList, \
     HFFilesDetail, HFFilesUpdate, HFFilesDelete
 
 urlpatterns = [
     path('hydrofabric/2.1/modules/', modules, name='modules'),
     path("hydrofabric/modules/parameters/", return_ipe, name='return_ipe'),
+    path("hydrofabric/modules/parameters/batch/", return_ipe_batch, name='return_ipe_batch'),
+    path("hydrofabric/modules/parameters/jobs/", submit_ipe_job, name='submit_ipe_job'),
+    path("hydrofabric/modules/parameters/jobs/<uuid:job_id>/", ipe_job_status, name='ipe_job_status'),
+    path("hydrofabric/modules/parameters/jobs/<uuid:job_id>/result/", ipe_job_result, name='ipe_job_result'),
     path("hydrofabric/geopackages", return_geopackage, name='return_geopackage'),
     path('hydrofabric/2.1/observational', GetObservationalData.as_view(), name='observationalDataQuery'),
     path('version/', version, name='version'),
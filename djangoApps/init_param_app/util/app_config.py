@@ -0,0 +1,228 @@
+"""
+Typed, validated and cached contents of config.yml and VERSION.
+
+Both files are read once per process.  The configuration is an immutable mapping, so the callers of get_config()
+keep using config['key'] and config.get('key', default), and the known keys are also typed attributes with their
+defaults (config.s3_upload_workers).  A SIGHUP reloads both files; objects already built from the configuration
+(pools, clients, caches) keep their settings until the process restarts.
+"""
+import logging
+import os
+import signal
+import threading
+from collections.abc import Mapping
+
+import yaml
+from django.conf import settings
+
+from .s3_existence_cache import s3_existence_cache
+
+logger = logging.getLogger(__name__)
+
+REQUIRED = object()
+
+# Type and default of the known config.yml keys, other keys are passed through unchecked
+CONFIG_SCHEMA = {
+    'input_dir': (str, REQUIRED),
+    'hydrofabric_dir': (str, REQUIRED),
+    'output_temp_dir': (str, None),
+    'hydrofabric_version': (str, None),
+    'hydrofabric_type': (str, REQUIRED),
+    'hydrofabric_conus_filename': (str, REQUIRED),
+    'hydrofabric_gl_filename': (str, None),
+    'hydrofabric_ak_filename': (str, None),
+    'hydrofabric_hi_filename': (str, None),
+    'hydrofabric_prvi_filename': (str, None),
+    's3url': (str, REQUIRED),
+    'region': (str, REQUIRED),
+    'subsetter_engine': (str, 'R'),
+    'rscript_path': (str, '/usr/bin/Rscript'),
+    'subsetter_pool_size': (int, 2),
+    'subsetter_job_timeout': (float, 1800.0),
+    'subsetter_startup_timeout': (float, 300.0),
+    'upstream_index_dir': (str, None),
+    'gage_index_file': (str, None),
+    'ipe_output_sink': (str, 'memory'),
+    'ipe_archive_format': (str, 'zip'),
+    's3_upload_workers': (int, 8),
+    's3_upload_retries': (int, 3),
+    's3_pool_size': (int, 32),
+    's3_exists_ttl': (float, 900.0),
+    's3_missing_ttl': (float, 60.0),
+    's3_reconcile_interval': (float, 0.0),
+    'ipe_job_workers': (int, 2),
+    'ipe_job_max_age': (float, 21600.0),
+    'ipe_batch_workers': (int, 4),
+    'ipe_module_workers': (int, 4),
+    'workspace_root': (str, None),
+    'workspace_tmpfs_root': (str, None),
+    'workspace_quota_mb': (int, None),
+    'workspace_max_age': (float, 21600.0),
+    'workspace_janitor_interval': (float, 0.0),
+    'reload_on_sighup': (bool, True),
+    'module_metadata_check_interval': (float, 60.0),
+}
+
+
+class ConfigError(ValueError):
+    """config.yml is missing a required key or has a value of the wrong type"""
+
+
+def _validate(key, value, value_type):
+    if value is None:
+        return None
+    if value_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if value_type is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Unquoted versions and regions read as numbers
+        return str(value)
+    if not isinstance(value, value_type) or (value_type is int and isinstance(value, bool)):
+        raise ConfigError(f"config.yml {key} must be of type {value_type.__name__}, not {type(value).__name__}")
+    return value
+
+
+class AppConfig(Mapping):
+    """
+    Immutable contents of config.yml
+    """
+
+    def __init__(self, values):
+        """
+        :param values: Dictionary read from config.yml
+        """
+        if not isinstance(values, dict):
+            raise ConfigError("config.yml must contain a mapping of keys to values")
+        checked = dict(values)
+        for key, (value_type, default) in CONFIG_SCHEMA.items():
+            if key in checked:
+                checked[key] = _validate(key, checked[key], value_type)
+            elif default is REQUIRED:
+                raise ConfigError(f"config.yml is missing {key}")
+        self._values = checked
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            return cls(yaml.safe_load(file))
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getattr__(self, key):
+        # Typed access to the known keys, with their defaults
+        if key.startswith('_') or key not in CONFIG_SCHEMA:
+            raise AttributeError(key)
+        value = self._values.get(key)
+        if value is None:
+            default = CONFIG_SCHEMA[key][1]
+            return None if default is REQUIRED else default
+        return value
+
+    def __repr__(self):
+        return f"AppConfig({self._values!r})"
+
+
+def _project_file(filename):
+    # Files at the root of the project, the grandparent directory of BASE_DIR
+    return os.path.join(os.path.dirname(settings.BASE_DIR), filename)
+
+
+_config = None
+_api_version = None
+_lock = threading.Lock()
+# Set by the SIGHUP handler, the reload is done by the next load_config() outside of the handler
+_reload_requested = False
+
+
+def _reload_if_requested():
+    global _reload_requested
+    if _reload_requested:
+        _reload_requested = False
+        reload_config()
+
+
+def load_config():
+    """
+    :return: The AppConfig of the process, loaded from config.yml on first use
+    """
+    global _config
+    _reload_if_requested()
+    config = _config
+    if config is None:
+        with _lock:
+            if _config is None:
+                _config = AppConfig.load(_project_file("config.yml"))
+                _configure_process(_config)
+            config = _config
+    return config
+
+
+def _configure_process(config):
+    # Settings of the process-wide caches, applied once when config.yml is first loaded
+    s3_existence_cache.ttl = config.s3_exists_ttl
+    s3_existence_cache.negative_ttl = config.s3_missing_ttl
+
+
+def load_api_version():
+    """
+    :return: The content of VERSION as stored with the HFFILES rows, read on first use
+    """
+    global _api_version
+    _reload_if_requested()
+    api_version = _api_version
+    if api_version is None:
+        with _lock:
+            if _api_version is None:
+                with open(_project_file("VERSION"), 'r') as file:
+                    _api_version = file.read()
+            api_version = _api_version
+    return api_version
+
+
+def reload_config():
+    """
+    Reads config.yml and VERSION again, an invalid config.yml leaves the loaded configuration in place
+    :return: True if reloaded
+    """
+    global _config, _api_version
+    try:
+        config = AppConfig.load(_project_file("config.yml"))
+    except (OSError, yaml.YAMLError, ConfigError) as exception:
+        logger.error(f"config.yml not reloaded - {exception}")
+        return False
+    with _lock:
+        _config = config
+        _api_version = None
+    logger.info("config.yml reloaded")
+    return True
+
+
+def install_reload_handler():
+    """
+    Reloads the configuration on SIGHUP, unless reload_on_sighup is false, by the next load_config().  A handler
+    installed before is still called.  Signal handlers can only be installed by the main thread.
+    :return: True if installed
+    """
+    if not hasattr(signal, 'SIGHUP') or not load_config().reload_on_sighup:
+        return False
+    previous = signal.getsignal(signal.SIGHUP)
+
+    def handle_sighup(signum, frame):
+        # The handler can interrupt the main thread while it holds _lock, it only requests the reload
+        global _reload_requested
+        _reload_requested = True
+        if callable(previous):
+            previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGHUP, handle_sighup)
+    except ValueError:
+        logger.warning("SIGHUP configuration reload not installed outside of the main thread")
+        return False
+    return True
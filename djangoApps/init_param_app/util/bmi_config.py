@@ -0,0 +1,100 @@
+import string
+
+import numpy as np
+import pandas as pd
+
+
+# Types of a field binding taken as one value per catchment, anything else is a constant
+PER_CATCHMENT_TYPES = (pd.Series, pd.Index, np.ndarray, list, tuple)
+
+
+def as_python_scalar(value):
+    """
+    Numpy scalars as the python scalars DataFrame.iterrows and Series.tolist give, other values unchanged
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def format_values(values, format_spec='', conversion=None):
+    """
+    Formats a list of values as str.format formats a replacement field, str() when there is no format spec
+    """
+    if conversion == 'r':
+        values = map(repr, values)
+    elif conversion == 'a':
+        values = map(ascii, values)
+    if not format_spec:
+        return list(map(str, values))
+    return [format(value, format_spec) for value in values]
+
+
+class ConfigTemplate:
+    """
+    Text of a BMI config file with str.format style {field} placeholders, rendered for all catchments at once.
+
+    Each field is bound to a constant or to one value per catchment (a DataFrame column, an array or a list).
+    Columns are converted to python scalars with tolist(), so numbers are formatted exactly as the module writers
+    formatted the values of DataFrame.iterrows rows.  Constants are formatted once, and each catchment's file is
+    a single %-format of the pre-formatted values.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.fields = []
+        self._segments = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(text):
+            self._segments.append((literal, field, format_spec, conversion))
+            if field is not None and field not in self.fields:
+                self.fields.append(field)
+
+    def render(self, **bindings):
+        """
+        Renders the file content of every catchment
+
+        :param bindings: Value of each template field, a constant or a sequence with one value per catchment
+        :return: List of the file contents in catchment order
+        :raises KeyError: A template field is not bound
+        :raises ValueError: The per catchment sequences differ in length
+        """
+        pattern = []
+        columns = []
+        for literal, field, format_spec, conversion in self._segments:
+            pattern.append(literal.replace('%', '%%'))
+            if field is None:
+                continue
+            value = bindings[field]
+            if isinstance(value, PER_CATCHMENT_TYPES):
+                values = value.tolist() if hasattr(value, 'tolist') else [as_python_scalar(v) for v in value]
+                columns.append(format_values(values, format_spec, conversion))
+                pattern.append('%s')
+            else:
+                formatted = format_values([as_python_scalar(value)], format_spec, conversion)[0]
+                pattern.append(formatted.replace('%', '%%'))
+        pattern = ''.join(pattern)
+
+        if not columns:
+            return [pattern % ()]
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError('Template fields are bound to a different number of catchments')
+        return [pattern % values for values in zip(*columns)]
+
+
+def escape_template_text(text):
+    """
+    Escapes literal text for use in a ConfigTemplate
+    """
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+def carry_forward(values, default):
+    """
+    Fills the NA values of a parameter column the way the module writers always have:  an NA catchment takes
+    the value of the previous catchment, or the default before the first catchment with a value.
+
+    :param values: Series of parameter values in catchment order
+    :return: Series without NA values
+    """
+    return values.ffill().fillna(default)
+
@@ -0,0 +1,24 @@
+"""
+Coupling of the modules of an IPE request.
+
+The param files of some modules depend on the other modules requested with them, e.g. CFE-S sets is_sft_coupled
+when SFT is requested.  Their HFFILES rows record a coupling key, the co-requested modules they were calculated
+with, so a cached module is only reused by requests with the same coupling.
+"""
+
+# Modules whose param files depend on other requested modules, and the modules they depend on
+MODULE_COUPLINGS = {
+    'CFE-S': ('SFT',),                              # is_sft_coupled
+    'LASAM': ('SFT',),                              # sft_coupled
+    'SFT': ('CFE-S',),                              # ice fraction scheme
+    'SMP': ('CFE-S', 'CFE-X', 'TopModel', 'LASAM'),  # soil storage model and ice fraction scheme
+}
+
+
+def coupling_key(module, modules):
+    """
+    :param module: Module name, e.g. CFE-S
+    :param modules: All modules of the request
+    :return: Sorted, comma separated modules of the request the module's param files depend on, blank if none
+    """
+    return ','.join(sorted(set(MODULE_COUPLINGS.get(module, ())).intersection(modules)))
@@ -0,0 +1,100 @@
+"""
+Columnar store of the per-divide parameter CSV files of the module writers.
+
+The CSV inputs (CFE-X, Snow-17, Sac-SMA, UEB and TopoFlow parameters) cover a whole domain while a request needs the
+divides of its subset.  The convert_divide_params command writes each CSV next to itself as Parquet, sorted by
+divide_id with small row groups, so the min/max statistics of a row group let the reader skip every group without a
+requested divide.  The original row number of each divide is kept, the reader returns the same frame, with the same
+index and row order, as reading the CSV and filtering it with isin.  When the Parquet file is missing or older than
+its CSV the CSV is read as before.
+"""
+import glob
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+DIVIDE_COLUMN = 'divide_id'
+# Row number of the divide in the CSV file
+ROW_COLUMN = '__csv_row'
+# Divides per row group, small enough that a subset reads a few groups of a domain
+DEFAULT_ROW_GROUP_SIZE = 16384
+
+# Parameter CSV files of the module writers in input_dir
+DIVIDE_PARAM_CSV_PATTERNS = ['CFE-X_params_*.csv', 'snow17_params_*.csv', 'sac_sma_params_*.csv',
+                             'ueb_deltat_*.csv', 'deltat.csv']
+
+
+def parquet_filename(csv_filename):
+    """
+    :return: Path of the Parquet file converted from a CSV file
+    """
+    return os.path.splitext(csv_filename)[0] + '.parquet'
+
+
+def find_divide_param_csvs(input_dir):
+    """
+    :return: Sorted paths of the parameter CSV files in input_dir
+    """
+    paths = set()
+    for pattern in DIVIDE_PARAM_CSV_PATTERNS:
+        paths.update(glob.glob(os.path.join(input_dir, pattern)))
+    return sorted(paths)
+
+
+def convert_divide_csv(csv_filename, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Writes the Parquet file of a parameter CSV file, replacing an existing one atomically
+    :param csv_filename: Path of the CSV file, with a divide_id column
+    :param row_group_size: Rows per row group
+    :return: Path of the Parquet file and its number of rows
+    """
+    parameters_df = pd.read_csv(csv_filename)
+    if DIVIDE_COLUMN not in parameters_df.columns:
+        raise ValueError(f"{csv_filename} has no {DIVIDE_COLUMN} column")
+    parameters_df[ROW_COLUMN] = parameters_df.index.to_numpy(dtype='int64')
+    parameters_df = parameters_df.sort_values([DIVIDE_COLUMN, ROW_COLUMN], kind='stable')
+
+    table = pa.Table.from_pandas(parameters_df, preserve_index=False)
+    parquet_file = parquet_filename(csv_filename)
+    temp_file = parquet_file + '.tmp'
+    pq.write_table(table, temp_file, row_group_size=row_group_size, write_statistics=True, compression='zstd')
+    os.replace(temp_file, parquet_file)
+    logger.info(f"{csv_filename} converted to {parquet_file}, {table.num_rows} rows in "
+                f"{pq.ParquetFile(parquet_file).num_row_groups} row groups")
+    return parquet_file, table.num_rows
+
+
+def _parquet_is_current(csv_filename, parquet_file):
+    if not os.path.exists(parquet_file):
+        return False
+    return not os.path.exists(csv_filename) or os.path.getmtime(parquet_file) >= os.path.getmtime(csv_filename)
+
+
+def read_divide_params(csv_filename, catchments):
+    """
+    Reads the parameters of the requested divides
+    :param csv_filename: Path of the parameter CSV file
+    :param catchments: List of divide ids
+    :return: DataFrame of the rows of the divides, in CSV order and indexed by their CSV row number
+    :raises FileNotFoundError: When neither the CSV nor its Parquet file exist
+    """
+    parquet_file = parquet_filename(csv_filename)
+    if not _parquet_is_current(csv_filename, parquet_file):
+        parameters_df = pd.read_csv(csv_filename)
+        return parameters_df[parameters_df[DIVIDE_COLUMN].isin(catchments)]
+
+    catchments = list(catchments)
+    if catchments:
+        # Only the row groups whose divide_id range holds a requested divide are read
+        table = pq.read_table(parquet_file, filters=[(DIVIDE_COLUMN, 'in', catchments)], memory_map=True)
+    else:
+        table = pq.read_schema(parquet_file).empty_table()
+    parameters_df = table.to_pandas()
+    parameters_df = parameters_df.sort_values(ROW_COLUMN).set_index(ROW_COLUMN)
+    parameters_df.index.name = None
+    return parameters_df
@@ -3,12 +3,11 @@ This module manages files that have a gage dependency for CRUD DB operations and
 """
 import os
 import logging
-import requests
-import json
-from datetime import datetime, timezone
-from minio import Minio, S3Error
+from minio import S3Error
 from minio.deleteobjects import DeleteObject
 from .utilities import get_config
+from .minio_client import get_minio_client, DEFAULT_POOL_SIZE
+from .s3_existence_cache import s3_existence_cache, OBJECT, PREFIX
 from django.conf import settings
 from urllib.parse import urlparse
 
@@ -28,112 +27,19 @@ class FileManagement:
             os.environ.get('AWS_DEFAULT_REGION') or
             'us-east-1'
         )
-        self.s3_path = None
-        self.full_s3_path = None
-        self.input_filename = None
-        self.input_path = None
+        # Concurrent uploads and retries per object of write_file_to_s3
+        self.upload_workers = config.get('s3_upload_workers', 8)
+        self.upload_retries = config.get('s3_upload_retries', 3)
+        self.pool_size = max(config.get('s3_pool_size', DEFAULT_POOL_SIZE), self.upload_workers)
         self.client = None
-        self._credentials = None
-        self._credentials_expiry = None
-
-    def _get_imds_token(self):
-        """Get IMDSv2 token for subsequent requests"""
-        try:
-            response = requests.put(
-                "http://169.254.169.254/latest/api/token",
-                headers={"X-aws-ec2-metadata-token-ttl-seconds": "21600"},
-                timeout=2
-            )
-            return response.text if response.ok else None
-        except requests.RequestException:
-            logger.debug("Unable to fetch IMDSv2 token - not running on EC2?")
-            return None
-
-    def _get_instance_credentials(self):
-        """Fetch credentials from IMDSv2"""
-        token = self._get_imds_token()
-        if not token:
-            return None
-
-        try:
-            # Get role name
-            role_response = requests.get(
-                "http://169.254.169.254/latest/meta-data/iam/security-credentials/",
-                headers={"X-aws-ec2-metadata-token": token},
-                timeout=2
-            )
-            if not role_response.ok:
-                return None
-
-            role_name = role_response.text
-
-            # Get credentials
-            creds_response = requests.get(
-                f"http://169.254.169.254/latest/meta-data/iam/security-credentials/{role_name}",
-                headers={"X-aws-ec2-metadata-token": token},
-                timeout=2
-            )
-            if not creds_response.ok:
-                return None
-
-            creds = creds_response.json()
-            return {
-                'access_key': creds['AccessKeyId'],
-                'secret_key': creds['SecretAccessKey'],
-                'session_token': creds['Token'],
-                'expiry': datetime.strptime(creds['Expiration'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
-            }
-        except (requests.RequestException, json.JSONDecodeError, KeyError) as e:
-            logger.debug(f"Error fetching instance credentials: {e}")
-            return None
-
-    def _get_credentials(self):
-        """Get credentials from environment or instance metadata"""
-        # First check environment variables
-        access_key = os.environ.get("AWS_ACCESS_KEY_ID")
-        secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
-        session_token = os.environ.get("AWS_SESSION_TOKEN")
-
-        if access_key and secret_key:
-            logger.debug("Using AWS credentials from environment variables")
-            return {
-                'access_key': access_key,
-                'secret_key': secret_key,
-                'session_token': session_token
-            }
-
-        # Then try instance metadata
-        logger.debug("Attempting to fetch credentials from instance metadata")
-        return self._get_instance_credentials()
-
-    def _should_refresh_credentials(self):
-        """Check if credentials need refreshing"""
-        if not self._credentials or not self._credentials_expiry:
-            return True
-        # Refresh if within 5 minutes of expiry
-        return (self._credentials_expiry - datetime.now(timezone.utc)).total_seconds() < 300
 
     def start_minio_client(self):
-        if self.client is None or (self._credentials and self._should_refresh_credentials()):
-            credentials = self._get_credentials()
-
-            if credentials:
-                logger.debug("Creating Minio client with credentials")
-                self.client = Minio(
-                    self.s3_url,
-                    access_key=credentials['access_key'],
-                    secret_key=credentials['secret_key'],
-                    session_token=credentials.get('session_token'),
-                    region=self.region
-                )
-                self._credentials = credentials
-                self._credentials_expiry = credentials.get('expiry')
-            else:
-                logger.warning("No credentials available - operations may fail")
-                self.client = Minio(
-                    self.s3_url,
-                    region=self.region
-                )
+        """
+        Uses the process-wide Minio client, its connection pool and credentials are shared by all instances and
+        the credentials are refreshed in the background
+        """
+        if self.client is None:
+            self.client = get_minio_client(self.s3_url, self.region, self.pool_size)
 
     def check_s3_bucket(self):
         self.start_minio_client()
@@ -144,12 +50,20 @@ class FileManagement:
         return bucket_exists
 
     def s3_file_exists(self, object_name):
+        """
+        Checks an object exists, answered from the existence cache when the object was checked recently
+        """
+        object_name = object_name.removeprefix(self.s3_uri)
+        exists = s3_existence_cache.get(OBJECT, object_name)
+        if exists is not None:
+            return exists
         try:
-            object_name = object_name.removeprefix(self.s3_uri)
             self.client.stat_object(self.s3_bucket, object_name)
+            s3_existence_cache.set(OBJECT, object_name, True)
             return True
         except S3Error as s3_error:
             if s3_error.code == 'NoSuchKey':
+                s3_existence_cache.set(OBJECT, object_name, False)
                 return False
             else:
                 logger.error(f"Error checking if file exists: {s3_error}")
@@ -158,17 +72,21 @@ class FileManagement:
             logger.error(f"Unhandled exception caught - {exception}")
             return False
 
-    def write_minio(self):
-        # Ensure credentials are fresh before writing
-        self.start_minio_client()
-        s3_path_output = self.s3_path + '/' + self.input_filename
-        try:
-            self.client.fput_object(self.s3_bucket, s3_path_output, self.input_path + self.input_filename)
-            self.full_s3_path = "s3://" + self.s3_bucket + "/" + s3_path_output
-            status_string = "Hydrofabric data written to " + s3_path_output
-            logger.info(status_string)
-        except Exception as exception:
-            logger.error(f"Unhandled exception caught - {exception}")
+    def s3_prefix_exists(self, prefix):
+        """
+        Checks at least one object exists below a prefix, answered from the existence cache when the prefix was
+        checked recently
+        """
+        prefix = prefix.removeprefix(self.s3_uri)
+        exists = s3_existence_cache.get(PREFIX, prefix)
+        if exists is not None:
+            return exists
+        exists = False
+        for obj in self.client.list_objects(self.s3_bucket, prefix=prefix, recursive=False):
+            exists = True  # Found at least one object in the folder
+            break
+        s3_existence_cache.set(PREFIX, prefix, exists)
+        return exists
 
     def retrieve_minio(self, object_name, local_dir):
         self.start_minio_client()
@@ -182,13 +100,14 @@ class FileManagement:
             logger.error(f"Error downloading file: {e}")
 
     def remove_minio_dir(self, uri):
+        """
+        Deletes the objects below an S3 folder, the folders next to it are left alone
+        :param uri: S3 URI of the folder
+        """
         # Delete using "remove_objects"
         parsed_uri = urlparse(uri)
         bucket_name = parsed_uri.netloc
-        folder_name = parsed_uri.path.lstrip('/')
-        # Get module name from folder_name
-        module_name = folder_name.split('/')[6]
-        folder_name = folder_name.split(module_name)[0].rstrip('/')
+        folder_name = parsed_uri.path.strip('/') + '/'
 
         delete_object_list = map(
             lambda x: DeleteObject(x.object_name),
@@ -198,6 +117,7 @@ class FileManagement:
         # Handle potential errors during deletion
         for error in errors:
             logger.error("Error occurred while deleting object:", error)
+        s3_existence_cache.invalidate(folder_name)
         
         #objects_to_delete = self.client.list_objects(bucket_name, prefix=folder_name, recursive=True)
         #objects_to_delete = [x.object_name for x in objects_to_delete]
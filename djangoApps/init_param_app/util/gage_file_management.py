@@ -5,38 +5,38 @@ import os
 from datetime import datetime
 from os.path import join
 import shutil
+import time
+from collections import namedtuple
 from django.conf import settings
 from django.utils import timezone
+from django.db import connection
 import logging
 
 from .enums import FileTypeEnum
+from .coupling import coupling_key
 from ..models import HFFiles
 
 logger = logging.getLogger(__name__)
 
 from .file_management import FileManagement
-from .utilities import get_api_version
+from .output_sink import OutputSink, DirectorySink
+from .s3_uploader import S3Uploader
+from .s3_existence_cache import s3_existence_cache, reconcile, start_reconciler
+from .utilities import get_api_version, get_config
+from .workspace import current_workspace
+
+# Outcome of a write_file_to_s3 call.  hffiles_id is None when nothing was recorded, i.e. the upload failed.
+WriteResult = namedtuple('WriteResult', ['uri', 'hffiles_id', 'bytes', 'upload_seconds', 'elapsed', 'upload_report'])
 
 
 class GageFileManagement(FileManagement):
 
     def __init__(self):
         """
-        gageid: The gage the data was requested for
-        data_type: The type of data retrieved (Ex. Observational, Forcing)
-        source: Source of the dat (Ex USGS, USARC, Tx DOT, AORC, Legacy_AORC)
-        domain: Domain of the gage (CONUS, Alaska, Hawaii, Puerto Rico, American Virgin Islands)
+        Holds no per-call state, one instance can serve concurrent lookups and writes.  Every write returns a
+        WriteResult.
         """
         super().__init__()
-        self.gage_id = None
-        self.hydro_version = None
-        self.domain = None
-        self.data_type = None
-        self.source = None
-        self.module = None
-        self.formatted_datetime = None
-        self.input_path = None
-        self.db_object = None
         self.current_api_version = get_api_version()
 
     def __check_api_version(self, api_version):
@@ -47,27 +47,35 @@ class GageFileManagement(FileManagement):
         """
         return api_version is not None and self.current_api_version == api_version
 
-    def __build_s3_param_path(self):
-        """
-        Private method to build a S3 path for a param data file
-        """
-        self.s3_path = join(self.hydro_version, self.domain, self.gage_id, self.data_type, self.source, self.module, self.formatted_datetime)
-        logger.debug(self.s3_path)
-
-    def __build_s3_data_path(self):
+    @staticmethod
+    def __build_s3_path(gage_id, version, domain, data_type, source, module, coupling, formatted_datetime):
         """
-        Private method to build a S3 path for a data file
+        Private method to build a S3 path for a data file, or for the param data files of a module.  The files of a
+        coupled module go to a folder of their coupling, apart from the files of the module calculated alone.
         """
-        self.s3_path = join(self.hydro_version, self.domain, self.gage_id, self.data_type, self.source, self.formatted_datetime)
+        if module is not None and coupling:
+            s3_path = join(version, domain, gage_id, data_type, source, module,
+                           'coupled_' + coupling.replace(',', '_'), formatted_datetime)
+        elif module is not None:
+            s3_path = join(version, domain, gage_id, data_type, source, module, formatted_datetime)
+        else:
+            s3_path = join(version, domain, gage_id, data_type, source, formatted_datetime)
+        logger.debug(s3_path)
+        return s3_path
 
     def get_local_temp_directory(self, data_type, gage_id=None):
         """
         Builds a local directory to put created data files into, prior to being transferred S3 and the HFFILES table.
-        Creates directory if not present
+        Creates directory if not present, in the workspace of the request if there is one
         :param data_type: The type of data retrieved (Ex. GEOPACKAGE, Observational, Forcing ... etc)
         :param gage_id: The gage the directory was requested for
         :return: String of a local directory to use for temp file storage
         """
+        # Requests work in a workspace of their own, the shared directories are only used outside of one
+        workspace = current_workspace()
+        if workspace is not None:
+            return workspace.directory(data_type, gage_id)
+
         path_string = f"data/{data_type}/" if gage_id is None else f"data/{data_type}/{gage_id}/"
         
         grandparent_dir = os.path.dirname(settings.BASE_DIR)
@@ -93,23 +101,36 @@ class GageFileManagement(FileManagement):
             except Exception as e:
                 logger.error(f"Error deleting directory '{directory}': {e}")       
 
-    def param_files_exists(self, version, gage_id, domain, source, data_type, modules):
+    def param_files_exists(self, gage_id, version, domain, source, data_type, modules):
         """
-        Go through the list of modules and determine if files have already been calculated. Return list of modules to 
-        be computed
-        Example of return ["CFE-S", "CFE-X"]
-        TODO Flush this method out for each module return dict of found data this might return the pre-calculated JSON from DB
+        Go through the list of modules and determine if files have already been calculated, with one HFFILES query
+        for all of them.  A module's files are only reused when calculated with the same coupling, see util.coupling.
+        Return list of modules to be computed and the pre-calculated JSON of the others
+        Example of return (["CFE-S"], {"CFE-X": "<ipe json>"})
         
         :param gage_id: The gage the data was requested for
         :param domain: Domain of the gage (CONUS, Alaska, Hawaii, Puerto Rico, American Virgin Islands)
         :param source: Source or Agency owning the gage (Ex USGS, USARC, Env Canada ... etc)
         :param data_type: The type of data retrieved (Ex. GEOPACKAGE, Observational, Forcing ... etc)
         :param modules: List of modules to check against (Ex. CFE-S, CFE-X, NOAH-OWP-MODULAR, T-Route ... etc)
-        :return: The existence of param files
+        :return: The modules to compute and a dictionary of module to ipe json document of the modules found
         """
-        # For now return modules until the function is flushed out
-        #result = {}
-        return modules
+        module_rows = {}
+        my_data = HFFiles.objects.filter(gage_id=gage_id, source=source, domain=domain, module_id__in=modules, data_type=data_type, hydrofabric_version=version).order_by('-id').values()
+        # The latest row of a module and coupling is used
+        for row in my_data:
+            if row.get('coupling_key') == coupling_key(row['module_id'], modules):
+                module_rows.setdefault(row['module_id'], row)
+
+        found_modules = {}
+        for module, row in module_rows.items():
+            file_found, ipe_json = self.__check_ipe_row(gage_id, version, domain, source, module, row)
+            if file_found:
+                found_modules[module] = ipe_json
+
+        modules_to_calculate = [module for module in modules if module not in found_modules]
+        logger.debug(f"Param files found for {list(found_modules)}, to calculate {modules_to_calculate}")
+        return modules_to_calculate, found_modules
 
     def file_exists(self, gage_id, version, domain, source, data_type):
         """
@@ -143,7 +164,7 @@ class GageFileManagement(FileManagement):
                 results = dict(uri=uri)
         return file_found, results
 
-    def ipe_files_exists(self, gage_id, version, domain, source, module):
+    def ipe_files_exists(self, gage_id, version, domain, source, module, coupling=''):
         """
         Determines if ipe data files exists in S3 and in HFFILES table and matches the API_Version
         :param gage_id: The gage the data was requested for
@@ -151,124 +172,175 @@ class GageFileManagement(FileManagement):
         :param domain: Domain of the gage (CONUS, Alaska, Hawaii, Puerto Rico, American Virgin Islands)
         :param source: Source or Agency owning the gage (Ex USGS, USARC, Env Canada ... etc)
         :param module: The module to check for.
+        :param coupling: Coupling key of the module in the request, see util.coupling
 
         :return: If the information matches the API_Version and files exists in DB and S3 then return the ipe json document
         """
         file_found = False
         results = None
         data_type = FileTypeEnum.PARAMS
-        my_data = HFFiles.objects.filter(gage_id=gage_id, source=source, domain=domain, module_id=module, data_type=FileTypeEnum.PARAMS, hydrofabric_version=version).values()
+        my_data = HFFiles.objects.filter(gage_id=gage_id, source=source, domain=domain, module_id=module, data_type=FileTypeEnum.PARAMS, hydrofabric_version=version, coupling_key=coupling).order_by('-id').values()
 
         if not my_data:
-            log_string = f"Database missing entry for gage_id - {gage_id}, module - {module}, data type - {data_type}, source -  {source}, domain - {domain}."
+            log_string = f"Database missing entry for gage_id - {gage_id}, module - {module}, coupling - {coupling}, data type - {data_type}, source -  {source}, domain - {domain}."
             logger.debug(log_string)
         else:
-            # Check api_version from DB call with current api version
-            uri = my_data[0].get('uri')
-            # start MinIO client if not started
-            self.start_minio_client()
-            if self.__check_api_version(my_data[0].get('api_version')):
-                # Check S3 for file from DB call.
-                # Return file URL in schema dict
-                ipe_json = my_data[0].get('ipe_json')
-                # start MinIO client if not started
-                self.start_minio_client()
-                # Check S3 for file from DB call.
-                # Return file URL in schema dict
-                uri_stripped = uri.split(self.s3_bucket)[1].lstrip('/')
-
-                objects = self.client.list_objects(self.s3_bucket, prefix=uri_stripped, recursive=False)
-                for obj in objects:
-                    file_found = True  # Found at least one object in the folder
-                    break
-
-                if not file_found:
-                    log_string = f"S3 bucket missing gage_id - {gage_id}, data type - {data_type}, module - {module}, source -  {source}, domain - {domain}. Database entry uri is {uri}. Also might be an AWS S3 Credentials issue"
-                    logger.error(log_string)
-                else:
-                    file_found = True
-                    results = ipe_json
+            file_found, results = self.__check_ipe_row(gage_id, version, domain, source, module, my_data[0])
+
+        return file_found, results
+
+    def __check_ipe_row(self, gage_id, version, domain, source, module, row):
+        """
+        Private method checking the HFFILES row of a module's ipe files matches the API_Version and the files exist
+        in S3.  The row and its files are deleted when the API_Version changed.
+        :param row: The HFFILES row, as a values() dictionary
+        :return: If the files are found and the ipe json document
+        """
+        file_found = False
+        results = None
+        data_type = FileTypeEnum.PARAMS
+        # Check api_version from DB call with current api version
+        uri = row.get('uri')
+        # start MinIO client if not started
+        self.start_minio_client()
+        if self.__check_api_version(row.get('api_version')):
+            ipe_json = row.get('ipe_json')
+            # Check S3 for file from DB call.
+            # Return file URL in schema dict
+            uri_stripped = uri.split(self.s3_bucket)[1].lstrip('/')
+            file_found = self.s3_prefix_exists(uri_stripped)
 
+            if not file_found:
+                log_string = f"S3 bucket missing gage_id - {gage_id}, data type - {data_type}, module - {module}, source -  {source}, domain - {domain}. Database entry uri is {uri}. Also might be an AWS S3 Credentials issue"
+                logger.error(log_string)
             else:
-                # Delete DB entry and S3 entry if exists
-                self.remove_minio_dir(uri)
-                # Because Django Models will not allow a call to delete() after .values() or .values_list()
-                # need to re-run the filter
-                my_data = HFFiles.objects.filter(gage_id=gage_id, source=source, domain=domain, module_id=module, data_type=FileTypeEnum.PARAMS, hydrofabric_version=version) 
-                my_data.delete()
+                file_found = True
+                results = ipe_json
+
+        else:
+            # Delete DB entry and S3 entry if exists, only the files of the row:  its folder, or the folder of its
+            # archive.  The files of the other couplings and of newer rows are in folders of their own.
+            folder_uri = uri.removesuffix('/' + row['filename']) if row.get('filename') else uri
+            self.remove_minio_dir(folder_uri)
+            # Because Django Models will not allow a call to delete() after .values() or .values_list()
+            # need to re-run the filter, on the row's id
+            HFFiles.objects.filter(id=row['id']).delete()
 
         return file_found, results
 
-    def write_file_to_s3(self, gage_id, version, domain, data_type, source, input_directory, input_filenames, module=None):
+    def write_file_to_s3(self, gage_id, version, domain, data_type, source, input_directory, input_filenames, module=None,
+                         coupling=None):
         """
 
         :param module:
+        :param coupling: Coupling key of the module in the request, see util.coupling.  Recorded with the files.
         :param gage_id: The gage the data was requested for
         :param domain: Domain of the gage (CONUS, Alaska, Hawaii, Puerto Rico, American Virgin Islands)
         :param source: Source or Agency owning the gage (Ex USGS, USARC, Env Canada ... etc)
         :param data_type: The type of data retrieved (Ex. GEOPACKAGE, Observational, Forcing ... etc)
-        :param input_directory: Directory where local files are stored
-        :param input_filenames:  List of filenames of one or more locally created files
-        :return:
-        :raises  S3Exception:
+        :param input_directory: Directory where local files are stored, or the OutputSink holding the files
+        :param input_filenames:  List of filenames of one or more locally created files, ignored for an OutputSink
+        :return: WriteResult with the S3 URI of the file, or of the folder of a module's files.  No HFFILES row is
+                 saved when an upload failed.
+        :raises ValueError: When a data file write has no file, its uri is the uploaded file
 
         """
-        self.gage_id = gage_id
-        self.hydro_version = version
-        self.domain = domain
-        self.data_type = data_type
-        self.source = source
-        self.input_path = input_directory
-        self.module = module
+        start = time.perf_counter()
+        if isinstance(input_directory, OutputSink):
+            sink = input_directory
+        else:
+            sink = DirectorySink.from_files(input_directory, input_filenames)
+        if module is None and not sink.filenames:
+            raise ValueError(f"No {data_type} file to write for gage_id - {gage_id}")
 
         # Get the current date and time
         now = timezone.now().replace(microsecond=0)
         # Format the date and time as a string
-        self.formatted_datetime = now.strftime("%Y_%b_%d_%H_%M_%S")
+        formatted_datetime = now.strftime("%Y_%b_%d_%H_%M_%S")
 
         #start MinIO client if not started
         self.start_minio_client()
 
         # Build the S3 Path
-        if self.module is not None:
-            self.__build_s3_param_path()
+        coupling = coupling or ''
+        s3_path = self.__build_s3_path(gage_id, version, domain, data_type, source, module, coupling,
+                                       formatted_datetime)
+
+        # Write files to S3 concurrently, from the local directory or straight from the sink's buffers
+        uploader = S3Uploader(self.client, self.s3_bucket, workers=self.upload_workers, retries=self.upload_retries)
+        upload_report = uploader.upload(s3_path, sink)
+        s3_existence_cache.invalidate(s3_path)
+        if module is not None:
+            # PARAM files are a group of files, the uri is the folder of the files or the archive they are packaged in
+            full_s3_path = self.s3_uri + s3_path
+            if sink.package_filename is not None:
+                full_s3_path += '/' + sink.package_filename
         else:
-            self.__build_s3_data_path()
+            full_s3_path = self.s3_uri + upload_report.results[-1].object_name
 
-        # Write files to S3
-        for self.input_filename in input_filenames:
-            self.write_minio()
-
-        # Create a new HFFILES row.
-        try:
-            if self.module is not None:
-                # PARAM files are a group of files. Set filename to blank string, and remove filename from self.full_s3_path
-                blank = ""
-                self.full_s3_path = self.full_s3_path.rsplit("/", 1)[0]
-                new_hffiles = HFFiles(gage_id=self.gage_id, hydrofabric_version=self.hydro_version,
-                                    filename=blank,
-                                    uri=self.full_s3_path, domain=self.domain, data_type=self.data_type,
-                                    source=self.source,
-                                    module_id=self.module,
-                                    update_time=now, 
-                                    api_version = self.current_api_version)
-                
-            else:
-                new_hffiles = HFFiles(gage_id=self.gage_id, hydrofabric_version=self.hydro_version,
-                                    filename=self.input_filename,
-                                    uri=self.full_s3_path, domain=self.domain, data_type=self.data_type,
-                                    source=self.source,
-                                    update_time=now,
-                                    api_version = self.current_api_version)
-            new_hffiles.save()
-            # Save off the db object to add the IPE json document to
-            if self.module is not None:
-                self.db_object = new_hffiles
+        hffiles_id = None
+        if upload_report.ok:
+            # Create a new HFFILES row.  Do not record an incomplete set of files, it is computed again by the next
+            # request
+            try:
+                if module is not None:
+                    # PARAM files are a group of files. Set filename to blank string, or the archive's filename
+                    blank = ""
+                    new_hffiles = HFFiles(gage_id=gage_id, hydrofabric_version=version,
+                                        filename=sink.package_filename or blank,
+                                        uri=full_s3_path, domain=domain, data_type=data_type,
+                                        source=source,
+                                        module_id=module,
+                                        coupling_key=coupling,
+                                        update_time=now,
+                                        api_version = self.current_api_version)
 
-        except Exception as exception:
-            logger.error(f"Unhandled exception caught - {exception}")
+                else:
+                    new_hffiles = HFFiles(gage_id=gage_id, hydrofabric_version=version,
+                                        filename=upload_report.results[-1].filename,
+                                        uri=full_s3_path, domain=domain, data_type=data_type,
+                                        source=source,
+                                        update_time=now,
+                                        api_version = self.current_api_version)
+                new_hffiles.save()
+                hffiles_id = new_hffiles.id
+
+            except Exception as exception:
+                logger.error(f"Unhandled exception caught - {exception}")
+
+        result = WriteResult(full_s3_path, hffiles_id, upload_report.bytes, upload_report.elapsed,
+                             time.perf_counter() - start, upload_report)
+        # The module writers return their IPE json, the caller of a writer finds the result on the sink
+        sink.write_result = result
+        return result
+
+    def save_ipe_json(self, hffiles_id, ipe_json):
+        """
+        Adds the IPE json document to the HFFILES row of a module's param files
+        :param hffiles_id: The hffiles_id of the WriteResult of the files, None when they were not recorded
+        :param ipe_json: The IPE json document, as a string
+        :return: True if the row was found and updated
+        """
+        if hffiles_id is None:
+            return False
+        updated = HFFiles.objects.filter(id=hffiles_id).update(ipe_json=ipe_json)
+        return updated > 0
 
-        return self.full_s3_path
+    def reconcile_s3_existence(self):
+        """
+        Verifies the uri of every HFFILES row against S3 in bulk and refreshes the existence cache with the result
+        :return: List of the uris with nothing in S3
+        """
+        try:
+            self.start_minio_client()
+            uris = HFFiles.objects.values_list('uri', flat=True)
+            keys = [uri.removeprefix(self.s3_uri) for uri in uris if uri and uri.startswith(self.s3_uri)]
+            missing = reconcile(self.client, self.s3_bucket, keys)
+            logger.info(f"S3 existence of {len(keys)} HFFILES uris verified, {len(missing)} missing")
+            return [self.s3_uri + key for key in missing]
+        finally:
+            # The reconciler thread opens its own DB connection
+            connection.close()
 
     def get_file_from_s3(self, gage_id, version, domain, source, data_type):
         #Find file in HFFles table
@@ -287,6 +359,14 @@ class GageFileManagement(FileManagement):
 
     def get_geopackage_filename(self, gage_id):
         return 'gauge_' + gage_id + ".gpkg"
-    
-    def get_db_object(self):
-        return self.db_object
+
+
+def start_s3_reconciler():
+    """
+    Starts the background verification of the HFFILES uris against S3 every s3_reconcile_interval seconds, not
+    started when 0 (the default).  Called by the server entry points only, the workers and management commands
+    using GageFileManagement do not scan the HFFILES table.
+    :return: The thread, None if not started
+    """
+    interval = get_config().get('s3_reconcile_interval', 0)
+    return start_reconciler(lambda: GageFileManagement().reconcile_s3_existence(), interval)
@@ -0,0 +1,154 @@
+"""
+Prebuilt gage lookup of every hydrofabric domain.
+
+Maps (gage_id, source, domain, version) to where the subsetter starts: the poi_id of the gage hydrolocation
+and/or the gage lat/lon from gages_xy.csv, plus the divide containing the outlet.  The table is built offline
+(manage.py build_gage_index) into a Parquet file, read once per process into a dictionary and used to reject
+unknown gages before a subset is started.
+"""
+import os
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+
+from django.conf import settings
+from .upstream_index import as_poi_key
+from .utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+GageLocation = namedtuple('GageLocation', ['poi_id', 'lon', 'lat', 'divide_id'])
+
+INDEX_COLUMNS = ['gage_id', 'source', 'domain', 'version', 'poi_id', 'lon', 'lat', 'divide_id']
+
+
+def gage_source_key(source):
+    """
+    Sources sharing a domain geopackage share index entries, only Great Lakes (ENVCA) gages have their own
+    """
+    return 'ENVCA' if source == 'ENVCA' else 'USGS'
+
+
+class GageIndex:
+    """
+    In memory gage lookup built from the index table
+    """
+
+    def __init__(self, table):
+        table = table.astype(object).where(table.notna(), None)
+        self._locations = {}
+        for row in table.itertuples(index=False):
+            self._locations[(row.gage_id, row.source, row.domain, row.version)] = GageLocation(
+                row.poi_id, row.lon, row.lat, row.divide_id)
+        self.partitions = set(zip(table['source'], table['domain'], table['version']))
+
+    @classmethod
+    def load(cls, index_file):
+        return cls(pd.read_parquet(index_file, columns=INDEX_COLUMNS))
+
+    def covers(self, source, domain, version):
+        """
+        True if the gages of this domain were indexed, so a gage missing from the index does not exist
+        """
+        return (gage_source_key(source), domain, version) in self.partitions
+
+    def lookup(self, gage_id, source, domain, version):
+        """
+        :return: GageLocation of the gage, or None if it is not indexed
+        """
+        return self._locations.get((gage_id, gage_source_key(source), domain, version))
+
+
+def index_domain_gages(gpkg_path, gages_xy, domain, source, version):
+    """
+    Index table rows of the gages in one domain geopackage
+    :param gages_xy: DataFrame of gages_xy.csv
+    """
+    # Hydrolocation gages, at the most downstream divide of their poi.  Alaska hydrolocations are not used
+    # by the subsetter because they are incorrect
+    hydrolocations = pd.DataFrame(columns=['gage_id', 'poi_id', 'divide_id'])
+    if domain != 'Alaska':
+        gages = 'gages' if domain == 'CONUS' else 'Gages'
+        hydrolocations = pyogrio.read_dataframe(gpkg_path, layer='hydrolocations', columns=['hl_link', 'poi_id'],
+                                                read_geometry=False, where=f"hl_reference = '{gages}'")
+        hydrolocations = hydrolocations.rename(columns={'hl_link': 'gage_id'})
+        hydrolocations['poi_id'] = hydrolocations['poi_id'].map(as_poi_key)
+        network = pyogrio.read_dataframe(gpkg_path, layer='network', columns=['poi_id', 'divide_id', 'hydroseq'],
+                                         read_geometry=False)
+        network['poi_id'] = network['poi_id'].map(as_poi_key)
+        network = network.dropna(subset=['poi_id', 'divide_id']).sort_values('hydroseq')
+        outlets = network.drop_duplicates('poi_id')[['poi_id', 'divide_id']]
+        hydrolocations = hydrolocations.merge(outlets, on='poi_id', how='left')
+        hydrolocations = hydrolocations.drop_duplicates('gage_id')
+
+    # Lat/lon gages inside a divide of this domain
+    crs = pyogrio.read_info(gpkg_path, layer='divides')['crs']
+    points = gpd.GeoDataFrame(gages_xy[['gage_id', 'lon', 'lat']],
+                              geometry=gpd.points_from_xy(gages_xy['lon'], gages_xy['lat']),
+                              crs=4326).to_crs(crs)
+    divides = pyogrio.read_dataframe(gpkg_path, layer='divides', columns=['divide_id'],
+                                     bbox=tuple(points.total_bounds))
+    located = gpd.sjoin(points, divides, how='inner', predicate='within')
+    located = pd.DataFrame(located[['gage_id', 'lon', 'lat', 'divide_id']]).drop_duplicates('gage_id')
+
+    # Hydrolocations win over lat/lon in the subsetter, keep the lat/lon as a fallback
+    rows = hydrolocations.merge(located, on='gage_id', how='outer', suffixes=('', '_xy'))
+    rows['divide_id'] = rows['divide_id'].fillna(rows.pop('divide_id_xy'))
+    rows['source'] = source
+    rows['domain'] = domain
+    rows['version'] = version
+    return rows[INDEX_COLUMNS]
+
+
+def build_gage_index(gpkg_paths, gages_csv, version, index_file):
+    """
+    Builds and saves the gage index of all domains
+    :param gpkg_paths: List of (domain, source, path of the domain geopackage)
+    :param gages_csv: Path of gages_xy.csv
+    :return: The index table
+    """
+    gages_xy = pd.read_csv(gages_csv, dtype={'gageid': str}).rename(columns={'gageid': 'gage_id'})
+    tables = []
+    for domain, source, gpkg_path in gpkg_paths:
+        logger.info(f"Indexing gages of {gpkg_path}")
+        tables.append(index_domain_gages(gpkg_path, gages_xy, domain, source, version))
+    table = pd.concat(tables, ignore_index=True).sort_values(['version', 'domain', 'source', 'gage_id'])
+    table = table.astype({'gage_id': str, 'poi_id': object, 'lon': np.float64, 'lat': np.float64})
+    os.makedirs(os.path.dirname(index_file) or '.', exist_ok=True)
+    table.to_parquet(index_file, index=False)
+    return table
+
+
+def get_gage_index_file():
+    config = get_config()
+    index_file = config.get('gage_index_file')
+    if not index_file:
+        return None
+    grandparent_dir = os.path.dirname(settings.BASE_DIR)
+    return os.path.join(grandparent_dir, index_file)
+
+
+_gage_index = None
+_gage_index_lock = threading.Lock()
+
+
+def get_gage_index():
+    """
+    Process wide gage index, loaded on first use.  Reloaded if the index file is rebuilt
+    :return: GageIndex, or None if no index has been built
+    """
+    global _gage_index
+    index_file = get_gage_index_file()
+    if index_file is None or not os.path.exists(index_file):
+        return None
+    key = (index_file, os.path.getmtime(index_file))
+    with _gage_index_lock:
+        if _gage_index is None or _gage_index[0] != key:
+            logger.debug(f"Loading gage index {index_file}")
+            _gage_index = (key, GageIndex.load(index_file))
+    return _gage_index[1]
@@ -0,0 +1,221 @@
+"""
+Process-wide Minio client with a shared HTTP connection pool and cached AWS credentials.
+
+Credentials come from the environment or, on EC2, from the instance metadata service (IMDSv2).  Instance
+credentials are cached for all requests and refreshed by a background timer before they expire, so request
+threads only wait on the metadata service for the very first request of the process.
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import certifi
+import requests
+import urllib3
+from minio import Minio
+from minio.credentials import Credentials, Provider
+from urllib3.util import Retry, Timeout
+
+logger = logging.getLogger(__name__)
+
+IMDS_URL = "http://169.254.169.254/latest"
+# Instance credentials are refreshed this long before they expire
+CREDENTIAL_REFRESH_MARGIN = timedelta(minutes=10)
+# Delay before a failed background refresh is tried again
+CREDENTIAL_RETRY_DELAY = timedelta(seconds=30)
+# Connections kept per S3 host by the shared pool
+DEFAULT_POOL_SIZE = 32
+
+
+def get_imds_token():
+    """Get IMDSv2 token for subsequent requests"""
+    try:
+        response = requests.put(
+            f"{IMDS_URL}/api/token",
+            headers={"X-aws-ec2-metadata-token-ttl-seconds": "21600"},
+            timeout=2
+        )
+        return response.text if response.ok else None
+    except requests.RequestException:
+        logger.debug("Unable to fetch IMDSv2 token - not running on EC2?")
+        return None
+
+
+def get_instance_credentials():
+    """Fetch credentials from IMDSv2"""
+    token = get_imds_token()
+    if not token:
+        return None
+
+    try:
+        # Get role name
+        role_response = requests.get(
+            f"{IMDS_URL}/meta-data/iam/security-credentials/",
+            headers={"X-aws-ec2-metadata-token": token},
+            timeout=2
+        )
+        if not role_response.ok:
+            return None
+
+        role_name = role_response.text
+
+        # Get credentials
+        creds_response = requests.get(
+            f"{IMDS_URL}/meta-data/iam/security-credentials/{role_name}",
+            headers={"X-aws-ec2-metadata-token": token},
+            timeout=2
+        )
+        if not creds_response.ok:
+            return None
+
+        creds = creds_response.json()
+        return {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretAccessKey'],
+            'session_token': creds['Token'],
+            'expiry': datetime.strptime(creds['Expiration'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+        }
+    except (requests.RequestException, json.JSONDecodeError, KeyError) as e:
+        logger.debug(f"Error fetching instance credentials: {e}")
+        return None
+
+
+def get_credentials():
+    """Get credentials from environment or instance metadata"""
+    # First check environment variables
+    access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+    secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+    session_token = os.environ.get("AWS_SESSION_TOKEN")
+
+    if access_key and secret_key:
+        logger.debug("Using AWS credentials from environment variables")
+        return {
+            'access_key': access_key,
+            'secret_key': secret_key,
+            'session_token': session_token
+        }
+
+    # Then try instance metadata
+    logger.debug("Attempting to fetch credentials from instance metadata")
+    return get_instance_credentials()
+
+
+class CachedCredentialsProvider(Provider):
+    """
+    Minio credentials provider returning cached credentials.  The first retrieve() loads them, credentials with an
+    expiry are then refreshed by a daemon timer CREDENTIAL_REFRESH_MARGIN before they expire.  A request thread only
+    loads credentials itself when the background refresh failed until they expired.  Without any credentials the
+    client makes anonymous requests.
+    """
+
+    def __init__(self, fetch=get_credentials):
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._credentials = None
+        self._expiry = None
+        self._timer = None
+
+    def retrieve(self):
+        if not self._loaded or self._expired():
+            with self._lock:
+                if not self._loaded or self._expired():
+                    self._load(self._fetch())
+        return self._credentials
+
+    def refresh(self):
+        """
+        Fetches new credentials, keeps the cached ones when none are returned
+        :return: True if new credentials were cached
+        """
+        try:
+            credentials = self._fetch()
+        except Exception as exception:
+            logger.error(f"Error refreshing AWS credentials - {exception}")
+            credentials = None
+        with self._lock:
+            if credentials:
+                self._load(credentials)
+                return True
+            logger.warning(f"AWS credentials were not refreshed, retrying in {CREDENTIAL_RETRY_DELAY}")
+            self._schedule(CREDENTIAL_RETRY_DELAY)
+            return False
+
+    def stop(self):
+        """Cancels the background refresh"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _expired(self):
+        return self._expiry is not None and datetime.now(timezone.utc) >= self._expiry - timedelta(seconds=10)
+
+    def _load(self, credentials):
+        # Called with the lock held
+        self._loaded = True
+        if not credentials:
+            logger.warning("No credentials available - operations may fail")
+            self._credentials = None
+            self._expiry = None
+            return
+        self._expiry = credentials.get('expiry')
+        self._credentials = Credentials(credentials['access_key'], credentials['secret_key'],
+                                        credentials.get('session_token'), self._expiry)
+        if self._expiry is not None:
+            self._schedule(max(self._expiry - datetime.now(timezone.utc) - CREDENTIAL_REFRESH_MARGIN,
+                               CREDENTIAL_RETRY_DELAY))
+
+    def _schedule(self, delay):
+        # Called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay.total_seconds(), self.refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+_credentials_provider = CachedCredentialsProvider()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_minio_client(s3_url, region, pool_size=DEFAULT_POOL_SIZE):
+    """
+    The process-wide Minio client of an S3 endpoint.  The client is thread safe, all threads share its connection
+    pool and the cached credentials.
+    :param s3_url: S3 endpoint
+    :param region: S3 region
+    :param pool_size: Connections kept per host, at least the number of concurrent uploads
+    :return: Minio client
+    """
+    key = (s3_url, region)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                timeout = timedelta(minutes=5).seconds
+                # Same settings as the pool Minio creates by default, with a larger maxsize
+                http_client = urllib3.PoolManager(
+                    timeout=Timeout(connect=timeout, read=timeout),
+                    maxsize=pool_size,
+                    cert_reqs='CERT_REQUIRED',
+                    ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+                    retries=Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+                )
+                logger.debug(f"Creating shared Minio client for {s3_url}")
+                client = Minio(s3_url, region=region, credentials=_credentials_provider, http_client=http_client)
+                _clients[key] = client
+    return client
+
+
+def reset_minio_clients():
+    """Drops the shared clients and cached credentials, the next get_minio_client() starts over"""
+    global _credentials_provider
+    with _clients_lock:
+        _clients.clear()
+        _credentials_provider.stop()
+        _credentials_provider = CachedCredentialsProvider()
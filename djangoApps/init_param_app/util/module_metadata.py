@@ -0,0 +1,152 @@
+"""
+Process-level cache of the module metadata: calibrate parameters and output variables.
+
+The metadata only changes when the database is migrated or reloaded, so it is read for all modules at once, with
+one query per param table, and kept for the life of the process.  A cheap stamp query, run at most every
+module_metadata_check_interval seconds, reloads it when the tables change or when the refresh_module_metadata
+command bumps the module_metadata cache stamp.  Callers get deep copies they are free to modify.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from ..DatabaseManager import DatabaseManager, MODULE_PARAM_TABLES, DEPENDENT_MODULES
+from ..models import CacheStamp
+from .utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+STAMP_NAME = 'module_metadata'
+
+
+def calibrate_parameter(row, column_names):
+    """Calibrate parameter of a module from a row of the param tables"""
+    return {
+        "name": row[column_names.index("name")],
+        "initial_value": row[column_names.index("default_value")],
+        "description": row[column_names.index("description")],
+        "min": row[column_names.index("min")],
+        "max": row[column_names.index("max")],
+        "data_type": row[column_names.index("data_type")],
+        "units": row[column_names.index("units")]
+    }
+
+
+def output_variable(row, column_names):
+    """Output variable of a module from a row of output_variables"""
+    return {
+        "variable": row[column_names.index("name")],
+        "description": row[column_names.index("description")]
+    }
+
+
+def load_module_metadata(db):
+    """
+    Reads the metadata of all modules
+    :param db: DatabaseManager
+    :return: Dictionaries of module name to its calibrate parameters and to its output variables
+    """
+    calibrate = defaultdict(list)
+    tables = defaultdict(list)
+    for module_name, table_name in MODULE_PARAM_TABLES.items():
+        tables[table_name].append(module_name)
+    for table_name, module_names in tables.items():
+        column_names, rows = db.selectModuleCalibrateDataByTable(table_name, module_names)
+        for row in rows:
+            calibrate[row[column_names.index("module_name")]].append(calibrate_parameter(row, column_names))
+
+    for table_id, table_name in db.selectDependentModuleParamTables(DEPENDENT_MODULES):
+        column_names, rows = db.selectDependentModuleCalibrateDataByTable(table_id, table_name, DEPENDENT_MODULES)
+        for row in rows:
+            calibrate[row[column_names.index("module_name")]].append(calibrate_parameter(row, column_names))
+
+    out_variables = defaultdict(list)
+    column_names, rows = db.selectAllModuleOutVariablesData()
+    for row in rows:
+        out_variables[row[column_names.index("module_name")]].append(output_variable(row, column_names))
+    return dict(calibrate), dict(out_variables)
+
+
+class ModuleMetadataCache:
+    """
+    Thread safe cache of the metadata of all modules
+    """
+
+    def __init__(self, check_interval=None):
+        """
+        :param check_interval: Seconds between stamp checks, config module_metadata_check_interval by default
+        """
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._calibrate = None
+        self._out_variables = None
+        self._stamp = None
+        self._checked = None
+
+    def get(self, module_name):
+        """
+        :param module_name: Module name, e.g. CFE-S
+        :return: Copies of the calibrate parameters and output variables of the module, None if the metadata could
+                 not be read
+        """
+        if not self._is_checked():
+            with self._lock:
+                if not self._is_checked():
+                    self._refresh()
+        calibrate, out_variables = self._calibrate, self._out_variables
+        if calibrate is None:
+            return None
+        return copy.deepcopy(calibrate.get(module_name, [])), copy.deepcopy(out_variables.get(module_name, []))
+
+    def invalidate(self):
+        """Reloads the metadata on the next get() of this process"""
+        with self._lock:
+            self._calibrate = None
+            self._out_variables = None
+            self._checked = None
+
+    def _is_checked(self):
+        if self._calibrate is None or self._checked is None:
+            return False
+        if self.check_interval is None:
+            self.check_interval = float(get_config().get('module_metadata_check_interval', 60))
+        return time.monotonic() - self._checked < self.check_interval
+
+    def _refresh(self):
+        # Called with the lock held
+        try:
+            with connection.cursor() as cursor:
+                db = DatabaseManager(cursor)
+                stamp = db.selectModuleMetadataStamp()
+                if self._calibrate is None or stamp != self._stamp:
+                    self._calibrate, self._out_variables = load_module_metadata(db)
+                    self._stamp = stamp
+                    logger.info(f"Module metadata loaded for {len(self._calibrate)} modules, stamp {stamp}")
+            self._checked = time.monotonic()
+        except Exception as exception:
+            # Keep serving what is loaded, without it the callers query the modules themselves
+            logger.error(f"Error loading module metadata: {exception}")
+            if self._calibrate is not None:
+                self._checked = time.monotonic()
+
+
+module_metadata_cache = ModuleMetadataCache()
+
+
+def bump_module_metadata_stamp():
+    """
+    Makes every process reload the module metadata at its next stamp check
+    :return: The new stamp version
+    """
+    stamp, created = CacheStamp.objects.get_or_create(name=STAMP_NAME)
+    if not created:
+        CacheStamp.objects.filter(name=STAMP_NAME).update(version=F('version') + 1, updated_time=timezone.now())
+        stamp.refresh_from_db()
+    module_metadata_cache.invalidate()
+    return stamp.version
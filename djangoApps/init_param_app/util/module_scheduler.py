@@ -0,0 +1,123 @@
+"""
+Runs the module writers of IPE requests concurrently.
+
+Most modules only read the request's shared attribute layers and are independent of each other.  A module may
+declare modules it must run after; the scheduler starts each module as soon as the modules it depends on are done
+and returns the results in request order.  One process-wide pool caps the module writers running at the same time
+across all requests.
+"""
+import atexit
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.db import connection
+
+from .utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+
+def dependency_order(names, dependencies):
+    """
+    :param names: Task names, in request order
+    :param dependencies: Dictionary of name to the names it runs after, names not in names are ignored
+    :return: The names ordered so every name comes after its dependencies, otherwise in request order
+    :raises ValueError: When the dependencies have a cycle
+    """
+    waiting = {name: set(dependencies.get(name, ())).intersection(names) - {name} for name in names}
+    order = []
+    while waiting:
+        ready = [name for name, after in waiting.items() if not after]
+        if not ready:
+            raise ValueError(f"Module dependency cycle between {', '.join(waiting)}")
+        for name in ready:
+            del waiting[name]
+            order.append(name)
+        for after in waiting.values():
+            after.difference_update(ready)
+    return order
+
+
+def _run_task(context, task):
+    try:
+        return context.run(task)
+    finally:
+        # Worker threads hold their own connection, give it back before the thread is reused
+        connection.close()
+
+
+class ModuleScheduler:
+    """
+    Bounded pool of threads running module tasks in dependency order
+    """
+
+    def __init__(self, workers=4):
+        """
+        :param workers: Number of module tasks run at the same time by the process, 1 runs them in the caller
+        """
+        self.workers = max(1, workers)
+        self._executor = None
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ipe-module')
+
+    def run(self, tasks, dependencies=None):
+        """
+        Runs the tasks of one request.  Tasks see the context variables of the caller, e.g. its workspace.
+        :param tasks: Dictionary of name to a callable without arguments, in request order
+        :param dependencies: Dictionary of name to the names it runs after
+        :return: Dictionary of name to the result of its callable, in request order
+        :raises: The first exception raised by a task, once the tasks already started are done.  The tasks
+                 not started yet are skipped.
+        """
+        dependencies = dependencies or {}
+        order = dependency_order(list(tasks), dependencies)
+        if self._executor is None or len(tasks) < 2:
+            results = {name: tasks[name]() for name in order}
+            return {name: results[name] for name in tasks}
+
+        waiting = {name: set(dependencies.get(name, ())).intersection(tasks) - {name} for name in order}
+        results = {}
+        running = {}
+        error = None
+        while waiting or running:
+            if error is None:
+                for name in [name for name, after in waiting.items() if after.issubset(results)]:
+                    del waiting[name]
+                    future = self._executor.submit(_run_task, contextvars.copy_context(), tasks[name])
+                    running[future] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as exception:
+                    logger.error(f"Module task {name} raised - {exception}")
+                    if error is None:
+                        error = exception
+        if error is not None:
+            raise error
+        return {name: results[name] for name in tasks}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_module_scheduler():
+    """
+    Returns the process wide module scheduler, creating it from config.yml on first use
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ModuleScheduler(workers=int(get_config().get('ipe_module_workers', 4)))
+            atexit.register(_scheduler.shutdown)
+        return _scheduler
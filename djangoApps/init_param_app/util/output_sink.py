@@ -0,0 +1,270 @@
+"""
+Output sinks the module writers put their BMI config files into, handed to GageFileManagement.write_file_to_s3 for
+the upload.  A sink keeps the files in memory, writes them to a local directory, or streams them into an archive.
+"""
+import abc
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+
+from .utilities import get_config
+
+# An object to upload, the content is either a local file path, the bytes of the file, or an open binary file of
+# size bytes read from its start
+SinkObject = namedtuple('SinkObject', ['filename', 'path', 'data', 'file', 'size'], defaults=(None, None))
+
+SINK_KINDS = ('memory', 'directory', 'archive')
+# tar.zst is not offered, zstd is not in the standard library of the supported python versions
+ARCHIVE_FORMATS = {'zip': '.zip', 'tar.gz': '.tar.gz'}
+
+# Archives larger than this spill from memory to a temporary file
+ARCHIVE_SPOOL_SIZE = 64 * 1024 * 1024
+
+
+class OutputSink(abc.ABC):
+    """
+    Base class of the output sinks.  Files are added with write() or write_files(), the uploader iterates objects().
+    A sink is a context manager, closed when the block exits.
+    """
+
+    # Filename of the single object the files are packaged into, None when each file is its own object
+    package_filename = None
+    # WriteResult of the upload of the files, set by GageFileManagement.write_file_to_s3
+    write_result = None
+
+    def __init__(self):
+        self.filenames = []
+
+    def write(self, filename, content):
+        """
+        Adds a file to the sink
+        :param filename: Name of the file, without directory
+        :param content: str (written as UTF-8) or bytes
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self._write(filename, content)
+        self.filenames.append(filename)
+
+    def write_files(self, filenames, contents):
+        """
+        Adds rendered config files to the sink
+        :return: The list of filenames written
+        """
+        filenames = list(filenames)
+        for filename, content in zip(filenames, contents):
+            self.write(filename, content)
+        return filenames
+
+    def read(self, filename):
+        """
+        Content of a file of the sink as str
+        """
+        return self._read(filename).decode('utf-8')
+
+    @abc.abstractmethod
+    def objects(self):
+        """
+        Yields a SinkObject for each object to upload
+        """
+
+    def close(self):
+        """
+        Releases the resources held by the sink
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @abc.abstractmethod
+    def _write(self, filename, data):
+        pass
+
+    @abc.abstractmethod
+    def _read(self, filename):
+        pass
+
+
+class MemorySink(OutputSink):
+    """
+    Keeps the files in memory, they are uploaded from their buffers without touching the local filesystem
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._buffers = {}
+
+    def _write(self, filename, data):
+        self._buffers[filename] = data
+
+    def _read(self, filename):
+        return self._buffers[filename]
+
+    def objects(self):
+        for filename in self.filenames:
+            yield SinkObject(filename, None, self._buffers[filename])
+
+    def close(self):
+        self._buffers.clear()
+
+
+class DirectorySink(OutputSink):
+    """
+    Writes the files to a local directory, they are uploaded from there
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = os.path.join(directory, '')
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_files(cls, directory, filenames):
+        """
+        Sink over files that already exist in a directory
+        """
+        sink = cls(directory)
+        sink.filenames = list(filenames)
+        return sink
+
+    def _write(self, filename, data):
+        with open(os.path.join(self.directory, filename), 'wb') as outfile:
+            outfile.write(data)
+
+    def _read(self, filename):
+        with open(os.path.join(self.directory, filename), 'rb') as infile:
+            return infile.read()
+
+    def objects(self):
+        for filename in self.filenames:
+            yield SinkObject(filename, os.path.join(self.directory, filename), None)
+
+
+class ArchiveSink(OutputSink):
+    """
+    Streams the files into a single zip or tar.gz archive, which is uploaded as one object together with a JSON
+    manifest of its members.  The archive is built in memory and spills to a temporary file once it is larger than
+    ARCHIVE_SPOOL_SIZE, it is uploaded from there without being read into memory.
+
+    The members of a zip are compressed one by one, the manifest gives the offset of the compressed bytes of each
+    member so it can be read with a ranged GET.  A tar.gz is one compressed stream, its manifest lists the members
+    without offsets.
+    """
+
+    def __init__(self, archive_name, archive_format='zip'):
+        super().__init__()
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Archive format '{archive_format}' is not one of {', '.join(ARCHIVE_FORMATS)}")
+        self.archive_format = archive_format
+        self.archive_filename = archive_name + ARCHIVE_FORMATS[archive_format]
+        self.package_filename = self.archive_filename
+        self.manifest_filename = self.archive_filename + '.manifest.json'
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_SIZE)
+        if archive_format == 'zip':
+            self._archive = zipfile.ZipFile(self._buffer, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(fileobj=self._buffer, mode='w:gz')
+        # Manifest entries of the members, recorded as they are written
+        self._members = []
+        self._size = None
+
+    def _write(self, filename, data):
+        if self._archive is None:
+            raise ValueError(f'Archive {self.archive_filename} is already finished')
+        if self.archive_format == 'zip':
+            self._archive.writestr(filename, data)
+            info = self._archive.infolist()[-1]
+            # The compressed bytes end where the archive is, the local header is rewritten in place before it
+            self._members.append({'name': info.filename,
+                                  'offset': self._buffer.tell() - info.compress_size,
+                                  'size': info.file_size,
+                                  'compressed_size': info.compress_size,
+                                  'crc32': info.CRC})
+        else:
+            member = tarfile.TarInfo(filename)
+            member.size = len(data)
+            member.mtime = int(time.time())
+            self._archive.addfile(member, io.BytesIO(data))
+            self._members.append({'name': filename, 'size': member.size})
+
+    def _finish(self):
+        """
+        Writes the archive trailer, no more files can be added afterwards
+        :return: Size of the archive in bytes
+        """
+        if self._size is None:
+            self._archive.close()
+            self._archive = None
+            self._size = self._buffer.seek(0, io.SEEK_END)
+        return self._size
+
+    def _read(self, filename):
+        self._finish()
+        self._buffer.seek(0)
+        if self.archive_format == 'zip':
+            with zipfile.ZipFile(self._buffer) as archive:
+                return archive.read(filename)
+        with tarfile.open(fileobj=self._buffer, mode='r:gz') as archive:
+            return archive.extractfile(filename).read()
+
+    def manifest(self):
+        """
+        Manifest of the archive members
+        :return: dict with the archive filename, format and size and per member name and size, and for a zip the
+                 offset, compressed size and crc32
+        """
+        return {'archive': self.archive_filename, 'format': self.archive_format, 'size': self._finish(),
+                'members': list(self._members)}
+
+    def objects(self):
+        yield SinkObject(self.archive_filename, None, None, self._buffer, self._finish())
+        yield SinkObject(self.manifest_filename, None, json.dumps(self.manifest()).encode('utf-8'))
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        self._buffer.close()
+
+
+def get_output_sink(kind, directory=None, archive_name=None, archive_format='zip'):
+    """
+    Creates an output sink
+    :param kind: memory, directory or archive
+    :param directory: Local directory of a directory sink
+    :param archive_name: Filename of an archive sink, without extension
+    :param archive_format: zip or tar.gz
+    :return: The output sink
+    """
+    if kind == 'memory':
+        return MemorySink()
+    if kind == 'directory':
+        return DirectorySink(directory)
+    if kind == 'archive':
+        return ArchiveSink(archive_name, archive_format)
+    raise ValueError(f"Output sink '{kind}' is not one of {', '.join(SINK_KINDS)}")
+
+
+def open_module_sink(subset_dir, module):
+    """
+    Creates the output sink of a module's IPE files, of the kind set by ipe_output_sink in config.yml
+    (memory when not set).  A directory sink writes to the module directory under subset_dir.
+    :param subset_dir: Local IPE temp directory of the gage
+    :param module: Module name
+    :return: The output sink
+    """
+    config = get_config()
+    kind = config.get('ipe_output_sink', 'memory')
+    archive_format = config.get('ipe_archive_format', 'zip')
+    return get_output_sink(kind, directory=os.path.join(subset_dir, module), archive_name=module,
+                           archive_format=archive_format)
@@ -0,0 +1,132 @@
+"""
+Process-wide cache of S3 object and prefix existence.
+
+Found objects are cached for a TTL and missing ones for a shorter negative TTL.  Our own writes and deletes
+invalidate the entries they affect, and a background reconciler re-verifies the HFFILES uris against S3 in bulk
+so the checks of hot gages are answered from the cache.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+OBJECT = 'object'
+PREFIX = 'prefix'
+
+
+class ExistenceCache:
+    """
+    Thread safe TTL cache of the existence of S3 objects (exact keys) and prefixes (at least one object below)
+    """
+
+    def __init__(self, ttl=900, negative_ttl=60):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, key):
+        """
+        :param kind: OBJECT or PREFIX
+        :param key: Object name or prefix, without the bucket
+        :return: True or False if the cached entry is fresh, None when unknown
+        """
+        entry = self._entries.get((kind, key))
+        if entry is None:
+            return None
+        exists, expires = entry
+        if time.monotonic() >= expires:
+            with self._lock:
+                if self._entries.get((kind, key)) is entry:
+                    del self._entries[(kind, key)]
+            return None
+        return exists
+
+    def set(self, kind, key, exists):
+        ttl = self.ttl if exists else self.negative_ttl
+        with self._lock:
+            self._entries[(kind, key)] = (exists, time.monotonic() + ttl)
+
+    def invalidate(self, key):
+        """
+        Drops the entries a write or delete of key, an object name or a prefix, can change:  the key itself, the
+        keys below it and the prefixes above it
+        """
+        with self._lock:
+            stale = [entry_key for entry_key in self._entries
+                     if entry_key[1].startswith(key) or (entry_key[0] == PREFIX and key.startswith(entry_key[1]))]
+            for entry_key in stale:
+                del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+s3_existence_cache = ExistenceCache()
+
+
+def reconcile(client, bucket, keys, cache=None):
+    """
+    Verifies object keys against S3 with one recursive listing per gage folder and caches the result of each key
+    as an object and as a prefix
+    :param client: Minio client
+    :param bucket: The bucket
+    :param keys: Object names or prefixes of HFFILES uris, without the bucket
+    :param cache: ExistenceCache, the process-wide cache by default
+    :return: List of the keys with nothing in S3
+    """
+    if cache is None:
+        cache = s3_existence_cache
+    groups = defaultdict(list)
+    for key in set(keys):
+        # version/domain/gage_id/ holds all files of a gage
+        groups['/'.join(key.split('/')[:3]) + '/'].append(key)
+
+    missing = []
+    for folder, folder_keys in groups.items():
+        names = sorted(obj.object_name for obj in client.list_objects(bucket, prefix=folder, recursive=True))
+        name_set = set(names)
+        for key in folder_keys:
+            position = bisect.bisect_left(names, key)
+            prefix_exists = position < len(names) and names[position].startswith(key)
+            cache.set(OBJECT, key, key in name_set)
+            cache.set(PREFIX, key, prefix_exists)
+            if not prefix_exists:
+                missing.append(key)
+    return missing
+
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+def start_reconciler(run, interval):
+    """
+    Starts the process-wide daemon thread calling run every interval seconds, once per process
+    :param run: Callable doing one reconciliation
+    :param interval: Seconds between reconciliations, 0 does not start the thread
+    :return: The thread, None if not started
+    """
+    global _reconciler
+    if not interval:
+        return None
+    with _reconciler_lock:
+        if _reconciler is None:
+            def loop():
+                while True:
+                    try:
+                        run()
+                    except Exception as exception:
+                        logger.error(f"S3 existence reconciliation failed - {exception}")
+                    time.sleep(interval)
+
+            _reconciler = threading.Thread(target=loop, name='s3-reconciler', daemon=True)
+            _reconciler.start()
+        return _reconciler
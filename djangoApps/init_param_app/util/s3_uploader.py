@@ -0,0 +1,132 @@
+"""
+Concurrent upload of the objects of an output sink to S3
+"""
+import io
+import os
+import random
+import time
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from minio import S3Error
+
+logger = logging.getLogger(__name__)
+
+# S3 error codes an upload is not retried for, the request fails the same way every time
+PERMANENT_S3_ERRORS = ('AccessDenied', 'NoSuchBucket', 'InvalidAccessKeyId', 'SignatureDoesNotMatch',
+                       'InvalidBucketName', 'InvalidObjectName', 'EntityTooLarge')
+
+# Outcome of the upload of one object, size in bytes of the uploaded object
+UploadResult = namedtuple('UploadResult', ['filename', 'object_name', 'ok', 'attempts', 'error', 'size'])
+
+
+class UploadReport:
+    """
+    Aggregate result of an upload, one UploadResult per object in the order of the sink
+    """
+
+    def __init__(self, s3_path, results, elapsed):
+        self.s3_path = s3_path
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def uploaded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    @property
+    def bytes(self):
+        return sum(result.size for result in self.uploaded)
+
+    @property
+    def retried(self):
+        return sum(result.attempts - 1 for result in self.results)
+
+    def summary(self):
+        summary = (f"{len(self.uploaded)} of {len(self.results)} objects uploaded to {self.s3_path} in "
+                   f"{self.elapsed:.2f} s, {self.retried} retries")
+        if self.failed:
+            first = self.failed[0]
+            summary += f", {len(self.failed)} failed (first: {first.object_name} - {first.error})"
+        return summary
+
+
+class S3Uploader:
+    """
+    Uploads the objects of an OutputSink with a bounded pool of threads sharing one Minio client.  Each object is
+    retried with exponential backoff and jitter, a permanent S3 error fails the object at once.
+    """
+
+    def __init__(self, client, bucket, workers=8, retries=3, backoff=0.5):
+        """
+        :param client: Minio client, its urllib3 pool is shared by the threads
+        :param bucket: Destination bucket
+        :param workers: Number of concurrent uploads
+        :param retries: Number of retries of an object after the first attempt
+        :param backoff: Delay in seconds before the first retry, doubled for each further retry
+        """
+        self.client = client
+        self.bucket = bucket
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+
+    def upload(self, s3_path, sink):
+        """
+        Uploads every object of the sink under s3_path
+        :param s3_path: Object prefix, without bucket and trailing /
+        :param sink: The OutputSink holding the files
+        :return: UploadReport
+        """
+        start = time.perf_counter()
+        objects = list(sink.objects())
+        if len(objects) == 1 or self.workers == 1:
+            results = [self._upload_object(s3_path, sink_object) for sink_object in objects]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(objects)),
+                                    thread_name_prefix='s3-upload') as executor:
+                results = list(executor.map(lambda sink_object: self._upload_object(s3_path, sink_object), objects))
+        report = UploadReport(s3_path, results, time.perf_counter() - start)
+        if report.ok:
+            logger.info(report.summary())
+        else:
+            logger.error(report.summary())
+        return report
+
+    def _upload_object(self, s3_path, sink_object):
+        object_name = s3_path + '/' + sink_object.filename
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if sink_object.path is not None:
+                    self.client.fput_object(self.bucket, object_name, sink_object.path)
+                    size = os.path.getsize(sink_object.path)
+                elif sink_object.file is not None:
+                    # Streamed in parts from the start of the file, again on a retry
+                    sink_object.file.seek(0)
+                    self.client.put_object(self.bucket, object_name, sink_object.file, sink_object.size)
+                    size = sink_object.size
+                else:
+                    self.client.put_object(self.bucket, object_name, io.BytesIO(sink_object.data),
+                                           len(sink_object.data))
+                    size = len(sink_object.data)
+                logger.debug("Hydrofabric data written to " + object_name)
+                return UploadResult(sink_object.filename, object_name, True, attempt, None, size)
+            except Exception as exception:
+                permanent = isinstance(exception, S3Error) and exception.code in PERMANENT_S3_ERRORS
+                if permanent or attempt > self.retries:
+                    logger.error(f"Upload of {object_name} failed after {attempt} attempts - {exception}")
+                    return UploadResult(sink_object.filename, object_name, False, attempt, str(exception), 0)
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+                logger.warning(f"Upload of {object_name} failed, retrying in {delay:.2f} s - {exception}")
+                time.sleep(delay)
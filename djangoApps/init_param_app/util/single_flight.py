@@ -0,0 +1,102 @@
+"""
+Single-flight execution of identical concurrent requests.
+
+The first caller of a key (the leader) does the work, callers arriving while it runs (followers) wait and are given
+the leader's result.  Across processes the leader holds a Postgres advisory lock for the key, so the leader of
+another process waits for it and then finds the artifact already built.
+"""
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def advisory_lock_id(key):
+    """
+    :param key: Tuple of strings
+    :return: Signed 64 bit integer identifying the key in pg_advisory_lock
+    """
+    digest = hashlib.blake2b('\x1f'.join(str(part) for part in key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(key):
+    """
+    Holds the session level Postgres advisory lock of key, other databases have no advisory locks and are not
+    locked
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    lock_id = advisory_lock_id(key)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", [lock_id])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls of the same key into one execution
+    """
+
+    def __init__(self, name):
+        """
+        :param name: Name of the kind of work, logged and part of the advisory lock key
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Runs function, or waits for the running call of the same key
+        :param key: Tuple identifying the work, e.g. (gage_id, version, domain, source, data type)
+        :param function: Called with args and kwargs by the leader
+        :return: Tuple of the result and True if the result is the one of another caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            logger.info(f"Waiting for the running {self.name} of {key}")
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result, True
+
+        try:
+            with advisory_lock((self.name,) + tuple(key)):
+                call.result = function(*args, **kwargs)
+        except BaseException as exception:
+            call.exception = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Keys of the calls running"""
+        with self._lock:
+            return list(self._calls)
@@ -0,0 +1,251 @@
+"""
+Pool of long lived R processes used to subset the hydrofabric.
+
+Starting Rscript and loading the hydrofabric library costs several seconds, so instead of running
+R/run_subsetter.R once per geopackage request the workers in R/subsetter_worker.R are started once and
+kept around.  Jobs and results are exchanged as single line JSON documents over the worker's stdin/stdout.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+
+from .utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+READY_LINE = 'HFSUBSET_READY'
+RESULT_PREFIX = 'HFSUBSET_RESULT '
+
+# Sentinel put on the stdout queue when the worker closes stdout (i.e. it exited)
+_EOF = object()
+
+
+class RSubsetterWorker:
+    """
+    A single R subsetting process.  Not thread safe, the pool hands a worker to one caller at a time.
+    """
+
+    def __init__(self, command, startup_timeout):
+        """
+        :param command: Command list used to start the worker process
+        :param startup_timeout: Seconds to wait for the worker to load the hydrofabric library
+        """
+        self.command = command
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.broken = False
+        self._stdout_lines = queue.Queue()
+        self._stderr_tail = deque(maxlen=50)
+
+    def start(self):
+        """
+        Starts the worker process and waits for its ready line
+        :raises RuntimeError: If the worker exits or does not become ready in time
+        """
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True, bufsize=1)
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+        try:
+            while True:
+                line = self._stdout_lines.get(timeout=self.startup_timeout)
+                if line is _EOF:
+                    self.stop()
+                    raise RuntimeError(f"R subsetter worker exited during startup: {self.stderr_tail()}")
+                if line == READY_LINE:
+                    break
+        except queue.Empty:
+            self.stop()
+            raise RuntimeError(f"R subsetter worker not ready after {self.startup_timeout} seconds")
+        logger.debug(f"R subsetter worker started, pid = {self.process.pid}")
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            self._stdout_lines.put(line.rstrip('\n'))
+        self._stdout_lines.put(_EOF)
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self._stderr_tail.append(line.rstrip('\n'))
+
+    def stderr_tail(self):
+        return '\n'.join(self._stderr_tail)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, job, timeout):
+        """
+        Sends a job to the worker and waits for its result
+        :param job: Dictionary of subset arguments, must include a job_id
+        :param timeout: Seconds to wait for the result before the worker is killed
+        :return: Result dictionary with a status of 'ok' or 'error'
+        """
+        try:
+            self.process.stdin.write(json.dumps(job) + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as exception:
+            self.broken = True
+            return self._error(job, 'WorkerCrashed', f"Unable to send job to R subsetter worker: {exception}")
+
+        while True:
+            try:
+                line = self._stdout_lines.get(timeout=timeout)
+            except queue.Empty:
+                self.broken = True
+                self.stop()
+                return self._error(job, 'Timeout', f"Subsetting did not finish within {timeout} seconds")
+
+            if line is _EOF:
+                self.broken = True
+                return self._error(job, 'WorkerCrashed', f"R subsetter worker exited: {self.stderr_tail()}")
+            if not line.startswith(RESULT_PREFIX):
+                # Anything else written to stdout by the hydrofabric code is only of interest for debugging
+                logger.debug(f"R subsetter worker output: {line}")
+                continue
+
+            try:
+                result = json.loads(line[len(RESULT_PREFIX):])
+            except json.JSONDecodeError:
+                self.broken = True
+                self.stop()
+                return self._error(job, 'InvalidResult', f"Unreadable result from R subsetter worker: {line}")
+            if result.get('job_id') != job['job_id']:
+                logger.warning(f"Discarding stale R subsetter result for job {result.get('job_id')}")
+                continue
+            return result
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            logger.error(f"R subsetter worker pid = {self.process.pid} did not exit")
+
+    @staticmethod
+    def _error(job, error_class, message):
+        return {'job_id': job['job_id'], 'status': 'error', 'error_class': error_class, 'message': message}
+
+
+class RSubsetterPool:
+    """
+    Fixed size pool of R subsetting workers.  Workers are started on first use, replaced when they crash
+    or time out, and every job has a timeout.
+    """
+
+    def __init__(self, command, size, job_timeout, startup_timeout):
+        """
+        :param command: Command list used to start a worker process
+        :param size: Maximum number of worker processes
+        :param job_timeout: Seconds a single subset job may take
+        :param startup_timeout: Seconds a worker may take to load the hydrofabric library
+        """
+        self.command = command
+        self.size = max(1, size)
+        self.job_timeout = job_timeout
+        self.startup_timeout = startup_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker_count = 0
+        self._closed = False
+
+    def _acquire(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                start_new = self._worker_count < self.size
+                if start_new:
+                    self._worker_count += 1
+            if start_new:
+                worker = RSubsetterWorker(self.command, self.startup_timeout)
+                try:
+                    worker.start()
+                except Exception:
+                    with self._lock:
+                        self._worker_count -= 1
+                    raise
+                return worker
+
+            try:
+                # Wake up now and then so a slot freed by a crashed worker is noticed
+                return self._idle.get(timeout=5)
+            except queue.Empty:
+                continue
+
+    def _release(self, worker):
+        if worker.broken or not worker.is_alive() or self._closed:
+            worker.stop()
+            with self._lock:
+                self._worker_count -= 1
+            logger.warning("R subsetter worker discarded, a new worker will be started on the next job")
+        else:
+            self._idle.put(worker)
+
+    def submit(self, **job_args):
+        """
+        Runs one subset job on the next free worker
+        :param job_args: Arguments of hf_subset in R/subsetter.R
+        :return: Result dictionary with a status of 'ok' (and the outfile) or 'error' (with error_class and message)
+        """
+        job = dict(job_args, job_id=uuid.uuid4().hex)
+        try:
+            worker = self._acquire()
+        except Exception as exception:
+            logger.error(f"Unable to start R subsetter worker: {exception}")
+            return RSubsetterWorker._error(job, 'WorkerStartup', str(exception))
+
+        try:
+            result = worker.run(job, self.job_timeout)
+        finally:
+            self._release(worker)
+        return result
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+            with self._lock:
+                self._worker_count -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_subsetter_pool():
+    """
+    Returns the process wide R subsetter pool, creating it from config.yml on first use
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = get_config()
+            grandparent_dir = os.path.dirname(settings.BASE_DIR)
+            worker_script = os.path.join(grandparent_dir, "R/subsetter_worker.R")
+            command = [config.get('rscript_path', '/usr/bin/Rscript'), worker_script]
+            _pool = RSubsetterPool(command,
+                                   size=int(config.get('subsetter_pool_size', 2)),
+                                   job_timeout=float(config.get('subsetter_job_timeout', 1800)),
+                                   startup_timeout=float(config.get('subsetter_startup_timeout', 300)))
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,211 @@
+"""
+Compact upstream network index of a hydrofabric domain geopackage.
+
+The network (and nexus) id -> toid edges are stored as a CSR adjacency of int arrays pointing upstream, so
+finding everything upstream of a gage is a breadth first search over arrays instead of a scan of the
+multi GB network layer.  The index is built offline (manage.py build_upstream_index), saved as .npy files
+per domain and version, and memory mapped when it is loaded.
+"""
+import os
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+import pyogrio
+
+from django.conf import settings
+from .utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+NETWORK_COLUMNS = ['id', 'toid', 'divide_id', 'poi_id', 'hydroseq']
+ARRAYS = ['ids', 'toid', 'hydroseq', 'indptr', 'indices', 'divide_keys', 'divide_nodes', 'poi_keys', 'poi_nodes']
+
+
+def as_poi_key(value):
+    """
+    Normalizes poi ids, which are integers in some layers and text or floats in others
+    """
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+class UpstreamIndex:
+    """
+    Upstream adjacency of a hydrofabric network in CSR form.
+
+    Nodes are the sorted unique network and nexus ids.  indices[indptr[n]:indptr[n + 1]] are the nodes that
+    flow directly into node n.  divide_keys/poi_keys are sorted lookup tables mapping divide and poi ids to
+    the nodes that carry them.
+    """
+
+    def __init__(self, arrays, meta=None):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta or {}
+
+    @classmethod
+    def from_geopackage(cls, gpkg_path):
+        """
+        Builds the index from the network and nexus layers of a domain geopackage
+        """
+        network = pyogrio.read_dataframe(gpkg_path, layer='network', columns=NETWORK_COLUMNS, read_geometry=False)
+        edges = [network[['id', 'toid']]]
+        if 'nexus' in pyogrio.list_layers(gpkg_path)[:, 0]:
+            # nexus -> flowpath edges, in case the network table only holds the flowpath -> nexus edges
+            edges.append(pyogrio.read_dataframe(gpkg_path, layer='nexus', columns=['id', 'toid'],
+                                                read_geometry=False))
+        edges = pd.concat(edges, ignore_index=True)
+
+        ids = np.unique(np.concatenate([edges['id'].dropna().to_numpy(dtype=str),
+                                        edges['toid'].dropna().to_numpy(dtype=str)]))
+        edges = edges.dropna().drop_duplicates()
+        upstream_node = np.searchsorted(ids, edges['id'].to_numpy(dtype=str))
+        downstream_node = np.searchsorted(ids, edges['toid'].to_numpy(dtype=str))
+        order = np.argsort(downstream_node, kind='stable')
+        indices = upstream_node[order].astype(np.int64)
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(downstream_node, minlength=len(ids)), out=indptr[1:])
+
+        # The network layer repeats an id once per hydrolocation, keep the most downstream hydroseq
+        per_node = network.dropna(subset=['id']).groupby('id').agg(toid=('toid', 'first'),
+                                                                  hydroseq=('hydroseq', 'min'))
+        node_of = np.searchsorted(ids, per_node.index.to_numpy(dtype=str))
+        toid = np.full(len(ids), '', dtype=object)
+        toid[node_of] = per_node['toid'].fillna('').to_numpy()
+        toid = toid.astype(str)
+        hydroseq = np.full(len(ids), np.inf)
+        hydroseq[node_of] = per_node['hydroseq'].astype(float).to_numpy()
+
+        divide_keys, divide_nodes = cls._lookup_table(ids, network['id'], network['divide_id'])
+        poi_keys, poi_nodes = cls._lookup_table(ids, network['id'], network['poi_id'].map(as_poi_key))
+
+        arrays = dict(ids=ids, toid=toid, hydroseq=hydroseq, indptr=indptr, indices=indices,
+                      divide_keys=divide_keys, divide_nodes=divide_nodes, poi_keys=poi_keys, poi_nodes=poi_nodes)
+        meta = {'format_version': INDEX_FORMAT_VERSION,
+                'source': gpkg_path,
+                'source_mtime': os.path.getmtime(gpkg_path),
+                'nodes': int(len(ids)),
+                'edges': int(len(indices))}
+        return cls(arrays, meta)
+
+    @staticmethod
+    def _lookup_table(ids, node_ids, keys):
+        pairs = pd.DataFrame({'key': keys, 'id': node_ids}).dropna().drop_duplicates()
+        pairs = pairs.sort_values('key', kind='stable')
+        keys = pairs['key'].to_numpy(dtype=str)
+        nodes = np.searchsorted(ids, pairs['id'].to_numpy(dtype=str)).astype(np.int64)
+        return keys, nodes
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(index_dir, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(index_dir, 'meta.json'), 'w') as file:
+            json.dump(self.meta, file, indent=2)
+
+    @classmethod
+    def load(cls, index_dir):
+        """
+        Memory maps a saved index
+        :raises FileNotFoundError: If no index was built in index_dir
+        """
+        with open(os.path.join(index_dir, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        arrays = {name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        return cls(arrays, meta)
+
+    def is_current(self, gpkg_path):
+        """
+        True if the index was built from the current version of the geopackage
+        """
+        return (self.meta.get('format_version') == INDEX_FORMAT_VERSION and
+                self.meta.get('source_mtime', 0) >= os.path.getmtime(gpkg_path))
+
+    def node_of(self, node_id):
+        position = np.searchsorted(self.ids, node_id)
+        if position < len(self.ids) and self.ids[position] == node_id:
+            return int(position)
+        return None
+
+    @staticmethod
+    def _lookup(keys, nodes, values):
+        values = np.asarray(sorted(values), dtype=str)
+        if len(values) == 0 or len(keys) == 0:
+            return np.empty(0, dtype=np.int64)
+        start = np.searchsorted(keys, values, side='left')
+        end = np.searchsorted(keys, values, side='right')
+        return np.unique(np.concatenate([nodes[s:e] for s, e in zip(start, end)]))
+
+    def nodes_for_pois(self, poi_ids):
+        return self._lookup(self.poi_keys, self.poi_nodes, poi_ids)
+
+    def nodes_for_divides(self, divide_ids):
+        return self._lookup(self.divide_keys, self.divide_nodes, divide_ids)
+
+    def most_downstream(self, nodes):
+        """
+        The node with the lowest hydroseq, i.e. the outlet of a set of nodes
+        """
+        if len(nodes) == 0:
+            return None
+        return int(nodes[np.argmin(self.hydroseq[nodes])])
+
+    def upstream_of(self, origin):
+        """
+        Breadth first trace over the CSR arrays
+        :param origin: Node number to start from
+        :return: Sorted node numbers upstream of and including origin
+        """
+        visited = np.zeros(len(self.ids), dtype=bool)
+        visited[origin] = True
+        frontier = np.array([origin], dtype=np.int64)
+        while frontier.size:
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+            # Positions of all upstream neighbours of the frontier in the indices array
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            neighbours = np.unique(self.indices[offsets])
+            frontier = neighbours[~visited[neighbours]]
+            visited[frontier] = True
+        return np.flatnonzero(visited)
+
+    def divides_of(self, nodes):
+        return set(self.divide_keys[np.isin(self.divide_nodes, nodes)])
+
+    def pois_of(self, nodes):
+        return set(self.poi_keys[np.isin(self.poi_nodes, nodes)])
+
+
+def get_upstream_index_dir(hydrofabric_version, domain, hydrofabric_filename):
+    """
+    Directory of the saved index for one domain geopackage
+    """
+    config = get_config()
+    index_root = config.get('upstream_index_dir')
+    if not index_root:
+        return None
+    grandparent_dir = os.path.dirname(settings.BASE_DIR)
+    stem = os.path.splitext(hydrofabric_filename)[0]
+    return os.path.join(grandparent_dir, index_root, f'v{hydrofabric_version}', domain, stem)
+
+
+def build_upstream_index(gpkg_path, index_dir):
+    """
+    Builds and saves the index of a domain geopackage
+    :return: The built UpstreamIndex
+    """
+    logger.info(f"Building upstream index for {gpkg_path}")
+    index = UpstreamIndex.from_geopackage(gpkg_path)
+    index.save(index_dir)
+    logger.info(f"Upstream index with {index.meta['nodes']} nodes and {index.meta['edges']} edges "
+                f"written to {index_dir}")
+    return index
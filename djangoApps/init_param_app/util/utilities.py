@@ -3,28 +3,23 @@ from os.path import isfile, join
 
 from minio import Minio
 from django.conf import settings
-import yaml
 import logging
 
+from .app_config import load_config, load_api_version
+
 logger = logging.getLogger(__name__)
 
 def get_config():
     ''' 
-    Load yaml config file 
+    Load yaml config file, read once per process and cached
 
     Parameters:
     None
     
     Returns:
-    yaml object
+    AppConfig: immutable mapping of the config.yml keys
     '''
-    # Get the grandparent directory of BASE_DIR
-    grandparent_dir = os.path.dirname(settings.BASE_DIR)
-    directory = os.path.join(grandparent_dir, "config.yml")
-
-    with open(directory, 'r') as file:
-        config = yaml.safe_load(file)
-    return config
+    return load_config()
 
 def get_hydrofabric_input_attr_file(version):
     config = get_config()
@@ -39,14 +34,31 @@ def get_hydrofabric_input_attr_file(version):
     return attr_file
 
 
-def get_api_version():
-    # Get the grandparent directory of BASE_DIR
-    grandparent_dir = os.path.dirname(settings.BASE_DIR)
-    directory = os.path.join(grandparent_dir, "VERSION")
+# (domain, source) of every hydrofabric v2.2 domain geopackage
+HYDROFABRIC_DOMAIN_SOURCES = [('CONUS', 'USGS'), ('CONUS', 'ENVCA'), ('Alaska', 'USGS'), ('Hawaii', 'USGS'),
+                              ('Puerto_Rico', 'USGS')]
+
 
-    with open(directory, 'r') as file:
-        api_version = file.read()
-    return api_version
+def get_hydrofabric_filename(config, domain, source):
+    '''
+    Hydrofabric v2.2 domain geopackage filename, Great Lakes (ENVCA) gages have their own CONUS geopackage
+    '''
+    if domain == 'CONUS' and source != 'ENVCA':
+        return config['hydrofabric_conus_filename']
+    elif domain == 'CONUS' and source == 'ENVCA':
+        return config['hydrofabric_gl_filename']
+    elif domain == 'Alaska':
+        return config['hydrofabric_ak_filename']
+    elif domain == 'Hawaii':
+        return config['hydrofabric_hi_filename']
+    elif domain == 'Puerto_Rico':
+        return config['hydrofabric_prvi_filename']
+    return None
+
+
+def get_api_version():
+    # Content of VERSION, read once per process and cached
+    return load_api_version()
 
 
 def get_subset_dir_file_names(subset_dir):
@@ -0,0 +1,238 @@
+"""
+Per-request scratch workspaces.
+
+A request works in a directory of its own, created with mkdtemp below the workspace root (on tmpfs if one is
+configured and has room for the quota).  The directory is removed when the request ends, whether it succeeded or
+raised, and a janitor removes the workspaces left behind by processes that crashed.  The workspace of the running
+request is held in a context variable, so GageFileManagement.get_local_temp_directory() places the files of any
+code running inside it in the request's workspace.
+"""
+import contextvars
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .utilities import get_config
+
+logger = logging.getLogger(__name__)
+
+# Written in each workspace, identifies the process owning it for the janitor
+OWNER_FILENAME = '.owner'
+
+_current_workspace = contextvars.ContextVar('current_workspace', default=None)
+
+
+class WorkspaceQuotaExceeded(OSError):
+    """The files of a workspace are larger than its quota"""
+
+
+class Workspace:
+    """
+    Scratch directory of one request
+    """
+
+    def __init__(self, path, quota=None):
+        """
+        :param path: The directory, created by the caller
+        :param quota: Maximum size of the files in bytes, None for no limit
+        """
+        self.path = path
+        self.quota = quota
+
+    def directory(self, data_type, gage_id=None):
+        """
+        Same layout as the shared temp directories, data_type/gage_id/ below the workspace
+        :return: The directory, created if not present, with a trailing /
+        """
+        directory = os.path.join(self.path, str(data_type), gage_id or '', '')
+        os.makedirs(directory, exist_ok=True)
+        self.check_quota()
+        return directory
+
+    def usage(self):
+        """
+        :return: Size of the files in the workspace in bytes
+        """
+        size = 0
+        for root, _, files in os.walk(self.path):
+            for filename in files:
+                try:
+                    size += os.lstat(os.path.join(root, filename)).st_size
+                except FileNotFoundError:
+                    pass
+        return size
+
+    def check_quota(self):
+        """
+        Raises WorkspaceQuotaExceeded if the files in the workspace exceed the quota
+        """
+        if self.quota is None:
+            return
+        usage = self.usage()
+        if usage > self.quota:
+            raise WorkspaceQuotaExceeded(f"Workspace {self.path} uses {usage} bytes, quota is {self.quota} bytes")
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.debug(f"Workspace '{self.path}' deleted")
+
+
+def workspace_settings():
+    """
+    :return: Dictionary of the workspace settings of config.yml
+    """
+    config = get_config()
+    quota_mb = config.get('workspace_quota_mb')
+    return {
+        'root': config.get('workspace_root') or os.path.join(tempfile.gettempdir(), 'hydrofabric'),
+        'tmpfs_root': config.get('workspace_tmpfs_root') or None,
+        'quota': int(quota_mb) * 1024 * 1024 if quota_mb else None,
+        'max_age': float(config.get('workspace_max_age', 21600)),
+        'janitor_interval': float(config.get('workspace_janitor_interval', 0)),
+    }
+
+
+def _choose_root(root, tmpfs_root, quota):
+    # tmpfs is used while it has room for a whole workspace, otherwise the disk
+    if tmpfs_root:
+        try:
+            os.makedirs(tmpfs_root, exist_ok=True)
+            if quota is None or shutil.disk_usage(tmpfs_root).free >= quota:
+                return tmpfs_root
+            logger.warning(f"Not enough space on {tmpfs_root} for a workspace, using {root}")
+        except OSError as exception:
+            logger.warning(f"Unable to use {tmpfs_root} for workspaces, using {root} - {exception}")
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def current_workspace():
+    """
+    :return: The workspace of the running request, None outside of one
+    """
+    return _current_workspace.get()
+
+
+@contextmanager
+def scratch_workspace(name):
+    """
+    Runs the block in a new workspace, deleted when the block ends.  Inside a workspace the block uses the existing
+    one and leaves it to its owner.
+    :param name: Prefix of the directory name, e.g. ipe-<gage_id>
+    :return: The Workspace
+    """
+    workspace = _current_workspace.get()
+    if workspace is not None:
+        yield workspace
+        return
+
+    workspace_config = workspace_settings()
+    start_janitor(workspace_config)
+    root = _choose_root(workspace_config['root'], workspace_config['tmpfs_root'], workspace_config['quota'])
+    path = tempfile.mkdtemp(prefix=f"{name}-", dir=root)
+    with open(os.path.join(path, OWNER_FILENAME), 'w') as owner_file:
+        json.dump({'host': socket.gethostname(), 'pid': os.getpid()}, owner_file)
+    workspace = Workspace(path, workspace_config['quota'])
+    logger.debug(f"Workspace '{path}' created")
+
+    token = _current_workspace.set(workspace)
+    try:
+        yield workspace
+    finally:
+        _current_workspace.reset(token)
+        workspace.cleanup()
+
+
+def process_alive(pid):
+    """
+    :return: True if a process of this host has the pid
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_orphaned(path, max_age, now=None):
+    """
+    A workspace of a process of this host is orphaned when the process is gone, however old it is (the mtime of the
+    directory does not change with writes below it).  A workspace of another host sharing the root, or without an
+    owner file, is orphaned when it is older than max_age.
+    """
+    now = time.time() if now is None else now
+    try:
+        with open(os.path.join(path, OWNER_FILENAME)) as owner_file:
+            owner = json.load(owner_file)
+    except (OSError, ValueError):
+        owner = {}
+    if owner.get('host') == socket.gethostname() and isinstance(owner.get('pid'), int):
+        return not process_alive(owner['pid'])
+    try:
+        return now - os.stat(path).st_mtime > max_age
+    except FileNotFoundError:
+        return False
+
+
+def clean_orphaned_workspaces(roots=None, max_age=None):
+    """
+    Removes the orphaned workspaces
+    :param roots: Workspace roots, the configured ones by default
+    :param max_age: Seconds after which a workspace of another host or without owner is orphaned, config
+                    workspace_max_age by default
+    :return: List of the removed directories
+    """
+    if roots is None or max_age is None:
+        workspace_config = workspace_settings()
+        roots = roots or [root for root in (workspace_config['root'], workspace_config['tmpfs_root']) if root]
+        max_age = workspace_config['max_age'] if max_age is None else max_age
+    removed = []
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for entry in os.scandir(root):
+            if entry.is_dir(follow_symlinks=False) and is_orphaned(entry.path, max_age):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed.append(entry.path)
+    if removed:
+        logger.info(f"Removed {len(removed)} orphaned workspaces")
+    return removed
+
+
+_janitor = None
+_janitor_lock = threading.Lock()
+
+
+def start_janitor(workspace_config):
+    """
+    Starts the process-wide daemon thread removing orphaned workspaces, once per process
+    :param workspace_config: workspace_settings(), a janitor_interval of 0 does not start the thread
+    :return: The thread, None if not started
+    """
+    global _janitor
+    interval = workspace_config['janitor_interval']
+    if not interval:
+        return None
+    with _janitor_lock:
+        if _janitor is None:
+            roots = [root for root in (workspace_config['root'], workspace_config['tmpfs_root']) if root]
+
+            def loop():
+                while True:
+                    try:
+                        clean_orphaned_workspaces(roots, workspace_config['max_age'])
+                    except Exception as exception:
+                        logger.error(f"Workspace janitor failed - {exception}")
+                    time.sleep(interval)
+
+            _janitor = threading.Thread(target=loop, name='workspace-janitor', daemon=True)
+            _janitor.start()
+        return _janitor
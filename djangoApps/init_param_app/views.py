@@ -1,26 +1,32 @@
+import json
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
+from rest_framework.utils.encoders import JSONEncoder
 from django.db import connection
 from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from collections import OrderedDict
 
 from rest_framework.views import APIView
 
-from .models import HFFiles
+from .models import HFFiles, IpeJob
 from .util.enums import FileTypeEnum
 from .util.gage_file_management import GageFileManagement
-from .serializers import HFFilesSerializers
+from .serializers import HFFilesSerializers, IpeJobSerializer
 import logging
 from .DatabaseManager import DatabaseManager
 
-from .geopackage import get_geopackage
-from .initial_parameters import get_ipe
+from .geopackage import ensure_geopackage, find_gage
+from .ipe_batch import run_ipe_batch
+from .ipe_jobs import ipe_request_error, compute_ipe, get_ipe_job_pool, PENDING_STATUSES
 
 logger = logging.getLogger(__name__)
 
 HTTP_OK = status.HTTP_200_OK
+HTTP_ACCEPTED = status.HTTP_202_ACCEPTED
 HTTP_UNPROCESSABLE_ENTITY = status.HTTP_422_UNPROCESSABLE_ENTITY
 HTTP_INTERNAL_SERVER_ERROR = status.HTTP_500_INTERNAL_SERVER_ERROR
 HTTP_NOT_FOUND = status.HTTP_404_NOT_FOUND
@@ -80,8 +86,7 @@ def return_geopackage(request):
     version = request.query_params.get('version')
     source = request.query_params.get('source')
     domain = request.query_params.get('domain')
-    gage_file_mgmt = GageFileManagement()
-    
+
     results = None
     loc_status = HTTP_OK
 
@@ -96,14 +101,14 @@ def return_geopackage(request):
         results = {'error': error_str}
         loc_status = HTTP_UNPROCESSABLE_ENTITY
     else:
-        # Determine if this has already been computed, Check DB HFFiles table and S3 for pre-existing data
-        file_found, results = gage_file_mgmt.file_exists(gage_id, version, domain, source, FileTypeEnum.GEOPACKAGE)
-        if not file_found:
-            results = get_geopackage(gage_id, version, source, domain)
-            if 'error' in results:
-                loc_status = HTTP_UNPROCESSABLE_ENTITY
-        else:
-            logger.debug(f"Prexisting Geopackage found for gage_id - {gage_id}, version - {version}, domain - {domain}, source - {source}")
+        _, results = find_gage(gage_id, version, source, domain)
+        if results is not None:
+            return Response(results, status=HTTP_UNPROCESSABLE_ENTITY)
+
+        # Use the geopackage if it has already been computed (HFFiles table and S3), otherwise subset it
+        _, results = ensure_geopackage(gage_id, version, source, domain)
+        if 'error' in results:
+            loc_status = HTTP_UNPROCESSABLE_ENTITY
 
     return Response(results, status=loc_status)
 
@@ -115,36 +120,74 @@ def return_ipe(request):
     source = request.data.get("source")
     domain = request.data.get("domain")
     modules = request.data.get("modules")
-    gage_file_mgmt = GageFileManagement()
 
-    if version != '2.1' and version != '2.2':
-        error_str = 'Hydrofabric version must be 2.2 or 2.1'
-        logger.error(error_str)
-        results = {'error': error_str}
-        return Response(results, status=HTTP_UNPROCESSABLE_ENTITY)
-    elif version == '2.1' and domain != 'CONUS':
-        error_str = 'oCONUS domains not availiable in Hydrofabric version 2.1'
+    request_error = ipe_request_error(gage_id, version, source, domain)
+    if request_error:
+        return Response(request_error, status=HTTP_UNPROCESSABLE_ENTITY)
+
+    return compute_ipe(gage_id, version, source, domain, modules)
+
+
+@api_view(['POST'])
+def return_ipe_batch(request):
+    # Requests are posted as a list, or as {"requests": [...]}, of return_ipe request bodies
+    requests = request.data.get("requests") if isinstance(request.data, dict) else request.data
+    if not isinstance(requests, list) or len(requests) == 0:
+        error_str = 'Batch must be a non empty list of IPE requests'
         logger.error(error_str)
-        results = {'error': error_str}
-        return Response(results, status=HTTP_UNPROCESSABLE_ENTITY)
-
-    # TODO: Determine if IPE files already exists for this module and gage
-    modules_to_calculate = gage_file_mgmt.param_files_exists(gage_id, version, domain, source, FileTypeEnum.PARAMS, modules)
-    #Determine if GEOPACKAGE is necessary and file for this gage exists
-    if len(modules_to_calculate) != 0:
-        # Geopackage file needed
-        geopackage_file_found, results = gage_file_mgmt.file_exists(gage_id, version, domain, source, FileTypeEnum.GEOPACKAGE)
-        if geopackage_file_found:
-            # Get the Geopackage file from S3 and put into local directory
-            gage_file_mgmt.get_file_from_s3(gage_id, version, domain, source, FileTypeEnum.GEOPACKAGE)
-        else:
-            # Build the Geopackage file from scratch
-            results = get_geopackage(gage_id, version, source, domain, keep_file=True)
-            if 'error' in results:
-                return Response(results, status=HTTP_UNPROCESSABLE_ENTITY)
-
-    results = get_ipe(gage_id, version, source, domain, modules, gage_file_mgmt)
-    return results
+        return Response({'error': error_str}, status=HTTP_UNPROCESSABLE_ENTITY)
+
+    # One JSON document per line, written as each request finishes
+    lines = (json.dumps({'index': index, 'request': requests[index], 'status': http_status, 'result': data},
+                        cls=JSONEncoder) + '\n'
+             for index, http_status, data in run_ipe_batch(requests))
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+@api_view(['POST'])
+def submit_ipe_job(request):
+    # Same request as return_ipe, answered at once with the job to poll
+    gage_id = request.data.get("gage_id")
+    version = request.data.get("version")
+    source = request.data.get("source")
+    domain = request.data.get("domain")
+    modules = request.data.get("modules")
+
+    request_error = ipe_request_error(gage_id, version, source, domain)
+    if request_error:
+        return Response(request_error, status=HTTP_UNPROCESSABLE_ENTITY)
+
+    job = get_ipe_job_pool().submit(gage_id, version, source, domain, modules)
+    results = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('ipe_job_status', args=[job.id])),
+        'result_url': request.build_absolute_uri(reverse('ipe_job_result', args=[job.id])),
+    }
+    return Response(results, status=HTTP_ACCEPTED)
+
+
+@api_view(['GET'])
+def ipe_job_status(request, job_id):
+    job = IpeJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return Response({'error': f"No IPE job {job_id}"}, status=HTTP_NOT_FOUND)
+    return Response(IpeJobSerializer(job).data, status=HTTP_OK)
+
+
+@api_view(['GET'])
+def ipe_job_result(request, job_id):
+    job = IpeJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return Response({'error': f"No IPE job {job_id}"}, status=HTTP_NOT_FOUND)
+    if job.status in PENDING_STATUSES:
+        # Not finished, the client keeps polling.  The first poll after a restart starts the job pool of the
+        # process, which queues the jobs of exited processes again.
+        get_ipe_job_pool()
+        return Response(IpeJobSerializer(job).data, status=HTTP_ACCEPTED)
+    if job.result is None:
+        return Response({'error': job.error}, status=job.http_status or HTTP_INTERNAL_SERVER_ERROR)
+    return Response(job.result, status=job.http_status)
 
 
 class GetObservationalData(APIView):
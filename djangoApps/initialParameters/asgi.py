@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'initialParameters.settings')
 
 application = get_asgi_application()
+
+# config.yml is cached per process, SIGHUP reloads it
+from init_param_app.util.app_config import install_reload_handler  # noqa: E402
+from init_param_app.util.gage_file_management import start_s3_reconciler  # noqa: E402
+
+install_reload_handler()
+start_s3_reconciler()
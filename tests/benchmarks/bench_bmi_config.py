@@ -0,0 +1,115 @@
+"""
+Benchmark of the BMI config rendering of the module writers.
+
+Compares the previous per row iterrows rendering of the LSTM and Snow-17 parameter files with the column-wise
+ConfigTemplate rendering, on a synthetic basin with as many attribute columns as a v2.2 divide-attributes layer.
+Run from the repository root:  python tests/benchmarks/bench_bmi_config.py [--divides 20000]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from djangoApps.init_param_app.lstm import NAMELIST_TEMPLATE
+from djangoApps.init_param_app.snow17 import PARAM_TEMPLATE
+from djangoApps.init_param_app.util.bmi_config import carry_forward
+
+
+def synthetic_attributes(count, columns=120, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(rng.uniform(0, 100, (count, columns)), columns=[f'attr_{i}' for i in range(columns)])
+    for name in ['areasqkm', 'mean.slope', 'mean.elevation', 'centroid_x', 'centroid_y', 'MFMIN', 'MFMAX', 'UADJ']:
+        frame[name] = rng.uniform(0, 100, count)
+    frame.loc[rng.uniform(size=count) < 0.2, 'MFMAX'] = np.nan
+    frame.insert(0, 'divide_id', [f'cat-{i}' for i in range(count)])
+    return frame
+
+
+def iterrows_lstm(divide_attr):
+    files = []
+    for index, row in divide_attr.iterrows():
+        namelist = ['area_sqkm: ' + str(row['areasqkm']),
+                    'basin_id: ' + '01000001',
+                    'basin_name:',
+                    'elev_mean: ' + str(row['mean.elevation']),
+                    'initial_state: zero',
+                    'lat: ' + str(row['centroid_y']),
+                    'lon: ' + str(row['centroid_x']),
+                    'slope_mean: ' + str(row['mean.slope']),
+                    'timestep: 1 hour',
+                    'train_cfg_file:',
+                    'verbose: 0']
+        files.append('\n'.join(namelist) + '\n')
+    return files
+
+
+def template_lstm(divide_attr):
+    return NAMELIST_TEMPLATE.render(area=divide_attr['areasqkm'], gage_id='01000001',
+                                    elev=divide_attr['mean.elevation'], lat=divide_attr['centroid_y'],
+                                    lon=divide_attr['centroid_x'], slope=divide_attr['mean.slope'])
+
+
+def iterrows_snow17(df_all):
+    files = []
+    mfmax, mfmin, uadj = 1.00, 0.20, 0.05
+    constants = ['si 500.00', 'pxtemp 1.000', 'nmf 0.150', 'tipm 0.100', 'mbase 0.000', 'plwhc 0.030', 'daygm 0.000',
+                 'adc1 0.050', 'adc2 0.100', 'adc3 0.200', 'adc4 0.300', 'adc5 0.400', 'adc6 0.500', 'adc7 0.600',
+                 'adc8 0.700', 'adc9 0.800', 'adc10 0.900', 'adc11 1.000']
+    for index, row in df_all.iterrows():
+        if not math.isnan(row['MFMIN']): mfmin = row['MFMIN']
+        if not math.isnan(row['MFMAX']): mfmax = row['MFMAX']
+        if not math.isnan(row['UADJ']): uadj = row['UADJ']
+        param_list = ['hru_id ' + str(row['divide_id']),
+                      'hru_area ' + str(row['areasqkm']),
+                      'latitude ' + str(row['centroid_y']),
+                      'elev ' + str(row['mean.elevation']),
+                      'scf 1.100',
+                      'mfmax ' + str(mfmax),
+                      'mfmin ' + str(mfmin),
+                      'uadj ' + str(uadj)] + constants
+        files.append('\n'.join(param_list) + '\n')
+    return files
+
+
+def template_snow17(df_all):
+    return PARAM_TEMPLATE.render(hru_id=df_all['divide_id'], hru_area=df_all['areasqkm'],
+                                 latitude=df_all['centroid_y'], elev=df_all['mean.elevation'],
+                                 mfmax=carry_forward(df_all['MFMAX'], 1.00), mfmin=carry_forward(df_all['MFMIN'], 0.20),
+                                 uadj=carry_forward(df_all['UADJ'], 0.05))
+
+
+def timed(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--divides', type=int, default=20000)
+    args = parser.parse_args()
+
+    divide_attr = synthetic_attributes(args.divides)
+    print(f"{args.divides} divides, {len(divide_attr.columns)} attribute columns")
+    for name, iterrows_render, template_render in [('LSTM', iterrows_lstm, template_lstm),
+                                                   ('Snow-17', iterrows_snow17, template_snow17)]:
+        iterrows_time, iterrows_files = timed(iterrows_render, divide_attr, repeat=1)
+        template_time, template_files = timed(template_render, divide_attr)
+        assert iterrows_files == template_files
+        print(f"  {name}")
+        print(f"    iterrows rendering: {iterrows_time * 1000:10.1f} ms")
+        print(f"    template rendering: {template_time * 1000:10.1f} ms")
+        print(f"    speedup:            {iterrows_time / template_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
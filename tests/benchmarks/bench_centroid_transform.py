@@ -0,0 +1,69 @@
+"""
+Benchmark of the divide centroid CRS transform in hf_attributes.get_hydrofabric_attributes.
+
+Compares the previous per row iterrows transform with the single array transform on a synthetic basin.
+Run from the repository root:  python tests/benchmarks/bench_centroid_transform.py [--divides 10000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from pyproj import CRS, Transformer
+
+DOMAIN_CRS = CRS.from_epsg(5070)
+
+
+def synthetic_divides(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'divide_id': [f'cat-{i}' for i in range(count)],
+                         'centroid_x': rng.uniform(-2.3e6, 2.2e6, count),
+                         'centroid_y': rng.uniform(2.7e5, 3.1e6, count)})
+
+
+def per_row_transform(divide_attr):
+    transformer = Transformer.from_crs(DOMAIN_CRS, 4326)
+    for index, row in divide_attr.iterrows():
+        wgs84_latlon = transformer.transform(row['centroid_x'], row['centroid_y'])
+        divide_attr.loc[index, 'centroid_y'] = wgs84_latlon[0]
+        divide_attr.loc[index, 'centroid_x'] = wgs84_latlon[1]
+    return divide_attr
+
+
+def array_transform(divide_attr, transformer):
+    latitude, longitude = transformer.transform(divide_attr['centroid_x'].to_numpy(dtype='float64'),
+                                                divide_attr['centroid_y'].to_numpy(dtype='float64'))
+    divide_attr['centroid_y'] = latitude
+    divide_attr['centroid_x'] = longitude
+    return divide_attr
+
+
+def timed(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--divides', type=int, default=10000)
+    args = parser.parse_args()
+
+    divides = synthetic_divides(args.divides)
+    per_row_time, per_row = timed(lambda: per_row_transform(divides.copy()), repeat=1)
+    cached_transformer = Transformer.from_crs(DOMAIN_CRS, 4326)
+    array_time, array = timed(lambda: array_transform(divides.copy(), cached_transformer))
+
+    assert per_row[['centroid_x', 'centroid_y']].equals(array[['centroid_x', 'centroid_y']])
+    print(f"{args.divides} divides")
+    print(f"  iterrows transform: {per_row_time * 1000:10.1f} ms")
+    print(f"  array transform:    {array_time * 1000:10.1f} ms")
+    print(f"  speedup:            {per_row_time / array_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
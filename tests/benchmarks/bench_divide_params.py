@@ -0,0 +1,67 @@
+"""
+Benchmark of reading the parameters of a subset's divides from a domain wide parameter CSV file.
+
+Compares pd.read_csv with an isin filter, as the module writers did, with the sorted Parquet file of
+util.divide_params.  Run from the repository root:  python tests/benchmarks/bench_divide_params.py [--divides 800000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from djangoApps.init_param_app.util.divide_params import convert_divide_csv, read_divide_params
+
+
+def synthetic_params(count, seed=0):
+    rng = np.random.default_rng(seed)
+    parameters_df = pd.DataFrame({'divide_id': [f'cat-{i}' for i in rng.permutation(count)]})
+    for name in ['mfmax', 'mfmin', 'uadj', 'si', 'pxtemp', 'nmf', 'tipm', 'mbase', 'plwhc', 'daygm']:
+        parameters_df[name] = rng.uniform(0, 1, count)
+    return parameters_df
+
+
+def timed(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--divides', type=int, default=800000)
+    parser.add_argument('--subset', type=int, default=500, help="Divides of the requested subset")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_file = os.path.join(temp_dir, 'snow17_params_2.2.csv')
+        synthetic_params(args.divides).to_csv(csv_file, index=False)
+        # A subset is a basin, a contiguous run of divide ids
+        start = args.divides // 3
+        catchments = [f'cat-{i}' for i in range(start, start + args.subset)]
+
+        def read_csv():
+            parameters_df = pd.read_csv(csv_file)
+            return parameters_df[parameters_df['divide_id'].isin(catchments)]
+
+        csv_time, from_csv = timed(read_csv, repeat=1)
+        convert_time, _ = timed(lambda: convert_divide_csv(csv_file), repeat=1)
+        parquet_time, from_parquet = timed(lambda: read_divide_params(csv_file, catchments))
+
+    pd.testing.assert_frame_equal(from_csv, from_parquet)
+    print(f"{args.subset} of {args.divides} divides")
+    print(f"  read_csv and isin:  {csv_time * 1000:10.1f} ms")
+    print(f"  sorted Parquet:     {parquet_time * 1000:10.1f} ms  (converted once in {convert_time:.1f} s)")
+    print(f"  speedup:            {csv_time / parquet_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark of the upload of a module's parameter files to S3.
+
+Uploads the files of a synthetic Snow-17 sized file set (two files per divide) to a MinIO server one at a time, as
+write_file_to_s3 did, and with the concurrent S3Uploader.  Start a local server first, e.g.
+    docker run -p 9000:9000 minio/minio server /data
+then run from the repository root:  python tests/benchmarks/bench_s3_upload.py [--divides 5000] [--workers 8]
+"""
+import argparse
+import os
+import sys
+import time
+
+from minio import Minio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from djangoApps.init_param_app.util.output_sink import MemorySink
+from djangoApps.init_param_app.util.s3_uploader import S3Uploader
+
+
+def parameter_files(divides):
+    sink = MemorySink()
+    for i in range(divides):
+        sink.write(f'cat-{i}.snow17_param.txt', f'hru_id cat-{i}\nhru_area 12.5\n' + 'adc 0.500\n' * 30)
+        sink.write(f'cat-{i}.snow17_control.txt', f'&SNOW17_CONTROL\nmain_id = "cat-{i}"\n' + 'flag = 1\n' * 10)
+    return sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--divides', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--endpoint', default=os.environ.get('MINIO_ENDPOINT', 'localhost:9000'))
+    parser.add_argument('--access-key', default=os.environ.get('MINIO_ROOT_USER', 'minioadmin'))
+    parser.add_argument('--secret-key', default=os.environ.get('MINIO_ROOT_PASSWORD', 'minioadmin'))
+    parser.add_argument('--bucket', default='bench-hydrofabric')
+    args = parser.parse_args()
+
+    client = Minio(args.endpoint, access_key=args.access_key, secret_key=args.secret_key, secure=False)
+    try:
+        if not client.bucket_exists(args.bucket):
+            client.make_bucket(args.bucket)
+    except Exception as exception:
+        sys.exit(f"MinIO server at {args.endpoint} is not reachable - {exception}")
+
+    sink = parameter_files(args.divides)
+    print(f"{args.divides} divides, {len(sink.filenames)} files")
+    timings = {}
+    for name, workers in [('serial', 1), (f'{args.workers} workers', args.workers)]:
+        start = time.perf_counter()
+        report = S3Uploader(client, args.bucket, workers=workers).upload(f'bench/{workers}', sink)
+        timings[name] = time.perf_counter() - start
+        assert report.ok, report.summary()
+        print(f"  {name:12s} {timings[name]:8.2f} s  {len(sink.filenames) / timings[name]:8.0f} objects/s")
+    serial, concurrent = timings.values()
+    print(f"  speedup:     {serial / concurrent:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -51,7 +51,7 @@ class TestGeopackage:
     def test_gpkg_bad_gage_id(self):
         """ Check geopackage query results when a bad gage id is supplied """
         results = make_api_call("geopackage", "00000000", "2.2", "USGS", "CONUS")
-        expected = {"error": "Hydrofabric subsetting failed: Error in find_origin(network = query_source_layer(query$source, \"network\"),  : \n  No origin found\nExecution halted\n"}
+        expected = {"error": "Gage 00000000 not found in hydrofabric version 2.2, domain CONUS"}
         assert results == expected
 
     def test_gpkg_bad_version(self):
@@ -85,7 +85,7 @@ class TestInitialParameterEstimates:
     def test_ipe_bad_gage_id(self):
         """ Check for an error when a bad gage id is supplied for an IPE call """
         results = make_api_call("ipe", "00000000", "2.2", "USGS", "CONUS", ["CFE-S", "CFE-X"])
-        expected = {"error": "Hydrofabric subsetting failed: Error in find_origin(network = query_source_layer(query$source, \"network\"),  : \n  No origin found\nExecution halted\n"} 
+        expected = {"error": "Gage 00000000 not found in hydrofabric version 2.2, domain CONUS"} 
         assert results == expected
 
     def test_ipe_bad_module(self):
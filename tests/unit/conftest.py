@@ -0,0 +1,95 @@
+import pytest
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+from pyproj import Transformer
+from shapely.geometry import box, LineString, Point
+
+
+CRS = 'EPSG:5070'
+
+
+def square(index):
+    return box(index * 1000, 0, index * 1000 + 1000, 1000)
+
+
+@pytest.fixture
+def hydrofabric_dir(tmp_path):
+    """
+    Builds a tiny v2.2 CONUS domain geopackage.  Two basins:
+    wb-2 and wb-3 drain to wb-1 (gage 01000001 at poi 10), wb-4 drains to wb-5 (gage 02000002, lat/lon only).
+    """
+    domain_dir = tmp_path / 'v2.2' / 'nextgen' / 'CONUS'
+    domain_dir.mkdir(parents=True)
+    gpkg = str(domain_dir / 'conus.gpkg')
+
+    ids = [1, 2, 3, 4, 5]
+    toids = {1: 'nex-1', 2: 'nex-2', 3: 'nex-3', 4: 'nex-4', 5: 'nex-5'}
+    nexus_toids = {'nex-1': None, 'nex-2': 'wb-1', 'nex-3': 'wb-1', 'nex-4': 'wb-5', 'nex-5': None}
+
+    divides = gpd.GeoDataFrame({'divide_id': [f'cat-{i}' for i in ids],
+                                'id': [f'wb-{i}' for i in ids],
+                                'areasqkm': [1.0] * 5},
+                               geometry=[square(i) for i in ids], crs=CRS)
+    flowpaths = gpd.GeoDataFrame({'id': [f'wb-{i}' for i in ids],
+                                  'toid': [toids[i] for i in ids],
+                                  'divide_id': [f'cat-{i}' for i in ids]},
+                                 geometry=[LineString([(i * 1000, 0), (i * 1000 + 500, 500)]) for i in ids],
+                                 crs=CRS)
+    nexus = gpd.GeoDataFrame({'id': list(nexus_toids), 'toid': list(nexus_toids.values())},
+                             geometry=[Point(i * 1000, 0) for i in ids], crs=CRS)
+    hydrolocations = gpd.GeoDataFrame({'hl_link': ['01000001'], 'hl_reference': ['gages'], 'poi_id': [10]},
+                                      geometry=[Point(1000, 0)], crs=CRS)
+    pois = gpd.GeoDataFrame({'poi_id': [10]}, geometry=[Point(1000, 0)], crs=CRS)
+    network = pd.DataFrame({'id': [f'wb-{i}' for i in ids],
+                            'toid': [toids[i] for i in ids],
+                            'divide_id': [f'cat-{i}' for i in ids],
+                            'poi_id': [10.0, None, None, None, None],
+                            'hydroseq': [1, 2, 3, 4, 5]})
+    divide_attributes = pd.DataFrame({'divide_id': [f'cat-{i}' for i in ids], 'mean.slope': [0.1] * 5})
+    flowpath_attributes = pd.DataFrame({'id': [f'wb-{i}' for i in ids], 'n': [0.06] * 5})
+
+    for layer, data in [('divides', divides), ('flowpaths', flowpaths), ('nexus', nexus),
+                        ('hydrolocations', hydrolocations), ('pois', pois), ('network', network),
+                        ('divide-attributes', divide_attributes), ('flowpath-attributes', flowpath_attributes)]:
+        pyogrio.write_dataframe(data, gpkg, layer=layer, driver='GPKG')
+
+    lon, lat = Transformer.from_crs(CRS, 4326, always_xy=True).transform(5500, 500)
+    pd.DataFrame({'gageid': ['02000002'], 'lon': [lon], 'lat': [lat]}).to_csv(
+        tmp_path / 'v2.2' / 'nextgen' / 'gages_xy.csv', index=False)
+    return tmp_path
+
+
+SOIL_LAYER_ATTRIBUTES = ['mode.bexp_soil_layers_stag', 'geom_mean.dksat_soil_layers_stag',
+                         'geom_mean.psisat_soil_layers_stag', 'mean.smcmax_soil_layers_stag',
+                         'mean.smcwlt_soil_layers_stag']
+
+
+def write_subset_gpkg(gpkg, count=5):
+    """
+    Writes a v2.2 CONUS subset geopackage with count divides laid out in a row, the divide-attributes layer
+    holding the columns read by hf_attributes.get_hydrofabric_attributes
+    """
+    ids = list(range(1, count + 1))
+    divides = gpd.GeoDataFrame({'divide_id': [f'cat-{i}' for i in ids],
+                                'id': [f'wb-{i}' for i in ids],
+                                'areasqkm': [1.0 + i / 10 for i in ids]},
+                               geometry=[square(i) for i in ids], crs=CRS)
+    attributes = {'divide_id': [f'cat-{i}' for i in ids],
+                  'mode.ISLTYP': [float(i % 19 + 1) for i in ids],
+                  'mode.IVGTYP': [float(i % 20 + 1) for i in ids],
+                  'mean.Zmax': [25.0 + i for i in ids],
+                  'mean.elevation': [10000.0 + 10 * i for i in ids],
+                  'centroid_x': [i * 1000 + 500.0 for i in ids],
+                  'centroid_y': [500.0 + i for i in ids]}
+    for name in SOIL_LAYER_ATTRIBUTES:
+        for layer in range(1, 5):
+            attributes[f'{name}={layer}'] = [0.001 * i * layer for i in ids]
+    pyogrio.write_dataframe(divides, gpkg, layer='divides', driver='GPKG')
+    pyogrio.write_dataframe(pd.DataFrame(attributes), gpkg, layer='divide-attributes', driver='GPKG')
+    return gpkg
+
+
+@pytest.fixture
+def subset_gpkg(tmp_path):
+    return write_subset_gpkg(str(tmp_path / 'gauge_01000001.gpkg'))
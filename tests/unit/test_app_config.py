@@ -0,0 +1,104 @@
+import os
+import signal
+
+import pytest
+from unittest.mock import patch
+
+from djangoApps.init_param_app.util import app_config
+from djangoApps.init_param_app.util.app_config import AppConfig, ConfigError
+
+CONFIG_YML = """
+input_dir: "/Hydrofabric/data/input/"
+hydrofabric_dir: "/Hydrofabric/data/hydrofabric"
+hydrofabric_type:  "nextgen"
+hydrofabric_conus_filename: "nwm_patch_conus_nextgen.gpkg"
+s3url: "s3.amazonaws.com"
+region: us-east-1
+s3_upload_workers: 16
+s3_exists_ttl: 900
+"""
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    """Project directory with config.yml and VERSION, the cache of the process is reset around the test"""
+    (tmp_path / 'config.yml').write_text(CONFIG_YML)
+    (tmp_path / 'VERSION').write_text('1.0.16\n')
+    with patch.object(app_config, '_project_file', side_effect=lambda filename: str(tmp_path / filename)), \
+            patch.object(app_config, '_config', None), patch.object(app_config, '_api_version', None), \
+            patch.object(app_config, '_reload_requested', False):
+        yield tmp_path
+
+
+class TestAppConfig:
+    def test_typed_mapping(self):
+        """Test the configuration is a typed, read only mapping with defaults for the known keys"""
+        config = AppConfig({'input_dir': '/in', 'hydrofabric_dir': '/hf', 'hydrofabric_type': 'nextgen',
+                            'hydrofabric_conus_filename': 'conus.gpkg', 's3url': 's3', 'region': 'us-east-1',
+                            's3_exists_ttl': 900, 'custom_key': [1, 2]})
+
+        assert config['s3_exists_ttl'] == 900.0 and isinstance(config['s3_exists_ttl'], float)
+        assert config.get('s3_upload_workers', 8) == 8
+        assert config.s3_upload_workers == 8
+        assert config['custom_key'] == [1, 2]
+        with pytest.raises(TypeError):
+            config['region'] = 'us-west-2'
+        with pytest.raises(AttributeError):
+            config.unknown_key
+
+    def test_validation(self):
+        """Test a missing required key or a value of the wrong type is rejected"""
+        with pytest.raises(ConfigError, match='missing input_dir'):
+            AppConfig({})
+        with pytest.raises(ConfigError, match='s3_upload_workers must be of type int'):
+            AppConfig({'input_dir': '/in', 'hydrofabric_dir': '/hf', 'hydrofabric_type': 'nextgen',
+                       'hydrofabric_conus_filename': 'conus.gpkg', 's3url': 's3', 'region': 'us-east-1',
+                       's3_upload_workers': 'eight'})
+
+    def test_files_read_once(self, project_dir):
+        """Test config.yml and VERSION are read by the first call only"""
+        assert app_config.load_config()['s3_upload_workers'] == 16
+        assert app_config.load_api_version() == '1.0.16\n'
+
+        with patch('builtins.open') as mock_open:
+            assert app_config.load_config() is app_config.load_config()
+            app_config.load_api_version()
+        mock_open.assert_not_called()
+
+    def test_cache_ttls_set_at_load(self, project_dir):
+        """Test the S3 existence cache TTLs are set by the first load, not by a reload"""
+        with patch.object(app_config.s3_existence_cache, 'ttl', 1.0), \
+                patch.object(app_config.s3_existence_cache, 'negative_ttl', 1.0):
+            app_config.load_config()
+            assert (app_config.s3_existence_cache.ttl, app_config.s3_existence_cache.negative_ttl) == (900.0, 60.0)
+
+            (project_dir / 'config.yml').write_text(CONFIG_YML.replace('s3_exists_ttl: 900', 's3_exists_ttl: 30'))
+            app_config.reload_config()
+            assert app_config.s3_existence_cache.ttl == 900.0
+
+    def test_reload(self, project_dir):
+        """Test a reload picks up changes and an invalid file keeps the loaded configuration"""
+        config = app_config.load_config()
+
+        (project_dir / 'config.yml').write_text(CONFIG_YML.replace('s3_upload_workers: 16', 's3_upload_workers: 4'))
+        assert app_config.reload_config()
+        assert app_config.load_config()['s3_upload_workers'] == 4
+        assert app_config.load_config() is not config
+
+        (project_dir / 'config.yml').write_text('s3_upload_workers: [')
+        assert not app_config.reload_config()
+        assert app_config.load_config()['s3_upload_workers'] == 4
+
+    @pytest.mark.skipif(not hasattr(signal, 'SIGHUP'), reason='SIGHUP not available')
+    def test_sighup_reloads(self, project_dir):
+        """Test SIGHUP reloads the configuration"""
+        previous = signal.getsignal(signal.SIGHUP)
+        try:
+            assert app_config.install_reload_handler()
+            (project_dir / 'config.yml').write_text(CONFIG_YML.replace('s3_upload_workers: 16', 's3_upload_workers: 2'))
+            # The handler interrupts a thread holding the lock, it must not wait for it
+            with app_config._lock:
+                os.kill(os.getpid(), signal.SIGHUP)
+            assert app_config.load_config()['s3_upload_workers'] == 2
+        finally:
+            signal.signal(signal.SIGHUP, previous)
@@ -0,0 +1,237 @@
+import os
+import json
+import pytest
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+from unittest.mock import patch, MagicMock
+from djangoApps.init_param_app import (cfe, noah_owp_modular, snow17, sac_sma, topmodel, ueb, lasam_ipe, lstm,
+                                       sft, smp)
+from djangoApps.init_param_app.hf_attributes import HydrofabricAttributes
+from djangoApps.init_param_app.util.bmi_config import ConfigTemplate, carry_forward
+from djangoApps.init_param_app.util.gage_file_management import WriteResult
+from djangoApps.init_param_app.util.output_sink import MemorySink
+from .conftest import CRS, SOIL_LAYER_ATTRIBUTES, square
+from .test_cfe import cfe_params
+
+# Golden outputs of the module writers, one JSON file per case with the files written and the metadata returned.
+# Regenerate with BMI_GOLDEN_UPDATE=1 only when a change of the config files is intended.
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden', 'bmi_config')
+CATCHMENTS = 12
+
+
+def write_module_gpkg(gpkg, count=CATCHMENTS, seed=7):
+    """
+    Writes a v2.2 CONUS subset geopackage with full precision attribute values for every module writer
+    """
+    rng = np.random.default_rng(seed)
+    ids = list(range(1, count + 1))
+    divides = gpd.GeoDataFrame({'divide_id': [f'cat-{i}' for i in ids],
+                                'id': [f'wb-{i}' for i in ids],
+                                'areasqkm': rng.uniform(0.5, 40, count),
+                                'lengthkm': rng.uniform(0.1, 12, count)},
+                               geometry=[square(i) for i in ids], crs=CRS)
+    twi = []
+    for i in ids:
+        values = [{'v': float(v), 'frequency': float(f)} for v, f in zip(rng.uniform(1, 20, 4), rng.dirichlet([1] * 4))]
+        if i % 3 == 0:
+            values[0]['v'] = i
+        twi.append(json.dumps(values))
+    attributes = {'divide_id': [f'cat-{i}' for i in ids],
+                  'mode.ISLTYP': [float(i % 19 + 1) for i in ids],
+                  'mode.IVGTYP': [16.0 if i % 4 == 0 else float(i % 27 + 1) for i in ids],
+                  'mean.Zmax': rng.uniform(5, 250, count),
+                  'mean.elevation': rng.uniform(-500, 300000, count),
+                  'mean.slope': rng.uniform(0, 0.4, count),
+                  'circ_mean.aspect': rng.uniform(0, 360, count),
+                  'centroid_x': rng.uniform(-2.3e6, 2.2e6, count),
+                  'centroid_y': rng.uniform(2.7e5, 3.1e6, count),
+                  'dist_4.twi': twi}
+    for name in SOIL_LAYER_ATTRIBUTES:
+        for layer in range(1, 5):
+            attributes[f'{name}={layer}'] = rng.uniform(0, 1, count) * 10.0 ** -layer
+    pyogrio.write_dataframe(divides, gpkg, layer='divides', driver='GPKG')
+    pyogrio.write_dataframe(pd.DataFrame(attributes), gpkg, layer='divide-attributes', driver='GPKG')
+    return gpkg
+
+
+def write_parameter_csvs(input_dir, count=CATCHMENTS, seed=11):
+    """
+    Writes the CONUS parameter CSV files read by Snow-17, Sac-SMA, UEB and CFE-X, with some NA values
+    """
+    rng = np.random.default_rng(seed)
+    divide_ids = [f'cat-{i}' for i in range(1, count + 1)]
+
+    def frame(columns):
+        values = rng.uniform(0, 100, (count, len(columns)))
+        values[rng.uniform(size=values.shape) < 0.25] = np.nan
+        values[0, 0] = np.nan
+        return pd.DataFrame(values, columns=columns).assign(divide_id=divide_ids)
+
+    frame(['MFMIN', 'MFMAX', 'UADJ']).to_csv(os.path.join(input_dir, 'snow17_params_2.2.csv'), index=False)
+    frame(['UZTWM', 'UZFWM', 'LZTWM', 'LZFPM', 'LZFSM', 'UZK', 'LZPK', 'LZSK', 'ZPERC', 'REXP', 'PFREE']).to_csv(
+        os.path.join(input_dir, 'sac_sma_params_2.2.csv'), index=False)
+    months = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+              'november', 'december']
+    frame(months).to_csv(os.path.join(input_dir, 'ueb_deltat_2.2.csv'), index=False)
+    pd.DataFrame({'divide_id': divide_ids, 'b_Xinanjiang_shape_parameter': rng.uniform(0, 1, count)}).to_csv(
+        os.path.join(input_dir, 'CFE-X_params_CONUS_2.2.csv'), index=False)
+
+
+def metadata(module, *names, initial_value=None):
+    return {'module_name': module, 'parameter_file': {'uri': None},
+            'calibrate_parameters': [{'name': name, 'initial_value': initial_value} for name in names]}
+
+
+def run_writer(case, gpkg, input_dir):
+    """
+    Runs the module writer of a golden case, returns the files written and the metadata returned
+    """
+    sink = MemorySink()
+    hydrofabric = HydrofabricAttributes(gpkg, '2.2', 'CONUS')
+    gage_file_mgmt = MagicMock()
+    gage_file_mgmt.write_file_to_s3.return_value = WriteResult(f's3://test-bucket/{case}', 1, 0, 0.0, 0.0, None)
+    config = {'input_dir': input_dir}
+    args = ('01000001', '2.2', 'USGS', 'CONUS', sink, hydrofabric)
+
+    if case in ('CFE-S', 'CFE-X'):
+        with patch.object(cfe, 'CfeParams') as mock_params, patch.object(cfe, 'get_config', return_value=config):
+            mock_params.objects.filter.side_effect = lambda source_file: cfe_params(source_file)
+            result = cfe.cfe_ipe(case, '2.2', '01000001', 'USGS', 'CONUS', sink, hydrofabric,
+                                 metadata(case, 'soil_params.b', 'Cgw'), gage_file_mgmt, ['SFT'])
+    elif case == 'Noah-OWP-Modular':
+        module_metadata = {'parameter_file': {'uri': None},
+                           'calibrate_parameters': [{'name': 'MFSNO', 'initial_value': list(range(100, 127))},
+                                                    {'name': 'BEXP', 'initial_value': list(range(200, 219))},
+                                                    {'name': 'RSURF_EXP', 'initial_value': [5.0]}]}
+        result = noah_owp_modular.noah_owp_modular_ipe(*args, module_metadata, gage_file_mgmt)
+    elif case == 'Snow-17':
+        with patch.object(snow17, 'get_config', return_value=config):
+            result = snow17.snow17_ipe(*args, metadata(case, 'mfmax', 'uadj', 'elev'), gage_file_mgmt)
+    elif case == 'Sac-SMA':
+        with patch.object(sac_sma, 'get_config', return_value=config):
+            result = sac_sma.sac_sma_ipe(*args, metadata(case, 'uztwm', 'pfree', 'rserv'), gage_file_mgmt)
+    elif case == 'TopModel':
+        result = topmodel.topmodel_ipe(*args, metadata(case, 'szm', 'Q0'), gage_file_mgmt)
+    elif case == 'UEB':
+        with patch.object(ueb, 'get_config', return_value=config):
+            result = ueb.UEB().initial_parameters(*args, metadata(case), gage_file_mgmt)
+    elif case == 'LASAM':
+        with patch.object(lasam_ipe, 'get_hydrus_data', return_value='/resources/vG_default_params_HYDRUS.dat'):
+            result = lasam_ipe.lasam_ipe(*args, metadata(case), gage_file_mgmt, ['SFT'])
+    elif case == 'LSTM':
+        result = lstm.lstm_ipe(*args, metadata(case), gage_file_mgmt)
+    elif case == 'SFT':
+        result = sft.sft_ipe('SFT', '01000001', '2.2', 'USGS', 'CONUS', sink, hydrofabric, ['CFE-S', 'SFT'],
+                             metadata('SFT', 'soil_params.smcmax', 'ice_fraction_scheme'), gage_file_mgmt)
+    else:
+        modules = {'SMP-CFE': ['CFE-X', 'SMP'], 'SMP-TopModel': ['TopModel', 'SMP'], 'SMP-LASAM': ['LASAM', 'SMP']}
+        result = smp.smp_ipe('SMP', '01000001', '2.2', 'USGS', 'CONUS', sink, hydrofabric, modules[case],
+                             metadata('SMP', 'soil_params.b'), gage_file_mgmt)
+
+    filenames = gage_file_mgmt.write_file_to_s3.call_args.args[6]
+    files = {}
+    for filename in filenames:
+        files[filename] = sink.read(filename)
+    return {'files': files, 'metadata': json.loads(json.dumps(result, default=str))}
+
+
+GOLDEN_CASES = ['CFE-S', 'CFE-X', 'Noah-OWP-Modular', 'Snow-17', 'Sac-SMA', 'TopModel', 'UEB', 'LASAM', 'LSTM', 'SFT',
+                'SMP-CFE', 'SMP-TopModel', 'SMP-LASAM']
+
+
+@pytest.fixture(scope='module')
+def module_inputs(tmp_path_factory):
+    input_dir = tmp_path_factory.mktemp('input')
+    write_parameter_csvs(str(input_dir))
+    return write_module_gpkg(str(input_dir / 'gauge_01000001.gpkg')), str(input_dir)
+
+
+class TestGoldenConfigFiles:
+    @pytest.mark.parametrize('case', GOLDEN_CASES)
+    def test_matches_golden(self, case, module_inputs):
+        """Test the config files and metadata of each module writer are byte identical to the golden output"""
+        gpkg, input_dir = module_inputs
+        output = run_writer(case, gpkg, input_dir)
+
+        golden_file = os.path.join(GOLDEN_DIR, f'{case}.json')
+        if os.environ.get('BMI_GOLDEN_UPDATE'):
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            with open(golden_file, 'w') as golden:
+                json.dump(output, golden, indent=1)
+        with open(golden_file) as golden:
+            expected = json.load(golden)
+
+        assert len(output['files']) >= CATCHMENTS
+        assert list(output['files']) == list(expected['files'])
+        for filename, content in expected['files'].items():
+            assert output['files'][filename] == content, filename
+        assert output['metadata'] == expected['metadata']
+
+
+class TestConfigTemplate:
+    def test_render_per_catchment_and_constants(self):
+        """Test fields bound to columns vary by catchment and constants are the same in every file"""
+        frame = pd.DataFrame({'divide_id': ['cat-1', 'cat-2'], 'slope': [0.1, 0.30000000000000004]})
+        template = ConfigTemplate('id={divide_id}\nslope={slope}\ngage={gage_id}\n')
+
+        assert template.fields == ['divide_id', 'slope', 'gage_id']
+        assert template.render(divide_id=frame['divide_id'], slope=frame['slope'], gage_id='01000001') == \
+            ['id=cat-1\nslope=0.1\ngage=01000001\n', 'id=cat-2\nslope=0.30000000000000004\ngage=01000001\n']
+
+    def test_values_formatted_as_iterrows(self):
+        """Test column values are formatted as str() of the values of an iterrows row"""
+        frame = pd.DataFrame({'divide_id': ['cat-1', 'cat-2'],
+                              'soil_type': np.array([3, 16], dtype='int64'),
+                              'area': np.array([0.1, 2.5], dtype='float32')})
+        template = ConfigTemplate('{soil_type} {area}')
+
+        expected = [f"{row['soil_type']} {row['area']}" for _, row in frame.iterrows()]
+        assert template.render(soil_type=frame['soil_type'], area=frame['area']) == expected
+        assert template.render(soil_type=frame['soil_type'].to_numpy(), area=list(frame['area'].to_numpy())) == expected
+
+    def test_format_spec_and_percent_literal(self):
+        """Test format specs and conversions are applied and % in the text is kept"""
+        template = ConfigTemplate('{value:.2f}% {name!r} 100%')
+
+        assert template.render(value=[0.125, 1.0], name='a') == ["0.12% 'a' 100%", "1.00% 'a' 100%"]
+
+    def test_constants_only(self):
+        """Test a template without per catchment fields renders once"""
+        assert ConfigTemplate('{{x}}={x}').render(x=np.float64(1.5)) == ['{x}=1.5']
+
+    def test_unbound_field(self):
+        """Test a field without a binding raises KeyError"""
+        with pytest.raises(KeyError):
+            ConfigTemplate('{a} {b}').render(a=[1])
+
+    def test_length_mismatch(self):
+        """Test sequences of different lengths raise ValueError"""
+        with pytest.raises(ValueError):
+            ConfigTemplate('{a} {b}').render(a=[1, 2], b=[1])
+
+
+class TestCarryForward:
+    def test_na_takes_previous_value(self):
+        """Test NA values take the previous catchment's value, the default before the first value"""
+        values = pd.Series([np.nan, 2.5, np.nan, np.nan, 4.0, np.nan])
+
+        assert carry_forward(values, 1.0).tolist() == [1.0, 2.5, 2.5, 2.5, 4.0, 4.0]
+
+    def test_integers_kept(self):
+        """Test a column without NA keeps its integers"""
+        assert carry_forward(pd.Series([1, 2]), 0.5).tolist() == [1, 2]
+
+
+class TestTwiTable:
+    @pytest.mark.parametrize('twi', [[{'v': 1.5, 'frequency': 0.25}, {'v': 3, 'frequency': 0.75}],
+                                     [{'v': 1, 'frequency': 1}, {'v': 2, 'frequency': 0}],
+                                     [{'v': 1e-05, 'frequency': None}, {'v': 1e16, 'frequency': 0.5}]])
+    def test_matches_pandas(self, twi, tmp_path):
+        """Test the TWI distribution lines match those written by DataFrame.to_csv"""
+        csv_file = tmp_path / 'twi.dat'
+        pd.DataFrame(twi).to_csv(csv_file, sep=' ', columns=['frequency', 'v'], index=False, header=False)
+
+        assert topmodel.format_twi_table(json.dumps(twi)) == (len(twi), csv_file.read_text())
+
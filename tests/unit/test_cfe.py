@@ -0,0 +1,104 @@
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+from djangoApps.init_param_app import cfe
+from djangoApps.init_param_app.hf_attributes import HydrofabricAttributes
+from djangoApps.init_param_app.util.gage_file_management import WriteResult
+from djangoApps.init_param_app.util.output_sink import DirectorySink
+
+
+ATTR_PARAMS = [{'name': 'soil_params.b', 'nwm_name': 'mode.bexp_soil_layers_stag', 'default_value': None, 'units': ''},
+               {'name': 'soil_params.satdk', 'nwm_name': 'geom_mean.dksat_soil_layers_stag',
+                'default_value': None, 'units': 'm s-1'},
+               {'name': 'max_gw_storage', 'nwm_name': 'mean.Zmax', 'default_value': None, 'units': 'm'},
+               {'name': 'soil_params.smcmax', 'nwm_name': 'mean.smcmax_soil_layers_stag',
+                'default_value': None, 'units': 'm/m'},
+               {'name': 'b_Xinanjiang_shape_parameter', 'nwm_name': 'b_Xinanjiang', 'default_value': None,
+                'units': None}]
+
+CONST_PARAMS = [{'name': 'Cgw', 'nwm_name': None, 'default_value': '0.0018', 'units': 'm h-1'},
+                {'name': 'soil_params.depth', 'nwm_name': None, 'default_value': '2.0', 'units': 'm'},
+                {'name': 'urban_decimal_fraction', 'nwm_name': None, 'default_value': '0.0', 'units': None}]
+
+EXPECTED_CAT_1 = '''forcing_file=BMI
+verbosity=1
+surface_partitioning_scheme=Schaake
+surface_runoff_scheme=GIUH
+DEBUG=0
+num_timesteps=1
+is_sft_coupled=0
+ice_content_threshold=0.15
+Cgw=0.0018[m h-1]
+max_gw_storage=0.026[m]
+soil_params.b=2.0[]
+soil_params.depth=2.0[m]
+soil_params.satdk=0.000141[m s-1]
+soil_params.smcmax=0.16[m/m]'''
+
+
+def cfe_params(source_file):
+    rows = MagicMock()
+    rows.values.return_value = ATTR_PARAMS if source_file == 'attr' else CONST_PARAMS
+    return rows
+
+
+def run_cfe(subset_gpkg, subset_dir, module='CFE-S', input_dir=''):
+    gage_file_mgmt = MagicMock()
+    gage_file_mgmt.write_file_to_s3.return_value = WriteResult('s3://test-bucket/cfe', 1, 0, 0.0, 0.0, None)
+    module_metadata = {'parameter_file': {'uri': None},
+                       'calibrate_parameters': [{'name': 'soil_params.b', 'initial_value': None},
+                                                {'name': 'Cgw', 'initial_value': None}]}
+    with patch.object(cfe, 'CfeParams') as mock_params, \
+            patch.object(cfe, 'get_config', return_value={'input_dir': input_dir}):
+        mock_params.objects.filter.side_effect = lambda source_file: cfe_params(source_file)
+        return cfe.cfe_ipe(module, '2.2', '01000001', 'USGS', 'CONUS', DirectorySink(str(subset_dir)),
+                           HydrofabricAttributes(subset_gpkg, '2.2', 'CONUS'), module_metadata, gage_file_mgmt, [])
+
+
+class TestCfe:
+    def test_config_files(self, subset_gpkg, tmp_path):
+        """Test a config file is written per catchment, layered attributes use the first layer"""
+        subset_dir = tmp_path / 'CFE-S'
+        subset_dir.mkdir()
+
+        result = run_cfe(subset_gpkg, subset_dir)
+
+        assert sorted(os.listdir(subset_dir)) == [f'cat-{i}_bmi_config_cfe.txt' for i in range(1, 6)]
+        assert (subset_dir / 'cat-1_bmi_config_cfe.txt').read_text() == EXPECTED_CAT_1
+        assert 'max_gw_storage=0.03[m]' in (subset_dir / 'cat-5_bmi_config_cfe.txt').read_text()
+        assert result['parameter_file']['uri'] == 's3://test-bucket/cfe'
+        assert result['calibrate_parameters'] == [{'name': 'soil_params.b', 'initial_value': '2.0'},
+                                                  {'name': 'Cgw', 'initial_value': '0.0018'}]
+
+    def test_cfe_x_csv_columns(self, subset_gpkg, tmp_path):
+        """Test CFE-X parameters are taken from the CFE-X csv file columns"""
+        subset_dir = tmp_path / 'CFE-X'
+        subset_dir.mkdir()
+        csv_lines = ['divide_id,b_Xinanjiang_shape_parameter'] + [f'cat-{i},0.{i}' for i in range(1, 6)]
+        (tmp_path / 'CFE-X_params_CONUS_2.2.csv').write_text('\n'.join(csv_lines))
+
+        run_cfe(subset_gpkg, subset_dir, module='CFE-X', input_dir=str(tmp_path))
+
+        config = (subset_dir / 'cat-3_bmi_config_cfe.txt').read_text().split('\n')
+        assert 'b_Xinanjiang_shape_parameter=0.3[]' in config
+        assert 'urban_decimal_fraction=0.0[]' in config
+        assert 'surface_partitioning_scheme=Xinanjiang' in config
+
+    def test_missing_attribute(self):
+        """Test a parameter without a matching attribute column is an error"""
+        plan, error = cfe.resolve_attribute_columns([{'name': 'refkdt', 'nwm_name': 'mean.refkdt'}],
+                                                    ['divide_id', 'mean.Zmax'])
+
+        assert plan is None
+        assert error == {'error': "CFE parameter refkdt: no divide attribute matches 'mean.refkdt'"}
+
+    def test_ambiguous_attribute(self):
+        """Test a pattern matching unrelated columns is an error, an exact match is not"""
+        columns = ['divide_id', 'mean.slope_1km', 'mean.slope', 'mean.slope_lc']
+
+        plan, error = cfe.resolve_attribute_columns([{'name': 'slope', 'nwm_name': 'slope'}], columns)
+        assert plan is None
+        assert error['error'].startswith("CFE parameter slope: divide attribute 'slope' is ambiguous")
+
+        plan, error = cfe.resolve_attribute_columns([{'name': 'slope', 'nwm_name': 'mean.slope'}], columns)
+        assert plan == {'slope': 'mean.slope'} and error is None
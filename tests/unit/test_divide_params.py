@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from django.core.management import call_command
+from unittest.mock import patch
+
+from djangoApps.init_param_app.util import divide_params
+from djangoApps.init_param_app.util.divide_params import (convert_divide_csv, read_divide_params, parquet_filename,
+                                                          find_divide_param_csvs)
+
+
+@pytest.fixture
+def params_csv(tmp_path):
+    """Snow-17 parameters of 1000 divides, in a shuffled order with a missing value"""
+    divide_ids = [f'cat-{number}' for number in range(1000)]
+    parameters_df = pd.DataFrame({'divide_id': divide_ids, 'mfmax': [number / 10 for number in range(1000)],
+                                  'scf': range(1000)}).sample(frac=1, random_state=7).reset_index(drop=True)
+    parameters_df.loc[3, 'mfmax'] = None
+    csv_file = tmp_path / 'snow17_params_2.2.csv'
+    parameters_df.to_csv(csv_file, index=False)
+    return str(csv_file)
+
+
+class TestDivideParams:
+    def test_convert_sorted_row_groups(self, params_csv):
+        """Test the Parquet file is sorted by divide_id in row groups with statistics"""
+        parquet_file, rows = convert_divide_csv(params_csv, row_group_size=100)
+
+        assert parquet_file == params_csv.replace('.csv', '.parquet') and rows == 1000
+        metadata = pq.ParquetFile(parquet_file).metadata
+        assert metadata.num_row_groups == 10
+        divide_ids = pq.read_table(parquet_file, columns=['divide_id']).column('divide_id').to_pylist()
+        assert divide_ids == sorted(divide_ids)
+        assert metadata.row_group(0).column(0).statistics.has_min_max
+
+    def test_read_matches_csv(self, params_csv):
+        """Test the divides read from Parquet are the rows, index and order of the CSV filtered with isin"""
+        catchments = ['cat-17', 'cat-3', 'cat-999', 'cat-500', 'cat-unknown']
+        parameters_df = pd.read_csv(params_csv)
+        expected = parameters_df[parameters_df['divide_id'].isin(catchments)]
+        convert_divide_csv(params_csv, row_group_size=100)
+
+        filtered = read_divide_params(params_csv, catchments)
+
+        pd.testing.assert_frame_equal(filtered, expected)
+        assert read_divide_params(params_csv, []).empty
+
+    def test_row_groups_skipped(self, params_csv):
+        """Test the divide_id filter is pushed down to the memory mapped Parquet file"""
+        convert_divide_csv(params_csv, row_group_size=100)
+        read_table = pq.read_table
+
+        with patch.object(divide_params.pq, 'read_table', side_effect=read_table) as mock_read_table:
+            read_divide_params(params_csv, ['cat-17'])
+        kwargs = mock_read_table.call_args.kwargs
+        assert kwargs['memory_map'] and kwargs['filters'] == [('divide_id', 'in', ['cat-17'])]
+
+    def test_csv_fallback(self, params_csv):
+        """Test the CSV is read when the Parquet file is missing or older than the CSV"""
+        assert not os.path.exists(parquet_filename(params_csv))
+        assert read_divide_params(params_csv, ['cat-1'])['divide_id'].tolist() == ['cat-1']
+
+        parquet_file, _ = convert_divide_csv(params_csv)
+        os.utime(parquet_file, (0, 0))
+        with patch.object(divide_params.pq, 'read_table') as mock_read_table:
+            assert read_divide_params(params_csv, ['cat-1'])['divide_id'].tolist() == ['cat-1']
+        mock_read_table.assert_not_called()
+
+        with pytest.raises(FileNotFoundError):
+            read_divide_params(params_csv.replace('snow17', 'sac_sma'), ['cat-1'])
+
+    def test_convert_command(self, params_csv, tmp_path):
+        """Test the command converts the parameter CSV files of input_dir"""
+        (tmp_path / 'gages_xy.csv').write_text('gageid,lon,lat\n')
+        assert find_divide_param_csvs(str(tmp_path)) == [params_csv]
+
+        with patch('djangoApps.init_param_app.management.commands.convert_divide_params.get_config',
+                   return_value={'input_dir': str(tmp_path)}):
+            call_command('convert_divide_params', '--row-group-size', '250')
+
+        assert pq.ParquetFile(parquet_filename(params_csv)).metadata.num_row_groups == 4
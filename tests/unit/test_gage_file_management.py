@@ -0,0 +1,120 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from django.test import override_settings
+
+from djangoApps.init_param_app import ipe_jobs
+from djangoApps.init_param_app.util.coupling import coupling_key
+from djangoApps.init_param_app.util.enums import FileTypeEnum
+from djangoApps.init_param_app.util.gage_file_management import GageFileManagement
+
+API_VERSION = '1.0.16\n'
+
+
+def hffiles_row(module, api_version=API_VERSION, coupling_key='', row_id=1, filename=''):
+    uri = f's3://test-bucket/2.2/CONUS/01123000/PARAMS/USGS/{module}/20250101'
+    if filename:
+        uri = f'{uri}/{filename}'
+    return {'id': row_id, 'module_id': module, 'uri': uri, 'filename': filename, 'api_version': api_version,
+            'ipe_json': f'{{"module_name": "{module}"}}', 'coupling_key': coupling_key}
+
+
+@pytest.fixture
+def gage_file_management():
+    with override_settings(S3_BUCKET='test-bucket'), \
+            patch('djangoApps.init_param_app.util.file_management.get_config',
+                  return_value={'s3url': 's3.us-east-1.amazonaws.com', 'region': 'us-east-1'}), \
+            patch('djangoApps.init_param_app.util.gage_file_management.get_api_version', return_value=API_VERSION):
+        gage_file_mgmt = GageFileManagement()
+        gage_file_mgmt.client = MagicMock()
+        yield gage_file_mgmt
+
+
+class TestParamFilesExists:
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_one_query_for_all_modules(self, mock_hffiles, gage_file_management):
+        """Test the modules are resolved with one query, stale files and files of another coupling are calculated again"""
+        mock_hffiles.objects.filter.return_value.order_by.return_value.values.return_value = [
+            hffiles_row('CFE-S'), hffiles_row('T-Route', api_version='0.9\n'), hffiles_row('SMP')]
+        gage_file_management.s3_prefix_exists = MagicMock(return_value=True)
+        gage_file_management.remove_minio_dir = MagicMock()
+
+        modules_to_calculate, found_modules = gage_file_management.param_files_exists(
+            '01123000', '2.2', 'CONUS', 'USGS', FileTypeEnum.PARAMS, ['CFE-S', 'T-Route', 'SMP', 'Noah-OWP-Modular'])
+
+        assert modules_to_calculate == ['T-Route', 'SMP', 'Noah-OWP-Modular']
+        assert found_modules == {'CFE-S': '{"module_name": "CFE-S"}'}
+        mock_hffiles.objects.filter.assert_any_call(
+            gage_id='01123000', source='USGS', domain='CONUS', module_id__in=['CFE-S', 'T-Route', 'SMP', 'Noah-OWP-Modular'],
+            data_type=FileTypeEnum.PARAMS, hydrofabric_version='2.2')
+        gage_file_management.remove_minio_dir.assert_called_once_with(hffiles_row('T-Route')['uri'])
+        mock_hffiles.objects.filter.return_value.order_by.assert_called_once_with('-id')
+
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_stale_row_deletes_its_own_files(self, mock_hffiles, gage_file_management):
+        """Test a stale row only deletes its own folder and DB row, not the other couplings of the module"""
+        mock_hffiles.objects.filter.return_value.order_by.return_value.values.return_value = [
+            hffiles_row('UEB', api_version='0.9\n', row_id=7, filename='UEB.zip')]
+        gage_file_management.remove_minio_dir = MagicMock()
+
+        assert gage_file_management.param_files_exists('01123000', '2.2', 'CONUS', 'USGS', FileTypeEnum.PARAMS,
+                                                       ['UEB']) == (['UEB'], {})
+        gage_file_management.remove_minio_dir.assert_called_once_with(
+            's3://test-bucket/2.2/CONUS/01123000/PARAMS/USGS/UEB/20250101')
+        mock_hffiles.objects.filter.assert_called_with(id=7)
+        mock_hffiles.objects.filter.return_value.delete.assert_called_once_with()
+
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_missing_s3_files(self, mock_hffiles, gage_file_management):
+        """Test a module whose files are gone from S3 is calculated again"""
+        mock_hffiles.objects.filter.return_value.order_by.return_value.values.return_value = [hffiles_row('CFE-S')]
+        gage_file_management.s3_prefix_exists = MagicMock(return_value=False)
+
+        assert gage_file_management.param_files_exists('01123000', '2.2', 'CONUS', 'USGS', FileTypeEnum.PARAMS,
+                                                       ['CFE-S']) == (['CFE-S'], {})
+
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_coupled_modules(self, mock_hffiles, gage_file_management):
+        """Test coupled modules are reused by requests with the same co-requested modules"""
+        mock_hffiles.objects.filter.return_value.order_by.return_value.values.return_value = [
+            hffiles_row('CFE-S', coupling_key='SFT'), hffiles_row('SFT', coupling_key='CFE-S'),
+            hffiles_row('SMP', coupling_key='CFE-S'), hffiles_row('SMP', coupling_key='TopModel'),
+            hffiles_row('Noah-OWP-Modular', coupling_key=None)]
+        gage_file_management.s3_prefix_exists = MagicMock(return_value=True)
+
+        modules_to_calculate, found_modules = gage_file_management.param_files_exists(
+            '01123000', '2.2', 'CONUS', 'USGS', FileTypeEnum.PARAMS, ['SMP', 'TopModel', 'Noah-OWP-Modular'])
+        assert modules_to_calculate == ['TopModel', 'Noah-OWP-Modular']
+        assert list(found_modules) == ['SMP']
+
+        modules_to_calculate, found_modules = gage_file_management.param_files_exists(
+            '01123000', '2.2', 'CONUS', 'USGS', FileTypeEnum.PARAMS, ['CFE-S', 'SFT', 'SMP'])
+        assert modules_to_calculate == []
+
+        modules_to_calculate, found_modules = gage_file_management.param_files_exists(
+            '01123000', '2.2', 'CONUS', 'USGS', FileTypeEnum.PARAMS, ['CFE-S'])
+        assert modules_to_calculate == ['CFE-S']
+
+    def test_coupling_key(self):
+        """Test the coupling key only holds the requested modules a module depends on"""
+        assert coupling_key('CFE-S', ['SFT', 'CFE-S', 'Noah-OWP-Modular']) == 'SFT'
+        assert coupling_key('CFE-S', ['CFE-S']) == ''
+        assert coupling_key('SMP', ['LASAM', 'SMP', 'CFE-S', 'SFT']) == 'CFE-S,LASAM'
+        assert coupling_key('T-Route', ['T-Route', 'CFE-S']) == ''
+
+    @patch('djangoApps.init_param_app.ipe_jobs.scratch_workspace')
+    @patch('djangoApps.init_param_app.ipe_jobs.ensure_geopackage')
+    @patch('djangoApps.init_param_app.ipe_jobs.GageFileManagement')
+    def test_cached_request_is_a_db_read(self, mock_gage_file_management, mock_ensure_geopackage,
+                                         mock_scratch_workspace):
+        """Test a request with every module found uses no geopackage, workspace or temp directory"""
+        gage_file_mgmt = mock_gage_file_management.return_value
+        gage_file_mgmt.param_files_exists.return_value = ([], {'CFE-S': '{"module_name": "CFE-S"}'})
+
+        data, http_status = ipe_jobs._compute_ipe('01123000', '2.2', 'USGS', 'CONUS', ['CFE-S'])
+
+        assert http_status == 200
+        assert data == {'modules': [{'module_name': 'CFE-S'}]}
+        mock_ensure_geopackage.assert_not_called()
+        mock_scratch_workspace.assert_not_called()
+        gage_file_mgmt.get_local_temp_directory.assert_not_called()
+        gage_file_mgmt.ipe_files_exists.assert_not_called()
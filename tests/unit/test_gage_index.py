@@ -0,0 +1,60 @@
+import pytest
+from djangoApps.init_param_app import geopackage, hf_subsetter
+from djangoApps.init_param_app.util.gage_index import GageIndex, build_gage_index
+
+
+@pytest.fixture
+def gage_index(hydrofabric_dir, tmp_path):
+    type_dir = hydrofabric_dir / 'v2.2' / 'nextgen'
+    build_gage_index([('CONUS', 'USGS', str(type_dir / 'CONUS' / 'conus.gpkg'))],
+                     str(type_dir / 'gages_xy.csv'), '2.2', str(tmp_path / 'gage_index.parquet'))
+    return GageIndex.load(str(tmp_path / 'gage_index.parquet'))
+
+
+class TestGageIndex:
+    def test_hydrolocation_gage(self, gage_index):
+        """Test a hydrolocation gage maps to its poi and outlet divide"""
+        location = gage_index.lookup('01000001', 'USGS', 'CONUS', '2.2')
+
+        assert location.poi_id == '10'
+        assert location.divide_id == 'cat-1'
+        assert location.lon is None
+
+    def test_lat_lon_gage(self, gage_index):
+        """Test a gages_xy.csv gage maps to the divide containing it"""
+        location = gage_index.lookup('02000002', 'USGS', 'CONUS', '2.2')
+
+        assert location.poi_id is None
+        assert location.divide_id == 'cat-5'
+        assert location.lon is not None and location.lat is not None
+
+    def test_unknown_gage(self, gage_index):
+        """Test unknown gages are only known missing for indexed domains"""
+        assert gage_index.lookup('00000000', 'USGS', 'CONUS', '2.2') is None
+        assert gage_index.covers('NWM', 'CONUS', '2.2')
+        assert not gage_index.covers('ENVCA', 'CONUS', '2.2')
+        assert not gage_index.covers('USGS', 'Alaska', '2.2')
+
+    def test_find_gage_rejects_unknown_gage(self, gage_index, monkeypatch):
+        """Test get_geopackage callers get an error for a gage missing from an indexed domain"""
+        monkeypatch.setattr(geopackage, 'get_gage_index', lambda: gage_index)
+
+        location, error = geopackage.find_gage('00000000', '2.2', 'USGS', 'CONUS')
+        assert location is None
+        assert error == {'error': 'Gage 00000000 not found in hydrofabric version 2.2, domain CONUS'}
+
+        location, error = geopackage.find_gage('00000000', '2.2', 'ENVCA', 'CONUS')
+        assert location is None and error is None
+
+    def test_subset_from_index_location(self, gage_index, hydrofabric_dir, tmp_path, monkeypatch):
+        """Test the python subsetter starts from the indexed divide without searching for the gage"""
+        monkeypatch.setattr(hf_subsetter, 'get_upstream_index_dir', lambda *args: None)
+        location = gage_index.lookup('02000002', 'USGS', 'CONUS', '2.2')
+
+        outfile = hf_subsetter.subset(gauge_id='02000002', outpath=str(tmp_path), outfile='gauge_02000002.gpkg',
+                                      hydrofabric_data=str(hydrofabric_dir), hydrofabric_version='2.2',
+                                      hydrofabric_type='nextgen', domain='CONUS', hydrofabric_filename='conus.gpkg',
+                                      source='USGS', poi_id=location.poi_id, divide_id=location.divide_id)
+
+        divides = hf_subsetter.pyogrio.read_dataframe(outfile, layer='divides')
+        assert sorted(divides['divide_id']) == ['cat-4', 'cat-5']
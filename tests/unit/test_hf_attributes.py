@@ -0,0 +1,89 @@
+import pytest
+import pandas as pd
+import geopandas as gpd
+from pyproj import Transformer
+from djangoApps.init_param_app import hf_attributes
+from .conftest import CRS
+
+
+class TestHydrofabricAttributes:
+    def test_centroids_converted_to_wgs84(self, subset_gpkg):
+        """Test the array transform matches transforming each centroid on its own"""
+        divide_attr = hf_attributes.get_hydrofabric_attributes(subset_gpkg, '2.2', 'CONUS')
+
+        transformer = Transformer.from_crs(CRS, 4326)
+        for index, row in divide_attr.iterrows():
+            latitude, longitude = transformer.transform(float(1000 * (index + 1) + 500), 501.0 + index)
+            assert row['centroid_y'] == latitude
+            assert row['centroid_x'] == longitude
+
+    def test_transformer_cached_per_crs(self, subset_gpkg):
+        """Test the transformer is created once per CRS"""
+        hf_attributes.get_wgs84_transformer.cache_clear()
+
+        hf_attributes.get_hydrofabric_attributes(subset_gpkg, '2.2', 'CONUS')
+        hf_attributes.get_hydrofabric_attributes(subset_gpkg, '2.2', 'CONUS')
+
+        info = hf_attributes.get_wgs84_transformer.cache_info()
+        assert info.misses == 1 and info.hits == 1
+
+    def test_unit_conversions(self, subset_gpkg):
+        """Test Zmax, elevation, soil type and quartz columns"""
+        divide_attr = hf_attributes.get_hydrofabric_attributes(subset_gpkg, '2.2', 'CONUS')
+
+        assert list(divide_attr['mean.Zmax']) == pytest.approx([0.026, 0.027, 0.028, 0.029, 0.03])
+        assert list(divide_attr['mean.elevation']) == pytest.approx([100.1, 100.2, 100.3, 100.4, 100.5])
+        assert divide_attr['mode.ISLTYP'].dtype.kind == 'i'
+        assert list(divide_attr['quartz']) == [0.82, 0.6, 0.25, 0.1, 0.4]
+        assert list(divide_attr['areasqkm']) == [1.1, 1.2, 1.3, 1.4, 1.5]
+
+
+class TestHydrofabricAttributesContext:
+    def test_layers_read_once(self, subset_gpkg, monkeypatch):
+        """Test every module of a request shares one read of each layer"""
+        reads = []
+        read_dataframe = hf_attributes.pyogrio.read_dataframe
+        monkeypatch.setattr(hf_attributes.pyogrio, 'read_dataframe',
+                            lambda *args, **kwargs: reads.append(kwargs['layer']) or read_dataframe(*args, **kwargs))
+        hydrofabric = hf_attributes.HydrofabricAttributes(subset_gpkg, '2.2', 'CONUS')
+
+        first = hydrofabric.divide_attributes()
+        second = hydrofabric.divide_attributes()
+        divides = hydrofabric.divides()
+
+        assert sorted(reads) == ['divide-attributes', 'divides']
+        assert first is not second
+        assert first.equals(second)
+        assert list(divides['divide_id']) == list(first['divide_id'])
+
+    def test_module_changes_not_shared(self, subset_gpkg):
+        """Test columns added by one module are not seen by the next"""
+        hydrofabric = hf_attributes.HydrofabricAttributes(subset_gpkg, '2.2', 'CONUS')
+
+        first = hydrofabric.divide_attributes()
+        first['module_column'] = 1
+
+        assert 'module_column' not in hydrofabric.divide_attributes()
+
+    def test_open_error(self, tmp_path):
+        """Test an unreadable geopackage is reported as an error dictionary"""
+        gpkg_file = str(tmp_path / 'missing.gpkg')
+        hydrofabric = hf_attributes.HydrofabricAttributes(gpkg_file, '2.2', 'CONUS')
+
+        assert hydrofabric.divide_attributes() == {'error': 'Error opening ' + gpkg_file}
+
+    def test_divides_read_without_geometry(self, subset_gpkg):
+        """Test only the declared divides columns are read, and no geometry"""
+        hydrofabric = hf_attributes.HydrofabricAttributes(subset_gpkg, '2.2', 'CONUS')
+
+        divides = hydrofabric.divides()
+
+        assert list(divides.columns) == ['divide_id', 'areasqkm']
+
+    def test_same_frame_as_geopandas(self, subset_gpkg):
+        """Test the attribute layer reads match reading the layers with geopandas"""
+        expected = gpd.read_file(subset_gpkg, layer='divide-attributes')
+
+        divide_attr = hf_attributes.read_attribute_layer(subset_gpkg, 'divide-attributes')
+
+        pd.testing.assert_frame_equal(divide_attr, pd.DataFrame(expected))
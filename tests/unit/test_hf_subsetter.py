@@ -0,0 +1,95 @@
+import os
+import pytest
+import numpy as np
+import pyogrio
+from djangoApps.init_param_app import hf_subsetter
+from djangoApps.init_param_app.util.upstream_index import UpstreamIndex, build_upstream_index
+
+
+@pytest.fixture(autouse=True)
+def index_dir(monkeypatch, tmp_path):
+    """Points the subsetter at a per test upstream index directory, empty unless a test builds the index"""
+    index_dir = str(tmp_path / 'upstream_index')
+    monkeypatch.setattr(hf_subsetter, 'get_upstream_index_dir', lambda *args: index_dir)
+    monkeypatch.setattr(hf_subsetter, '_networks', {})
+    return index_dir
+
+
+def run_subset(hydrofabric_dir, tmp_path, gage_id):
+    return hf_subsetter.hf_subset(gauge_id=gage_id, outpath=str(tmp_path), outfile=f'gauge_{gage_id}.gpkg',
+                                  hydrofabric_data=str(hydrofabric_dir), hydrofabric_version='2.2',
+                                  hydrofabric_type='nextgen', domain='CONUS', hydrofabric_filename='conus.gpkg',
+                                  source='USGS')
+
+
+class TestHfSubsetter:
+    def test_subset_from_hydrolocation(self, hydrofabric_dir, tmp_path):
+        """Test subsetting upstream of a gage found in the hydrolocations layer"""
+        result = run_subset(hydrofabric_dir, tmp_path, '01000001')
+
+        assert result['status'] == 'ok'
+        outfile = result['outfile']
+        divides = pyogrio.read_dataframe(outfile, layer='divides')
+        assert sorted(divides['divide_id']) == ['cat-1', 'cat-2', 'cat-3']
+        network = pyogrio.read_dataframe(outfile, layer='network')
+        assert sorted(network['id']) == ['wb-1', 'wb-2', 'wb-3']
+        nexus = pyogrio.read_dataframe(outfile, layer='nexus')
+        assert sorted(nexus['id']) == ['nex-1', 'nex-2', 'nex-3']
+        attributes = pyogrio.read_dataframe(outfile, layer='divide-attributes')
+        assert len(attributes) == 3
+        assert len(pyogrio.read_dataframe(outfile, layer='hydrolocations')) == 1
+
+    def test_subset_from_lat_lon(self, hydrofabric_dir, tmp_path):
+        """Test subsetting a gage that is only in gages_xy.csv"""
+        result = run_subset(hydrofabric_dir, tmp_path, '02000002')
+
+        assert result['status'] == 'ok'
+        divides = pyogrio.read_dataframe(result['outfile'], layer='divides')
+        assert sorted(divides['divide_id']) == ['cat-4', 'cat-5']
+        assert 'hydrolocations' not in pyogrio.list_layers(result['outfile'])[:, 0]
+
+    def test_unknown_gage(self, hydrofabric_dir, tmp_path):
+        """Test an unknown gage is reported as a structured error"""
+        result = run_subset(hydrofabric_dir, tmp_path, '00000000')
+
+        assert result['status'] == 'error'
+        assert result['message'] == 'Gage not found as hydrolocation or in gage lat/lon file'
+        assert not os.path.exists(tmp_path / 'gauge_00000000.gpkg')
+
+    def test_subset_from_saved_index(self, hydrofabric_dir, tmp_path, index_dir):
+        """Test a subset traced over a prebuilt memory mapped index gives the same layers"""
+        gpkg = str(hydrofabric_dir / 'v2.2' / 'nextgen' / 'CONUS' / 'conus.gpkg')
+        build_upstream_index(gpkg, index_dir)
+
+        result = run_subset(hydrofabric_dir, tmp_path, '01000001')
+
+        assert result['status'] == 'ok'
+        assert isinstance(hf_subsetter._networks[gpkg][1].indices, np.memmap)
+        divides = pyogrio.read_dataframe(result['outfile'], layer='divides')
+        assert sorted(divides['divide_id']) == ['cat-1', 'cat-2', 'cat-3']
+
+
+class TestUpstreamIndex:
+    def test_upstream_trace(self, hydrofabric_dir, tmp_path):
+        """Test the CSR trace finds every flowpath and nexus upstream of a node"""
+        gpkg = str(hydrofabric_dir / 'v2.2' / 'nextgen' / 'CONUS' / 'conus.gpkg')
+        build_upstream_index(gpkg, str(tmp_path / 'index'))
+        index = UpstreamIndex.load(str(tmp_path / 'index'))
+
+        nodes = index.upstream_of(index.node_of('wb-1'))
+
+        assert sorted(index.ids[nodes]) == ['nex-2', 'nex-3', 'wb-1', 'wb-2', 'wb-3']
+        assert index.divides_of(nodes) == {'cat-1', 'cat-2', 'cat-3'}
+        assert index.pois_of(nodes) == {'10'}
+        assert index.most_downstream(index.nodes_for_pois({'10'})) == index.node_of('wb-1')
+        assert index.node_of('wb-9') is None
+
+    def test_stale_index_is_ignored(self, hydrofabric_dir, index_dir):
+        """Test an index older than its geopackage is not used"""
+        gpkg = str(hydrofabric_dir / 'v2.2' / 'nextgen' / 'CONUS' / 'conus.gpkg')
+        build_upstream_index(gpkg, index_dir)
+        os.utime(gpkg, (os.path.getmtime(gpkg) + 10, os.path.getmtime(gpkg) + 10))
+
+        network = hf_subsetter._get_domain_network(gpkg, index_dir)
+
+        assert not isinstance(network.indices, np.memmap)
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from unittest.mock import patch
+from rest_framework.response import Response
+
+from djangoApps.init_param_app.ipe_batch import plan_batch, run_ipe_batch
+
+
+def ipe_request(gage_id, modules, source='USGS'):
+    return {'gage_id': gage_id, 'version': '2.2', 'source': source, 'domain': 'CONUS', 'modules': modules}
+
+
+def fake_compute_ipe(gage_id, version, source, domain, modules):
+    return Response({'modules': [{'module_name': module, 'gage_id': gage_id} for module in modules]}, status=200)
+
+
+class TestIpeBatch:
+    def test_plan_batch(self):
+        """Test requests are grouped by gage, identical requests share a task and malformed ones are reported"""
+        requests = [ipe_request('01123000', ['CFE-S']),
+                    ipe_request('01123000', ['CFE-S', 'CFE-S']),
+                    ipe_request('01123000', ['CFE-S', 'SFT']),
+                    ipe_request('02450000', ['CFE-S']),
+                    {'gage_id': '03000000', 'modules': ['CFE-S']},
+                    'CFE-S']
+
+        errors, groups = plan_batch(requests)
+
+        assert [index for index, _ in errors] == [4, 5]
+        assert 'version, source, domain' in errors[0][1]['error']
+        assert list(groups) == ['01123000', '02450000']
+        assert list(groups['01123000'].values()) == [[0, 1], [2]]
+
+    @patch('djangoApps.init_param_app.ipe_batch.connection')
+    @patch('djangoApps.init_param_app.ipe_batch.ipe_request_error')
+    @patch('djangoApps.init_param_app.ipe_batch.compute_ipe', side_effect=fake_compute_ipe)
+    def test_run_ipe_batch(self, mock_compute_ipe, mock_request_error, mock_connection):
+        """Test each distinct request is computed once and every request gets its result"""
+        mock_request_error.side_effect = lambda gage_id, *args: {'error': 'bad gage'} if gage_id == 'bad' else None
+        requests = [ipe_request('01123000', ['CFE-S']),
+                    ipe_request('02450000', ['T-Route']),
+                    ipe_request('01123000', ['CFE-S']),
+                    ipe_request('bad', ['CFE-S'])]
+
+        results = {index: (http_status, data) for index, http_status, data in run_ipe_batch(requests, workers=2)}
+
+        assert mock_compute_ipe.call_count == 2
+        assert results[0] == results[2] == (200, {'modules': [{'module_name': 'CFE-S', 'gage_id': '01123000'}]})
+        assert results[1][1]['modules'][0]['module_name'] == 'T-Route'
+        assert results[3] == (422, {'error': 'bad gage'})
+
+    @patch('djangoApps.init_param_app.ipe_batch.connection')
+    @patch('djangoApps.init_param_app.ipe_batch.ipe_request_error', return_value=None)
+    @patch('djangoApps.init_param_app.ipe_batch.compute_ipe', side_effect=RuntimeError('boom'))
+    def test_run_ipe_batch_exception(self, mock_compute_ipe, mock_request_error, mock_connection):
+        """Test an exception fails only its request"""
+        results = list(run_ipe_batch([ipe_request('01123000', ['CFE-S'])], workers=1))
+
+        assert results == [(0, 500, {'error': 'boom'})]
+
+    @patch('djangoApps.init_param_app.ipe_batch.connection')
+    @patch('djangoApps.init_param_app.ipe_batch.ipe_request_error', return_value=None)
+    @patch('djangoApps.init_param_app.ipe_batch.compute_ipe', side_effect=fake_compute_ipe)
+    def test_batch_endpoint_streams_ndjson(self, mock_compute_ipe, mock_request_error, mock_connection, client):
+        """Test the endpoint streams one JSON line per request"""
+        requests = [ipe_request('01123000', ['CFE-S']), ipe_request('02450000', ['CFE-S'])]
+        with patch('djangoApps.init_param_app.ipe_batch.get_config', return_value={'ipe_batch_workers': 2}):
+            response = client.post('/hydrofabric/modules/parameters/batch/', {'requests': requests},
+                                   content_type='application/json')
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert sorted(line['index'] for line in lines) == [0, 1]
+        assert all(line['status'] == 200 and line['request'] == requests[line['index']] for line in lines)
+
+    def test_batch_endpoint_rejects_empty_batch(self, client):
+        """Test a batch without requests is rejected"""
+        response = client.post('/hydrofabric/modules/parameters/batch/', {'requests': []},
+                               content_type='application/json')
+
+        assert response.status_code == 422
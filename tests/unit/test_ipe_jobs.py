@@ -0,0 +1,144 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+import pytest
+from unittest.mock import patch, MagicMock
+from django.utils import timezone
+from rest_framework.response import Response
+
+from djangoApps.init_param_app.ipe_jobs import IpeJobPool, run_ipe_job
+from djangoApps.init_param_app.models import IpeJob
+from djangoApps.init_param_app.util.enums import StatusEnum
+
+IPE_REQUEST = {'gage_id': '01123000', 'version': '2.2', 'source': 'USGS', 'domain': 'CONUS', 'modules': ['CFE-S']}
+
+
+@pytest.fixture
+def inline_pool():
+    """Job pool running each job in the submitting thread, the in memory test database is per thread"""
+    pool = IpeJobPool(workers=1)
+    pool._executor = MagicMock()
+    pool._executor.submit.side_effect = lambda function, job_id: run_ipe_job(job_id)
+    with patch('djangoApps.init_param_app.views.get_ipe_job_pool', return_value=pool):
+        yield pool
+
+
+@pytest.mark.django_db
+class TestIpeJobs:
+    @patch('djangoApps.init_param_app.ipe_jobs.compute_ipe')
+    def test_run_ipe_job_done(self, mock_compute_ipe):
+        """Test a successful job stores the module list and its status"""
+        mock_compute_ipe.return_value = Response({'modules': [{'module_name': 'CFE-S'}]}, status=200)
+        job = IpeJob.objects.create(gage_id='01123000', hydrofabric_version='2.2', source='USGS', domain='CONUS',
+                                    modules=['CFE-S'])
+
+        run_ipe_job(job.id)
+
+        job.refresh_from_db()
+        assert job.status == StatusEnum.DONE
+        assert job.result == {'modules': [{'module_name': 'CFE-S'}]}
+        assert job.http_status == 200
+        assert job.started_time <= job.finished_time
+        mock_compute_ipe.assert_called_once_with('01123000', '2.2', 'USGS', 'CONUS', ['CFE-S'])
+
+    @patch('djangoApps.init_param_app.ipe_jobs.compute_ipe')
+    def test_run_ipe_job_failed(self, mock_compute_ipe):
+        """Test an error response fails the job and an exception is a server error"""
+        mock_compute_ipe.return_value = Response({'error': 'Hydrofabric subsetting failed'}, status=422)
+        job = IpeJob.objects.create(gage_id='01123000', hydrofabric_version='2.2', source='USGS', domain='CONUS',
+                                    modules=['CFE-S'])
+        job = run_ipe_job(job.id)
+        assert (job.status, job.http_status, job.error) == (StatusEnum.FAILED, 422, 'Hydrofabric subsetting failed')
+
+        mock_compute_ipe.side_effect = RuntimeError('boom')
+        job = run_ipe_job(job.id)
+        assert (job.status, job.http_status, job.error) == (StatusEnum.SERVER_ERROR, 500, 'boom')
+
+    @patch('djangoApps.init_param_app.views.ipe_request_error', return_value=None)
+    @patch('djangoApps.init_param_app.ipe_jobs.compute_ipe')
+    def test_submit_and_poll(self, mock_compute_ipe, mock_request_error, inline_pool, client):
+        """Test the submission returns the job at once and the result endpoint returns the stored response"""
+        mock_compute_ipe.return_value = Response({'modules': [{'module_name': 'CFE-S'}]}, status=200)
+
+        response = client.post('/hydrofabric/modules/parameters/jobs/', IPE_REQUEST, content_type='application/json')
+        assert response.status_code == 202
+        body = response.json()
+        assert body['status_url'].endswith(f"/hydrofabric/modules/parameters/jobs/{body['job_id']}/")
+
+        response = client.get(body['status_url'])
+        assert response.status_code == 200
+        assert response.json()['status'] == StatusEnum.DONE
+        assert response.json()['version'] == '2.2'
+
+        response = client.get(body['result_url'])
+        assert response.status_code == 200
+        assert response.json() == {'modules': [{'module_name': 'CFE-S'}]}
+
+    @patch('djangoApps.init_param_app.views.get_ipe_job_pool')
+    def test_pending_and_unknown_jobs(self, mock_get_pool, client):
+        """Test the result of an unfinished job is 202 with its status and an unknown job is 404"""
+        job = IpeJob.objects.create(gage_id='01123000', hydrofabric_version='2.2', source='USGS', domain='CONUS',
+                                    modules=['CFE-S'], status=StatusEnum.RUNNING)
+
+        response = client.get(f'/hydrofabric/modules/parameters/jobs/{job.id}/result/')
+        assert response.status_code == 202
+        assert response.json()['status'] == StatusEnum.RUNNING
+        mock_get_pool.assert_called_once()
+
+        response = client.get(f'/hydrofabric/modules/parameters/jobs/{uuid.uuid4()}/')
+        assert response.status_code == 404
+
+    def test_submit_queues_ready_job(self, inline_pool):
+        """Test a job is created ready and owned by the pool that queued it"""
+        inline_pool._executor.submit.side_effect = None
+
+        job = inline_pool.submit('01123000', '2.2', 'USGS', 'CONUS', ['CFE-S'])
+
+        job.refresh_from_db()
+        assert (job.status, job.owner) == (StatusEnum.READY, inline_pool.owner)
+        inline_pool._executor.submit.assert_called_once()
+
+    @patch('djangoApps.init_param_app.ipe_jobs.process_alive', side_effect=lambda pid: pid == 4242)
+    def test_recover_jobs_of_exited_processes(self, mock_process_alive, inline_pool):
+        """Test the jobs of exited processes of this host are queued again and stale jobs of other hosts failed"""
+        inline_pool._executor.submit.side_effect = None
+        host = socket.gethostname()
+        old = timezone.now() - timedelta(days=1)
+
+        def job(status, owner, created_time=None):
+            return IpeJob.objects.create(gage_id='01123000', hydrofabric_version='2.2', source='USGS',
+                                         domain='CONUS', modules=['CFE-S'], status=status, owner=owner,
+                                         created_time=created_time or timezone.now())
+
+        exited = job(StatusEnum.RUNNING, f'{host}:4243:0a1b2c3d')
+        restarted = job(StatusEnum.READY, f'{host}:{os.getpid()}:0a1b2c3d')
+        unowned = job(StatusEnum.READY, None)
+        alive = job(StatusEnum.RUNNING, f'{host}:4242:0a1b2c3d')
+        remote = job(StatusEnum.RUNNING, 'other-host:7:0a1b2c3d')
+        remote_stale = job(StatusEnum.READY, 'other-host:7:0a1b2c3d', old)
+        done = job(StatusEnum.DONE, f'{host}:4243:0a1b2c3d')
+
+        requeued = inline_pool.recover()
+
+        assert set(requeued) == {exited.id, restarted.id, unowned.id}
+        assert {call.args[1] for call in inline_pool._executor.submit.call_args_list} == set(requeued)
+        for recovered in (exited, restarted, unowned):
+            recovered.refresh_from_db()
+            assert (recovered.status, recovered.owner) == (StatusEnum.READY, inline_pool.owner)
+        for untouched, status in ((alive, StatusEnum.RUNNING), (remote, StatusEnum.RUNNING), (done, StatusEnum.DONE)):
+            untouched.refresh_from_db()
+            assert untouched.status == status
+        remote_stale.refresh_from_db()
+        assert (remote_stale.status, remote_stale.http_status) == (StatusEnum.SERVER_ERROR, 500)
+        assert inline_pool.recover() == []
+
+    @patch('djangoApps.init_param_app.views.ipe_request_error', return_value={'error': 'Hydrofabric version must be 2.2 or 2.1'})
+    def test_submit_invalid_request(self, mock_request_error, client):
+        """Test an invalid request is rejected without creating a job"""
+        response = client.post('/hydrofabric/modules/parameters/jobs/', dict(IPE_REQUEST, version='3.0'),
+                               content_type='application/json')
+
+        assert response.status_code == 422
+        assert IpeJob.objects.count() == 0
@@ -0,0 +1,178 @@
+import os
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timezone, timedelta
+import requests
+from djangoApps.init_param_app.util import minio_client
+from djangoApps.init_param_app.util.minio_client import (CachedCredentialsProvider, get_credentials,
+                                                         get_imds_token, get_instance_credentials, get_minio_client,
+                                                         reset_minio_clients)
+
+
+@pytest.fixture
+def mock_env_credentials():
+    env_vars = {
+        'AWS_ACCESS_KEY_ID': 'test-access-key',
+        'AWS_SECRET_ACCESS_KEY': 'test-secret-key',
+        'AWS_SESSION_TOKEN': 'test-session-token'
+    }
+    with patch.dict(os.environ, env_vars):
+        yield env_vars
+
+
+@pytest.fixture
+def mock_imds_credentials():
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    return {
+        'AccessKeyId': 'imds-access-key',
+        'SecretAccessKey': 'imds-secret-key',
+        'Token': 'imds-session-token',
+        'Expiration': expiry.strftime('%Y-%m-%dT%H:%M:%SZ')
+    }
+
+
+def instance_credentials(access_key='imds-access-key', expires_in=timedelta(hours=1)):
+    return {'access_key': access_key, 'secret_key': 'imds-secret-key', 'session_token': 'imds-session-token',
+            'expiry': datetime.now(timezone.utc) + expires_in}
+
+
+@pytest.fixture
+def provider():
+    provider = CachedCredentialsProvider(fetch=MagicMock(return_value=instance_credentials()))
+    yield provider
+    provider.stop()
+
+
+class TestCredentials:
+    @patch('requests.put')
+    def test_get_imds_token_success(self, mock_put):
+        """Test successful IMDSv2 token retrieval"""
+        mock_response = MagicMock()
+        mock_response.ok = True
+        mock_response.text = 'test-token'
+        mock_put.return_value = mock_response
+
+        token = get_imds_token()
+
+        assert token == 'test-token'
+        mock_put.assert_called_once_with(
+            "http://169.254.169.254/latest/api/token",
+            headers={"X-aws-ec2-metadata-token-ttl-seconds": "21600"},
+            timeout=2
+        )
+
+    @patch('requests.put')
+    def test_get_imds_token_failure(self, mock_put):
+        """Test failed IMDSv2 token retrieval"""
+        mock_put.side_effect = requests.RequestException()
+
+        assert get_imds_token() is None
+        mock_put.assert_called_once()
+
+    @patch('requests.get')
+    @patch('requests.put')
+    def test_get_instance_credentials_success(self, mock_put, mock_get, mock_imds_credentials):
+        """Test successful instance credential retrieval"""
+        mock_put.return_value = MagicMock(ok=True, text='test-token')
+        mock_role_response = MagicMock(ok=True, text='test-role')
+        mock_creds_response = MagicMock(ok=True)
+        mock_creds_response.json.return_value = mock_imds_credentials
+        mock_get.side_effect = [mock_role_response, mock_creds_response]
+
+        creds = get_instance_credentials()
+
+        assert creds['access_key'] == mock_imds_credentials['AccessKeyId']
+        assert creds['secret_key'] == mock_imds_credentials['SecretAccessKey']
+        assert creds['session_token'] == mock_imds_credentials['Token']
+        assert isinstance(creds['expiry'], datetime)
+
+    def test_get_credentials_from_env(self, mock_env_credentials):
+        """Test getting credentials from environment variables"""
+        creds = get_credentials()
+
+        assert creds['access_key'] == mock_env_credentials['AWS_ACCESS_KEY_ID']
+        assert creds['secret_key'] == mock_env_credentials['AWS_SECRET_ACCESS_KEY']
+        assert creds['session_token'] == mock_env_credentials['AWS_SESSION_TOKEN']
+
+    @patch('djangoApps.init_param_app.util.minio_client.get_instance_credentials')
+    def test_get_credentials_fallback_to_imds(self, mock_get_instance_creds):
+        """Test fallback to IMDS when no environment variables"""
+        mock_get_instance_creds.return_value = instance_credentials()
+
+        with patch.dict(os.environ, {}, clear=True):
+            creds = get_credentials()
+
+        assert creds == mock_get_instance_creds.return_value
+        mock_get_instance_creds.assert_called_once()
+
+
+class TestCachedCredentialsProvider:
+    def test_credentials_cached(self, provider):
+        """Test credentials are fetched once for all retrieve calls and threads"""
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(provider.retrieve())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert provider._fetch.call_count == 1
+        assert {credentials.access_key for credentials in results} == {'imds-access-key'}
+
+    def test_refresh_scheduled_before_expiry(self, provider):
+        """Test the background refresh is scheduled the refresh margin before expiry"""
+        provider.retrieve()
+
+        interval = timedelta(seconds=provider._timer.interval)
+        assert timedelta(minutes=49) < interval <= timedelta(minutes=50)
+        assert provider._timer.daemon
+
+    def test_refresh_replaces_credentials(self, provider):
+        """Test a background refresh caches the new credentials, which retrieve returns without fetching"""
+        provider.retrieve()
+        provider._fetch.return_value = instance_credentials('refreshed-key')
+
+        assert provider.refresh() is True
+        assert provider.retrieve().access_key == 'refreshed-key'
+        assert provider._fetch.call_count == 2
+
+    def test_failed_refresh_keeps_credentials(self, provider):
+        """Test a failed refresh keeps the cached credentials and is retried"""
+        provider.retrieve()
+        provider._fetch.side_effect = requests.RequestException('metadata service down')
+
+        assert provider.refresh() is False
+        assert provider.retrieve().access_key == 'imds-access-key'
+        assert provider._timer.interval == minio_client.CREDENTIAL_RETRY_DELAY.total_seconds()
+
+    def test_expired_credentials_fetched(self, provider):
+        """Test credentials that expired without a refresh are fetched by the request"""
+        provider._fetch.return_value = instance_credentials(expires_in=timedelta(seconds=5))
+        provider.retrieve()
+        provider._fetch.return_value = instance_credentials('new-key')
+
+        assert provider.retrieve().access_key == 'new-key'
+
+    def test_no_credentials(self):
+        """Test retrieve returns None, for anonymous requests, when there are no credentials"""
+        provider = CachedCredentialsProvider(fetch=MagicMock(return_value=None))
+
+        assert provider.retrieve() is None
+        assert provider.retrieve() is None
+        provider._fetch.assert_called_once()
+
+
+class TestMinioClient:
+    def test_shared_client(self):
+        """Test one client per endpoint is shared, with the pool size requested"""
+        reset_minio_clients()
+        try:
+            client = get_minio_client('s3.us-east-1.amazonaws.com', 'us-east-1', 16)
+
+            assert get_minio_client('s3.us-east-1.amazonaws.com', 'us-east-1') is client
+            assert get_minio_client('localhost:9000', 'us-east-1') is not client
+            assert client._http.connection_pool_kw['maxsize'] == 16
+            assert client._provider is minio_client._credentials_provider
+        finally:
+            reset_minio_clients()
@@ -0,0 +1,96 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+from djangoApps.init_param_app.models import CacheStamp
+from djangoApps.init_param_app.util.module_metadata import (ModuleMetadataCache, load_module_metadata,
+                                                            bump_module_metadata_stamp)
+
+CALIBRATE_COLUMNS = ['module_name', 'name', 'description', 'min', 'max', 'data_type', 'units', 'calibratable',
+                     'default_value']
+OUT_VARIABLE_COLUMNS = ['module_name', 'name', 'description']
+
+
+def fake_database_manager(stamp=(1, 10, 100, 5, 20, None)):
+    """DatabaseManager returning the metadata of CFE-S, CFE-X and SFT"""
+    db = MagicMock()
+    db.selectModuleMetadataStamp.return_value = stamp
+
+    def calibrate_by_table(table_name, module_names):
+        rows = []
+        if table_name == 'cfe_params':
+            rows = [('CFE-S', 'b', 'Pore size index', 0, 21.9, 'double', '', True, 4.05),
+                    ('CFE-X', 'b', 'Pore size index', 0, 21.9, 'double', '', True, 4.05)]
+        return CALIBRATE_COLUMNS, rows
+
+    db.selectModuleCalibrateDataByTable.side_effect = calibrate_by_table
+    db.selectDependentModuleParamTables.return_value = [(8, 'sft_params')]
+    db.selectDependentModuleCalibrateDataByTable.return_value = (
+        CALIBRATE_COLUMNS, [('SFT', 'smcmax', 'Porosity', 0.3, 0.6, 'double', 'm/m', True, 0.4)])
+    db.selectAllModuleOutVariablesData.return_value = (
+        OUT_VARIABLE_COLUMNS, [('CFE-S', 'Q_OUT', 'Discharge'), ('SFT', 'soil_ice_fraction', 'Ice fraction')])
+    return db
+
+
+class TestModuleMetadata:
+    def test_load_module_metadata(self):
+        """Test all modules are loaded with one query per param table"""
+        db = fake_database_manager()
+
+        calibrate, out_variables = load_module_metadata(db)
+
+        assert calibrate['CFE-S'] == [{'name': 'b', 'initial_value': 4.05, 'description': 'Pore size index',
+                                       'min': 0, 'max': 21.9, 'data_type': 'double', 'units': ''}]
+        assert calibrate['SFT'][0]['name'] == 'smcmax'
+        assert out_variables['SFT'] == [{'variable': 'soil_ice_fraction', 'description': 'Ice fraction'}]
+        tables = [call.args[0] for call in db.selectModuleCalibrateDataByTable.call_args_list]
+        assert len(tables) == len(set(tables))
+        assert db.selectModuleCalibrateDataByTable.call_args_list[0].args == ('cfe_params', ['CFE-S', 'CFE-X'])
+
+    def test_cache_returns_copies(self):
+        """Test the metadata is loaded once and every caller gets its own copy"""
+        db = fake_database_manager()
+        cache = ModuleMetadataCache(check_interval=60)
+        with patch('djangoApps.init_param_app.util.module_metadata.connection'), \
+                patch('djangoApps.init_param_app.util.module_metadata.DatabaseManager', return_value=db):
+            calibrate, out_variables = cache.get('CFE-S')
+            calibrate[0]['initial_value'] = 99
+            assert cache.get('CFE-S')[0][0]['initial_value'] == 4.05
+            assert cache.get('LSTM') == ([], [])
+
+        assert db.selectModuleMetadataStamp.call_count == 1
+        assert db.selectAllModuleOutVariablesData.call_count == 1
+
+    def test_stamp_change_reloads(self):
+        """Test a new stamp reloads the metadata and an unchanged one does not"""
+        db = fake_database_manager()
+        cache = ModuleMetadataCache(check_interval=0)
+        with patch('djangoApps.init_param_app.util.module_metadata.connection'), \
+                patch('djangoApps.init_param_app.util.module_metadata.DatabaseManager', return_value=db):
+            cache.get('CFE-S')
+            cache.get('CFE-S')
+            assert db.selectAllModuleOutVariablesData.call_count == 1
+
+            db.selectModuleMetadataStamp.return_value = (1, 10, 100, 5, 20, 1)
+            cache.get('CFE-S')
+            assert db.selectAllModuleOutVariablesData.call_count == 2
+
+    def test_unavailable_metadata(self):
+        """Test None is returned when the metadata can not be read, a loaded cache keeps serving"""
+        db = fake_database_manager()
+        db.selectModuleMetadataStamp.side_effect = RuntimeError('relation "modules" does not exist')
+        cache = ModuleMetadataCache(check_interval=0)
+        with patch('djangoApps.init_param_app.util.module_metadata.connection'), \
+                patch('djangoApps.init_param_app.util.module_metadata.DatabaseManager', return_value=db):
+            assert cache.get('CFE-S') is None
+
+            db.selectModuleMetadataStamp.side_effect = None
+            assert cache.get('CFE-S') is not None
+            db.selectModuleMetadataStamp.side_effect = RuntimeError('connection lost')
+            assert cache.get('CFE-S')[0][0]['name'] == 'b'
+
+    @pytest.mark.django_db
+    def test_bump_module_metadata_stamp(self):
+        """Test the refresh command stamp increments the version"""
+        assert bump_module_metadata_stamp() == 0
+        assert bump_module_metadata_stamp() == 1
+        assert CacheStamp.objects.get(name='module_metadata').version == 1
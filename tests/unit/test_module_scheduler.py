@@ -0,0 +1,114 @@
+import contextvars
+import json
+import threading
+import time
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from djangoApps.init_param_app import initial_parameters
+from djangoApps.init_param_app.util.gage_file_management import WriteResult
+from djangoApps.init_param_app.util.module_scheduler import ModuleScheduler, dependency_order
+
+request_name = contextvars.ContextVar('request_name', default=None)
+
+
+@pytest.fixture
+def scheduler():
+    module_scheduler = ModuleScheduler(workers=4)
+    yield module_scheduler
+    module_scheduler.shutdown()
+
+
+class TestModuleScheduler:
+    def test_dependency_order(self):
+        """Test modules come after the requested modules they depend on and a cycle is rejected"""
+        dependencies = {'SFT': ('CFE-S',), 'SMP': ('CFE-S', 'TopModel')}
+        assert dependency_order(['SMP', 'SFT', 'CFE-S', 'Noah-OWP-Modular'], dependencies) == \
+               ['CFE-S', 'Noah-OWP-Modular', 'SMP', 'SFT']
+        assert dependency_order(['SFT', 'T-Route'], dependencies) == ['SFT', 'T-Route']
+        with pytest.raises(ValueError, match='cycle'):
+            dependency_order(['CFE-S', 'SFT'], {'CFE-S': ('SFT',), 'SFT': ('CFE-S',)})
+
+    def test_independent_tasks_run_concurrently(self, scheduler):
+        """Test independent tasks run at the same time and the results keep the request order"""
+        barrier = threading.Barrier(3, timeout=5)
+
+        def task(name):
+            barrier.wait()
+            return name
+
+        results = scheduler.run({name: (lambda name=name: task(name)) for name in ['T-Route', 'CFE-S', 'UEB']})
+
+        assert list(results.items()) == [('T-Route', 'T-Route'), ('CFE-S', 'CFE-S'), ('UEB', 'UEB')]
+
+    def test_dependencies_run_first(self, scheduler):
+        """Test a task starts once the tasks it depends on are done, and sees the caller's context"""
+        finished = []
+
+        def task(name, delay=0):
+            time.sleep(delay)
+            finished.append(name)
+            return request_name.get()
+
+        request_name.set('01123000')
+        results = scheduler.run({'SFT': lambda: task('SFT'), 'CFE-S': lambda: task('CFE-S', 0.05),
+                                 'T-Route': lambda: task('T-Route', 0.1)},
+                                {'SFT': ('CFE-S', 'LASAM')})
+
+        assert finished.index('CFE-S') < finished.index('SFT')
+        assert results == {'SFT': '01123000', 'CFE-S': '01123000', 'T-Route': '01123000'}
+
+    def test_error_stops_waiting_tasks(self, scheduler):
+        """Test the error of a task is raised and the tasks depending on it are not started"""
+        sft = MagicMock()
+
+        def cfe():
+            raise OSError('Workspace quota exceeded')
+
+        with pytest.raises(OSError, match='quota'):
+            scheduler.run({'CFE-S': cfe, 'SFT': sft}, {'SFT': ('CFE-S',)})
+        sft.assert_not_called()
+
+
+class TestGetIpe:
+    @patch.object(initial_parameters, 'get_module_scheduler', return_value=ModuleScheduler(workers=1))
+    @patch.object(initial_parameters, 'HydrofabricAttributes')
+    @patch.object(initial_parameters, 'calculate_dependent_module_params')
+    @patch.object(initial_parameters, 'calculate_module_params')
+    def test_found_and_calculated_modules(self, mock_calculate, mock_calculate_dependent, mock_hydrofabric,
+                                          mock_scheduler):
+        """Test found and calculated modules are returned in request order and are written with their coupling"""
+        hffiles_ids = {'SFT': 7, 'CFE-S': 8}
+        mock_calculate.side_effect = lambda gage_id, version, source, domain, module, *args: (
+            {'module_name': module, 'parameter_file': {'uri': f's3://test-bucket/{module}'}},
+            WriteResult(f's3://test-bucket/{module}', hffiles_ids[module], 0, 0.0, 0.0, None))
+        mock_calculate_dependent.side_effect = mock_calculate.side_effect
+        gage_file_mgmt = MagicMock()
+        gage_file_mgmt.get_geopackage_filename.return_value = 'Gage_01123000.gpkg'
+
+        response = initial_parameters.get_ipe('01123000', '2.2', 'USGS', 'CONUS', ['SFT', 'T-Route', 'CFE-S'],
+                                              gage_file_mgmt, {'T-Route': '{"module_name": "T-Route"}'})
+
+        assert [module['module_name'] for module in response.data['modules']] == ['SFT', 'T-Route', 'CFE-S']
+        assert mock_calculate.call_args.args[-2:] == (['SFT'], 'SFT')
+        assert mock_calculate_dependent.call_args.args[-1] == 'CFE-S'
+        saved = {call.args[0]: json.loads(call.args[1])['module_name']
+                 for call in gage_file_mgmt.save_ipe_json.call_args_list}
+        assert saved == {7: 'SFT', 8: 'CFE-S'}
+        assert gage_file_mgmt.delete_local_temp_directory.call_count == 2
+
+    @patch.object(initial_parameters, 'get_module_metadata', return_value={})
+    @patch.object(initial_parameters, 'cfe_ipe', side_effect=OSError('Workspace quota exceeded'))
+    def test_sink_closed_when_writer_raises(self, mock_cfe_ipe, mock_metadata):
+        """Test the module's sink is closed when its writer raises"""
+        sink = MagicMock()
+        sink.__enter__.return_value = sink
+
+        with patch.object(initial_parameters, 'open_module_sink', return_value=sink), \
+                pytest.raises(OSError, match='quota'):
+            initial_parameters.calculate_module_params('01123000', '2.2', 'USGS', 'CONUS', 'CFE-S', '/tmp/PARAMS',
+                                                       None, MagicMock(), [], 'SFT')
+
+        assert mock_cfe_ipe.call_args.args[5] is sink
+        sink.__exit__.assert_called_once()
@@ -0,0 +1,276 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from unittest.mock import patch, MagicMock
+from django.test import override_settings
+from djangoApps.init_param_app.util.enums import FileTypeEnum
+from djangoApps.init_param_app.util.gage_file_management import GageFileManagement
+from djangoApps.init_param_app.util.output_sink import (OutputSink, MemorySink, DirectorySink, ArchiveSink,
+                                                        get_output_sink, open_module_sink)
+from djangoApps.init_param_app.util.s3_uploader import S3Uploader
+
+
+@pytest.fixture
+@override_settings(S3_BUCKET='test-bucket')
+def gage_file_mgmt():
+    with patch('djangoApps.init_param_app.util.file_management.get_config', return_value={'s3url': 'localhost'}), \
+            patch('djangoApps.init_param_app.util.gage_file_management.get_api_version', return_value='1.0'):
+        gage_file_mgmt = GageFileManagement()
+    gage_file_mgmt.client = MagicMock()
+    gage_file_mgmt.start_minio_client = MagicMock()
+    return gage_file_mgmt
+
+
+def read_archive(sink_object):
+    sink_object.file.seek(0)
+    return sink_object.file.read(sink_object.size)
+
+
+class TestOutputSinks:
+    def test_memory_sink(self):
+        """Test files are kept in memory and yielded as bytes in write order"""
+        sink = MemorySink()
+
+        filenames = sink.write_files((name for name in ['b.txt', 'a.txt']), ['1\n', b'2'])
+
+        assert filenames == ['b.txt', 'a.txt']
+        assert sink.read('b.txt') == '1\n'
+        assert [(obj.filename, obj.path, obj.data) for obj in sink.objects()] == [('b.txt', None, b'1\n'),
+                                                                                  ('a.txt', None, b'2')]
+
+    def test_directory_sink(self, tmp_path):
+        """Test files are written to the directory, which is created, and yielded as paths"""
+        directory = tmp_path / 'T-Route'
+        sink = DirectorySink(str(directory))
+
+        sink.write('troute.yml', 'a: 1\n')
+
+        assert (directory / 'troute.yml').read_text() == 'a: 1\n'
+        assert [(obj.filename, obj.path, obj.data) for obj in sink.objects()] == \
+               [('troute.yml', str(directory / 'troute.yml'), None)]
+
+    @pytest.mark.parametrize('archive_format', ['zip', 'tar.gz'])
+    def test_archive_sink(self, archive_format):
+        """Test files are streamed into a single archive object"""
+        sink = ArchiveSink('LSTM', archive_format)
+        sink.write_files(['cat-1.yml', 'cat-2.yml'], ['x: 1\n', 'x: 2\n'])
+
+        objects = list(sink.objects())
+
+        assert [obj.filename for obj in objects] == [f'LSTM.{archive_format}', f'LSTM.{archive_format}.manifest.json']
+        archive_bytes = read_archive(objects[0])
+        assert objects[0].data is None and objects[0].size == len(archive_bytes)
+        if archive_format == 'zip':
+            with zipfile.ZipFile(io.BytesIO(archive_bytes)) as archive:
+                members = {name: archive.read(name) for name in archive.namelist()}
+        else:
+            with tarfile.open(fileobj=io.BytesIO(archive_bytes), mode='r:gz') as archive:
+                members = {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+        assert members == {'cat-1.yml': b'x: 1\n', 'cat-2.yml': b'x: 2\n'}
+        assert sink.read('cat-2.yml') == 'x: 2\n'
+        sink.close()
+
+    @pytest.mark.parametrize('archive_format', ['zip', 'tar.gz'])
+    def test_archive_manifest(self, archive_format):
+        """Test the manifest offsets locate each zip member's bytes in the archive, a tar.gz has no offsets"""
+        sink = ArchiveSink('UEB', archive_format)
+        contents = {f'cat-{i}.dat': f'value {i}\n' * (i + 1) for i in range(5)}
+        sink.write_files(contents, contents.values())
+
+        archive, manifest_object = list(sink.objects())
+        archive_bytes = read_archive(archive)
+        manifest = json.loads(manifest_object.data)
+
+        assert manifest['archive'] == f'UEB.{archive_format}' and manifest['size'] == len(archive_bytes)
+        assert [member['name'] for member in manifest['members']] == list(contents)
+        assert [member['size'] for member in manifest['members']] == [len(content) for content in contents.values()]
+        if archive_format == 'zip':
+            for member in manifest['members']:
+                compressed = archive_bytes[member['offset']:member['offset'] + member['compressed_size']]
+                assert zlib.decompress(compressed, -15).decode() == contents[member['name']]
+        else:
+            assert all('offset' not in member for member in manifest['members'])
+
+    @patch('djangoApps.init_param_app.util.output_sink.ARCHIVE_SPOOL_SIZE', 1024)
+    def test_spilled_archive_uploaded_from_file(self):
+        """Test an archive spilled to a temporary file is put from the file, from its start on a retry"""
+        sink = ArchiveSink('UEB')
+        sink.write_files([f'cat-{i}.dat' for i in range(50)], [os.urandom(256) for _ in range(50)])
+        client = MagicMock()
+        uploaded = []
+
+        def put_object(bucket, object_name, data, length):
+            uploaded.append(data.read(length))
+            if len(uploaded) == 1:
+                raise ConnectionError('connection reset')
+
+        client.put_object.side_effect = put_object
+        archive = next(sink.objects())
+        assert sink._buffer._rolled
+
+        with patch('djangoApps.init_param_app.util.s3_uploader.time.sleep'):
+            report = S3Uploader(client, 'test-bucket', workers=1).upload('UEB', sink)
+
+        assert report.ok and report.results[0].attempts == 2
+        assert uploaded[0] == uploaded[1] and len(uploaded[1]) == archive.size
+        with zipfile.ZipFile(io.BytesIO(uploaded[1])) as uploaded_archive:
+            assert len(uploaded_archive.namelist()) == 50
+        sink.close()
+
+    def test_closed_by_with_block(self):
+        """Test a sink is closed when the block exits on an error, and the base class is abstract"""
+        with pytest.raises(ValueError, match='writer failed'):
+            with ArchiveSink('UEB') as sink:
+                sink.write('cat-1.dat', '1\n')
+                raise ValueError('writer failed')
+        assert sink._archive is None and sink._buffer.closed
+        with pytest.raises(TypeError):
+            OutputSink()
+
+    def test_unknown_kind(self):
+        """Test an unknown sink kind or archive format raises ValueError"""
+        with pytest.raises(ValueError):
+            get_output_sink('s3')
+        with pytest.raises(ValueError):
+            ArchiveSink('LSTM', 'zstd')
+
+    def test_module_sink_from_config(self, tmp_path):
+        """Test the module sink is of the configured kind, memory by default"""
+        with patch('djangoApps.init_param_app.util.output_sink.get_config', return_value={}):
+            assert isinstance(open_module_sink(str(tmp_path), 'LSTM'), MemorySink)
+        with patch('djangoApps.init_param_app.util.output_sink.get_config',
+                   return_value={'ipe_output_sink': 'directory'}):
+            sink = open_module_sink(str(tmp_path), 'LSTM')
+        assert sink.directory == str(tmp_path / 'LSTM') + '/'
+
+
+class TestWriteSinkToS3:
+    @override_settings(S3_BUCKET='test-bucket')
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_memory_sink_uploaded_from_buffers(self, mock_hffiles, gage_file_mgmt):
+        """Test files of a memory sink are put from their buffers and the module folder is recorded"""
+        sink = MemorySink()
+        sink.write_files(['cat-1.yml', 'cat-2.yml'], ['x: 1\n', 'x: 2\n'])
+
+        result = gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.PARAMS, 'USGS', sink,
+                                                 sink.filenames, module='LSTM')
+        uri = result.uri
+
+        put_calls = gage_file_mgmt.client.put_object.call_args_list
+        assert [call.args[1].rsplit('/', 1)[1] for call in put_calls] == ['cat-1.yml', 'cat-2.yml']
+        gage_file_mgmt.client.fput_object.assert_not_called()
+        assert uri.startswith('s3://test-bucket/2.2/CONUS/01000001/PARAMS/USGS/LSTM/')
+        assert not uri.endswith('.yml')
+        assert mock_hffiles.call_args.kwargs['uri'] == uri
+        assert result.hffiles_id == mock_hffiles.return_value.id
+        assert result.bytes == 10
+        assert sink.write_result is result
+
+    @override_settings(S3_BUCKET='test-bucket')
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_directory_uploaded_from_files(self, mock_hffiles, gage_file_mgmt, tmp_path):
+        """Test a directory and filenames are still uploaded from the local files"""
+        (tmp_path / 'gauge_01000001.gpkg').write_bytes(b'gpkg')
+
+        uri = gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.GEOPACKAGE, 'USGS',
+                                              str(tmp_path) + '/', ['gauge_01000001.gpkg']).uri
+
+        bucket, object_name, path = gage_file_mgmt.client.fput_object.call_args.args
+        assert path == str(tmp_path / 'gauge_01000001.gpkg')
+        assert uri == f's3://test-bucket/{object_name}'
+        assert mock_hffiles.call_args.kwargs['filename'] == 'gauge_01000001.gpkg'
+
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_data_file_required(self, mock_hffiles, gage_file_mgmt, tmp_path):
+        """Test a data file write without a file is rejected before anything is uploaded or recorded"""
+        with pytest.raises(ValueError, match='No GEOPACKAGE file'):
+            gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.GEOPACKAGE, 'USGS',
+                                            str(tmp_path) + '/', [])
+        with pytest.raises(ValueError):
+            gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.GEOPACKAGE, 'USGS', MemorySink(),
+                                            [])
+        gage_file_mgmt.client.fput_object.assert_not_called()
+        mock_hffiles.assert_not_called()
+
+    @override_settings(S3_BUCKET='test-bucket')
+    @patch('djangoApps.init_param_app.util.s3_uploader.time.sleep')
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_failed_upload_not_recorded(self, mock_hffiles, mock_sleep, gage_file_mgmt):
+        """Test no HFFILES row is saved when an object of the module failed to upload"""
+        sink = MemorySink()
+        sink.write_files(['cat-1.yml', 'cat-2.yml'], ['x: 1\n', 'x: 2\n'])
+        gage_file_mgmt.client.put_object.side_effect = ConnectionError('connection reset')
+
+        result = gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.PARAMS, 'USGS', sink,
+                                                 sink.filenames, module='LSTM')
+
+        assert len(result.upload_report.failed) == 2
+        mock_hffiles.assert_not_called()
+        assert result.hffiles_id is None and result.bytes == 0
+
+    @override_settings(S3_BUCKET='test-bucket')
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_concurrent_writes(self, mock_hffiles, gage_file_mgmt):
+        """Test one manager serves concurrent writes, each gets the result of its own module"""
+        modules = ['CFE-S', 'Noah-OWP-Modular', 'T-Route', 'LSTM', 'SFT', 'SMP']
+
+        def write(module):
+            sink = MemorySink()
+            sink.write_files([f'{module}.yml'], ['x: 1\n'])
+            return gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.PARAMS, 'USGS', sink,
+                                                   sink.filenames, module=module)
+
+        with ThreadPoolExecutor(max_workers=len(modules)) as executor:
+            results = list(executor.map(write, modules))
+
+        assert [result.uri.split('/')[8] for result in results] == modules
+        assert {call.kwargs['module_id'] for call in mock_hffiles.call_args_list} == set(modules)
+
+    @override_settings(S3_BUCKET='test-bucket')
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_coupled_writes(self, mock_hffiles, gage_file_mgmt):
+        """Test the files of a module calculated with another coupling go to a folder and row of their own"""
+        def write(coupling):
+            sink = MemorySink()
+            sink.write_files(['cat-1.ini'], ['x: 1\n'])
+            return gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.PARAMS, 'USGS', sink,
+                                                   sink.filenames, module='CFE-S', coupling=coupling).uri
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            alone, coupled = executor.map(write, [None, 'SFT'])
+
+        assert alone.split('/')[8] == 'CFE-S' and alone.count('/') == 9
+        assert coupled.split('/')[8:10] == ['CFE-S', 'coupled_SFT']
+        assert sorted(call.kwargs['coupling_key'] for call in mock_hffiles.call_args_list) == ['', 'SFT']
+
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_save_ipe_json(self, mock_hffiles, gage_file_mgmt):
+        """Test the IPE json document is added to the row of the write, and nothing when the write was not recorded"""
+        mock_hffiles.objects.filter.return_value.update.return_value = 1
+
+        assert gage_file_mgmt.save_ipe_json(42, '{}')
+        mock_hffiles.objects.filter.assert_called_once_with(id=42)
+        mock_hffiles.objects.filter.return_value.update.assert_called_once_with(ipe_json='{}')
+        assert not gage_file_mgmt.save_ipe_json(None, '{}')
+        assert mock_hffiles.objects.filter.call_count == 1
+
+    @override_settings(S3_BUCKET='test-bucket')
+    @patch('djangoApps.init_param_app.util.gage_file_management.HFFiles')
+    def test_archive_recorded(self, mock_hffiles, gage_file_mgmt):
+        """Test the uri and filename of a module packaged in an archive point at the archive"""
+        sink = ArchiveSink('UEB')
+        sink.write_files(['cat-1.dat', 'cat-2.dat'], ['1\n', '2\n'])
+
+        uri = gage_file_mgmt.write_file_to_s3('01000001', '2.2', 'CONUS', FileTypeEnum.PARAMS, 'USGS', sink,
+                                              sink.filenames, module='UEB').uri
+
+        object_names = [call.args[1] for call in gage_file_mgmt.client.put_object.call_args_list]
+        assert uri == 's3://test-bucket/' + object_names[0]
+        assert uri.endswith('/UEB.zip') and object_names[1].endswith('/UEB.zip.manifest.json')
+        assert mock_hffiles.call_args.kwargs['filename'] == 'UEB.zip'
+        assert mock_hffiles.call_args.kwargs['uri'] == uri
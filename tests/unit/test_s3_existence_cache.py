@@ -0,0 +1,129 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from django.test import override_settings
+from minio import S3Error
+from djangoApps.init_param_app.util import s3_existence_cache as cache_module
+from djangoApps.init_param_app.util.file_management import FileManagement
+from djangoApps.init_param_app.util.gage_file_management import GageFileManagement, start_s3_reconciler
+from djangoApps.init_param_app.util.s3_existence_cache import ExistenceCache, OBJECT, PREFIX, reconcile
+
+
+@pytest.fixture
+def file_management():
+    cache_module.s3_existence_cache.clear()
+    with patch('djangoApps.init_param_app.util.file_management.get_config', return_value={'s3url': 'localhost'}), \
+            override_settings(S3_BUCKET='test-bucket'):
+        file_management = FileManagement()
+    file_management.client = MagicMock()
+    yield file_management
+    cache_module.s3_existence_cache.clear()
+
+
+def listed(*names):
+    return [MagicMock(object_name=name) for name in names]
+
+
+class TestExistenceCache:
+    @patch('djangoApps.init_param_app.util.s3_existence_cache.time.monotonic')
+    def test_ttl(self, mock_monotonic):
+        """Test found entries live for the TTL and missing ones for the negative TTL"""
+        cache = ExistenceCache(ttl=100, negative_ttl=10)
+        mock_monotonic.return_value = 0
+        cache.set(OBJECT, 'a/b.txt', True)
+        cache.set(OBJECT, 'a/c.txt', False)
+
+        mock_monotonic.return_value = 50
+        assert cache.get(OBJECT, 'a/b.txt') is True
+        assert cache.get(OBJECT, 'a/c.txt') is None
+        assert cache.get(PREFIX, 'a/b.txt') is None
+
+    def test_invalidate(self):
+        """Test a write invalidates its key, the keys below and the prefixes above, and nothing else"""
+        cache = ExistenceCache()
+        for kind, key in [(PREFIX, '2.2/CONUS/01'), (PREFIX, '2.2/CONUS/01/PARAMS/USGS/LSTM/t1'),
+                          (OBJECT, '2.2/CONUS/01/PARAMS/USGS/LSTM/t1/cat-1.yml'), (OBJECT, '2.2/CONUS/02/x.gpkg')]:
+            cache.set(kind, key, False)
+
+        cache.invalidate('2.2/CONUS/01/PARAMS/USGS/LSTM/t1')
+
+        assert cache.get(PREFIX, '2.2/CONUS/01') is None
+        assert cache.get(PREFIX, '2.2/CONUS/01/PARAMS/USGS/LSTM/t1') is None
+        assert cache.get(OBJECT, '2.2/CONUS/01/PARAMS/USGS/LSTM/t1/cat-1.yml') is None
+        assert cache.get(OBJECT, '2.2/CONUS/02/x.gpkg') is False
+
+
+class TestReconcile:
+    def test_one_listing_per_gage(self):
+        """Test the keys are verified with one recursive listing per gage folder and cached"""
+        cache = ExistenceCache()
+        client = MagicMock()
+        client.list_objects.side_effect = lambda bucket, prefix, recursive: {
+            '2.2/CONUS/01/': listed('2.2/CONUS/01/GEOPACKAGE/USGS/t0/gauge_01.gpkg',
+                                   '2.2/CONUS/01/PARAMS/USGS/LSTM/t1/cat-1.yml'),
+            '2.2/CONUS/02/': listed()}[prefix]
+        keys = ['2.2/CONUS/01/GEOPACKAGE/USGS/t0/gauge_01.gpkg', '2.2/CONUS/01/PARAMS/USGS/LSTM/t1',
+                '2.2/CONUS/01/PARAMS/USGS/CFE-S/t1', '2.2/CONUS/02/PARAMS/USGS/LSTM/t1']
+
+        missing = reconcile(client, 'test-bucket', keys, cache)
+
+        assert client.list_objects.call_count == 2
+        assert sorted(missing) == ['2.2/CONUS/01/PARAMS/USGS/CFE-S/t1', '2.2/CONUS/02/PARAMS/USGS/LSTM/t1']
+        assert cache.get(OBJECT, '2.2/CONUS/01/GEOPACKAGE/USGS/t0/gauge_01.gpkg') is True
+        assert cache.get(PREFIX, '2.2/CONUS/01/PARAMS/USGS/LSTM/t1') is True
+        assert cache.get(PREFIX, '2.2/CONUS/01/PARAMS/USGS/CFE-S/t1') is False
+
+
+class TestCachedExistenceChecks:
+    def test_file_exists_cached(self, file_management):
+        """Test a found object is answered from the cache on the next check"""
+        assert file_management.s3_file_exists('s3://test-bucket/2.2/CONUS/01/x.gpkg') is True
+        assert file_management.s3_file_exists('s3://test-bucket/2.2/CONUS/01/x.gpkg') is True
+
+        file_management.client.stat_object.assert_called_once_with('test-bucket', '2.2/CONUS/01/x.gpkg')
+
+    def test_missing_file_cached_until_written(self, file_management):
+        """Test a missing object is cached until it is written"""
+        file_management.client.stat_object.side_effect = S3Error(MagicMock(), 'NoSuchKey', 'missing', 'x', 'r', 'h')
+        assert file_management.s3_file_exists('2.2/CONUS/01/x.gpkg') is False
+        assert file_management.s3_file_exists('2.2/CONUS/01/x.gpkg') is False
+        assert file_management.client.stat_object.call_count == 1
+
+        # As write_file_to_s3 does once the object is uploaded
+        cache_module.s3_existence_cache.invalidate('2.2/CONUS/01/x.gpkg')
+        file_management.client.stat_object.side_effect = None
+
+        assert file_management.s3_file_exists('2.2/CONUS/01/x.gpkg') is True
+        assert file_management.client.stat_object.call_count == 2
+
+    def test_prefix_exists_cached(self, file_management):
+        """Test a prefix is listed once, and listed again after it is deleted"""
+        file_management.client.list_objects.return_value = listed('2.2/CONUS/01/PARAMS/USGS/LSTM/t1/cat-1.yml')
+        uri = 's3://test-bucket/2.2/CONUS/01/PARAMS/USGS/LSTM/t1'
+
+        assert file_management.s3_prefix_exists(uri) is True
+        assert file_management.s3_prefix_exists(uri) is True
+        assert file_management.client.list_objects.call_count == 1
+
+        file_management.remove_minio_dir(uri)
+        file_management.client.list_objects.assert_called_with('test-bucket', prefix='2.2/CONUS/01/PARAMS/USGS/LSTM/t1/',
+                                                               recursive=True)
+        file_management.client.list_objects.return_value = []
+
+        assert file_management.s3_prefix_exists(uri) is False
+
+
+class TestReconciler:
+    @patch('djangoApps.init_param_app.util.gage_file_management.start_reconciler')
+    def test_started_by_entry_point_only(self, mock_start_reconciler):
+        """Test creating a GageFileManagement starts no reconciler, start_s3_reconciler uses the configured interval"""
+        with patch('djangoApps.init_param_app.util.file_management.get_config', return_value={'s3url': 'localhost'}), \
+                patch('djangoApps.init_param_app.util.gage_file_management.get_api_version', return_value='1.0'), \
+                override_settings(S3_BUCKET='test-bucket'):
+            GageFileManagement()
+        mock_start_reconciler.assert_not_called()
+
+        with patch('djangoApps.init_param_app.util.gage_file_management.get_config',
+                   return_value={'s3_reconcile_interval': 600.0}):
+            start_s3_reconciler()
+        assert mock_start_reconciler.call_args.args[1] == 600.0
+        assert cache_module.start_reconciler(MagicMock(), 0) is None
@@ -0,0 +1,85 @@
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from minio import S3Error
+from djangoApps.init_param_app.util.output_sink import MemorySink, DirectorySink
+from djangoApps.init_param_app.util.s3_uploader import S3Uploader
+
+
+def s3_error(code):
+    return S3Error(MagicMock(), code, code, 'resource', 'request-id', 'host-id')
+
+
+@pytest.fixture
+def sink():
+    sink = MemorySink()
+    sink.write_files([f'cat-{i}.txt' for i in range(20)], [f'{i}\n' for i in range(20)])
+    return sink
+
+
+class TestS3Uploader:
+    def test_uploads_concurrently(self, sink):
+        """Test every object is put from the worker threads and reported in sink order"""
+        client = MagicMock()
+        threads = set()
+        client.put_object.side_effect = lambda *args: threads.add(threading.current_thread().name)
+
+        report = S3Uploader(client, 'test-bucket', workers=4).upload('a/b', sink)
+
+        assert report.ok
+        assert [result.object_name for result in report.results] == [f'a/b/cat-{i}.txt' for i in range(20)]
+        assert sorted(call.args[1] for call in client.put_object.call_args_list) == \
+               sorted(result.object_name for result in report.results)
+        assert all(name.startswith('s3-upload') for name in threads)
+
+    def test_files_of_directory_sink(self, tmp_path):
+        """Test the files of a directory sink are uploaded from their path"""
+        directory_sink = DirectorySink(str(tmp_path))
+        directory_sink.write('troute.yml', 'a: 1\n')
+        client = MagicMock()
+
+        report = S3Uploader(client, 'test-bucket').upload('a/b', directory_sink)
+
+        assert report.ok
+        client.fput_object.assert_called_once_with('test-bucket', 'a/b/troute.yml', str(tmp_path / 'troute.yml'))
+
+    @patch('djangoApps.init_param_app.util.s3_uploader.time.sleep')
+    def test_retries_with_backoff(self, mock_sleep, sink):
+        """Test a failing object is retried with a growing delay until it is uploaded"""
+        client = MagicMock()
+        failures = {'a/b/cat-3.txt': 2}
+
+        def put_object(bucket, object_name, data, length):
+            if failures.get(object_name):
+                failures[object_name] -= 1
+                raise ConnectionError('connection reset')
+        client.put_object.side_effect = put_object
+
+        report = S3Uploader(client, 'test-bucket', workers=4, retries=3, backoff=1.0).upload('a/b', sink)
+
+        assert report.ok
+        assert report.results[3].attempts == 3
+        assert report.retried == 2
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        assert 0.5 <= delays[0] <= 1.0 and 1.0 <= delays[1] <= 2.0
+
+    @patch('djangoApps.init_param_app.util.s3_uploader.time.sleep')
+    def test_failures_reported(self, mock_sleep, sink):
+        """Test objects failing after all retries, or with a permanent S3 error, are reported as failed"""
+        client = MagicMock()
+
+        def put_object(bucket, object_name, data, length):
+            if object_name == 'a/b/cat-1.txt':
+                raise ConnectionError('connection reset')
+            if object_name == 'a/b/cat-2.txt':
+                raise s3_error('AccessDenied')
+        client.put_object.side_effect = put_object
+
+        report = S3Uploader(client, 'test-bucket', retries=2).upload('a/b', sink)
+
+        assert not report.ok
+        assert [(result.filename, result.attempts) for result in report.failed] == [('cat-1.txt', 3),
+                                                                                    ('cat-2.txt', 1)]
+        assert len(report.uploaded) == 18
+        assert '18 of 20 objects uploaded to a/b' in report.summary()
+        assert '2 failed (first: a/b/cat-1.txt - connection reset)' in report.summary()
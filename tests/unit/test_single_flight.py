@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from djangoApps.init_param_app import geopackage
+from djangoApps.init_param_app.util.single_flight import SingleFlight, advisory_lock, advisory_lock_id
+
+KEY = ('01123000', '2.2', 'CONUS', 'USGS', 'GEOPACKAGE')
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        """Test followers wait for the leader and get its result"""
+        flight = SingleFlight('geopackage')
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def subset():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'uri': 's3://test-bucket/gage.gpkg'}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flight.do, KEY, subset) for _ in range(4)]
+            started.wait(5)
+            # Wait for the followers to join the call before releasing the leader
+            threading.Event().wait(0.2)
+            release.set()
+            results = [future.result(timeout=5) for future in futures]
+
+        assert len(calls) == 1
+        assert all(result == {'uri': 's3://test-bucket/gage.gpkg'} for result, _ in results)
+        assert sorted(shared for _, shared in results) == [False, True, True, True]
+        assert flight.in_flight() == []
+
+    def test_exception_is_raised_to_followers(self):
+        """Test a failing leader fails its followers and the next call runs again"""
+        flight = SingleFlight('geopackage')
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise RuntimeError('subsetting failed')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, KEY, failing)
+            started.wait(5)
+            follower = executor.submit(flight.do, KEY, failing)
+            threading.Event().wait(0.2)
+            release.set()
+            for future in (leader, follower):
+                with pytest.raises(RuntimeError, match='subsetting failed'):
+                    future.result(timeout=5)
+
+        assert flight.do(KEY, lambda: 'again') == ('again', False)
+
+    def test_advisory_lock_postgres(self):
+        """Test the advisory lock of the key is taken and released on Postgres only"""
+        mock_connection = MagicMock(vendor='postgresql')
+        cursor = mock_connection.cursor.return_value.__enter__.return_value
+        with patch('djangoApps.init_param_app.util.single_flight.connection', mock_connection):
+            with advisory_lock(KEY):
+                cursor.execute.assert_called_once_with("SELECT pg_advisory_lock(%s)", [advisory_lock_id(KEY)])
+        cursor.execute.assert_called_with("SELECT pg_advisory_unlock(%s)", [advisory_lock_id(KEY)])
+
+        mock_connection = MagicMock(vendor='sqlite')
+        with patch('djangoApps.init_param_app.util.single_flight.connection', mock_connection):
+            with advisory_lock(KEY):
+                pass
+        mock_connection.cursor.assert_not_called()
+        assert -2 ** 63 <= advisory_lock_id(KEY) < 2 ** 63
+
+    @patch('djangoApps.init_param_app.geopackage.scratch_workspace')
+    @patch('djangoApps.init_param_app.geopackage.get_geopackage')
+    @patch('djangoApps.init_param_app.geopackage.GageFileManagement')
+    def test_ensure_geopackage(self, mock_gage_file_management, mock_get_geopackage, mock_scratch_workspace):
+        """Test an existing geopackage is not subset again and a new one is created once"""
+        mock_gage_file_management.return_value.file_exists.return_value = (True, {'uri': 's3://existing.gpkg'})
+        assert geopackage.ensure_geopackage('01123000', '2.2', 'USGS', 'CONUS') == (False, {'uri': 's3://existing.gpkg'})
+        mock_get_geopackage.assert_not_called()
+
+        mock_gage_file_management.return_value.file_exists.return_value = (False, None)
+        mock_get_geopackage.return_value = {'uri': 's3://new.gpkg'}
+        assert geopackage.ensure_geopackage('01123000', '2.2', 'USGS', 'CONUS', keep_file=True) == (True, {'uri': 's3://new.gpkg'})
+        mock_get_geopackage.assert_called_once_with('01123000', '2.2', 'USGS', 'CONUS', keep_file=True)
@@ -0,0 +1,98 @@
+import sys
+import textwrap
+import pytest
+from djangoApps.init_param_app.util.subsetter_pool import RSubsetterPool, RSubsetterWorker
+
+
+# Stand-in for R/subsetter_worker.R that speaks the same line protocol.
+# gauge_id 'crash' exits the process, 'hang' never answers, 'missing' reports an R style error.
+FAKE_WORKER = textwrap.dedent('''
+    import json, os, sys, time
+    print("loading hydrofabric", flush=True)
+    print("HFSUBSET_READY", flush=True)
+    for line in sys.stdin:
+        job = json.loads(line)
+        if job["gauge_id"] == "crash":
+            sys.exit(3)
+        if job["gauge_id"] == "hang":
+            time.sleep(60)
+        print("noise from get_subset", flush=True)
+        if job["gauge_id"] == "missing":
+            result = {"job_id": job["job_id"], "status": "error", "error_class": "simpleError",
+                      "message": "No origin found"}
+        else:
+            result = {"job_id": job["job_id"], "status": "ok", "outfile": job["outfile"], "pid": os.getpid()}
+        print("HFSUBSET_RESULT " + json.dumps(result), flush=True)
+''')
+
+
+@pytest.fixture
+def pool(tmp_path):
+    worker_script = tmp_path / "fake_worker.py"
+    worker_script.write_text(FAKE_WORKER)
+    pool = RSubsetterPool([sys.executable, str(worker_script)], size=2, job_timeout=2, startup_timeout=10)
+    yield pool
+    pool.shutdown()
+
+
+class TestRSubsetterPool:
+    def test_submit_success(self, pool):
+        """Test a job result is read past unrelated worker output"""
+        result = pool.submit(gauge_id="06710385", outfile="gauge_06710385.gpkg")
+
+        assert result["status"] == "ok"
+        assert result["outfile"] == "gauge_06710385.gpkg"
+
+    def test_workers_are_reused(self, pool):
+        """Test consecutive jobs run on the same long lived worker"""
+        first = pool.submit(gauge_id="06710385", outfile="a.gpkg")
+        second = pool.submit(gauge_id="01123000", outfile="b.gpkg")
+
+        assert first["pid"] == second["pid"]
+
+    def test_structured_error(self, pool):
+        """Test errors raised in the worker come back as a structured result"""
+        result = pool.submit(gauge_id="missing", outfile="a.gpkg")
+
+        assert result["status"] == "error"
+        assert result["error_class"] == "simpleError"
+        assert result["message"] == "No origin found"
+
+    def test_crashed_worker_is_replaced(self, pool):
+        """Test a crashed worker is reported and a new worker serves the next job"""
+        before = pool.submit(gauge_id="06710385", outfile="a.gpkg")
+        crashed = pool.submit(gauge_id="crash", outfile="a.gpkg")
+        after = pool.submit(gauge_id="06710385", outfile="a.gpkg")
+
+        assert crashed["status"] == "error"
+        assert crashed["error_class"] == "WorkerCrashed"
+        assert after["status"] == "ok"
+        assert after["pid"] != before["pid"]
+
+    def test_job_timeout(self, pool):
+        """Test a job that runs too long is killed and reported as a timeout"""
+        result = pool.submit(gauge_id="hang", outfile="a.gpkg")
+        after = pool.submit(gauge_id="06710385", outfile="a.gpkg")
+
+        assert result["status"] == "error"
+        assert result["error_class"] == "Timeout"
+        assert after["status"] == "ok"
+
+    def test_startup_failure(self, tmp_path):
+        """Test a worker that cannot start is reported instead of raised"""
+        pool = RSubsetterPool([sys.executable, "-c", "import sys; sys.exit(1)"], size=1,
+                              job_timeout=2, startup_timeout=5)
+
+        result = pool.submit(gauge_id="06710385", outfile="a.gpkg")
+
+        assert result["status"] == "error"
+        assert result["error_class"] == "WorkerStartup"
+
+    def test_startup_eof_stops_worker(self):
+        """Test a worker that closes its output during startup is not left running"""
+        worker = RSubsetterWorker([sys.executable, "-c", "import os, time; os.close(1); time.sleep(60)"],
+                                  startup_timeout=10)
+
+        with pytest.raises(RuntimeError, match="exited during startup"):
+            worker.start()
+        assert not worker.is_alive()
@@ -0,0 +1,89 @@
+import contextvars
+import json
+import os
+import socket
+import time
+
+import pytest
+from unittest.mock import patch
+
+from djangoApps.init_param_app.util.gage_file_management import GageFileManagement
+from djangoApps.init_param_app.util.workspace import (scratch_workspace, current_workspace, clean_orphaned_workspaces,
+                                                      WorkspaceQuotaExceeded, OWNER_FILENAME)
+
+
+@pytest.fixture
+def workspace_config(tmp_path):
+    config = {'workspace_root': str(tmp_path / 'disk'), 'workspace_tmpfs_root': str(tmp_path / 'tmpfs'),
+              'workspace_quota_mb': 1, 'workspace_max_age': 3600, 'workspace_janitor_interval': 0}
+    with patch('djangoApps.init_param_app.util.workspace.get_config', return_value=config):
+        yield config
+
+
+class TestWorkspace:
+    def test_requests_get_unique_workspaces(self, workspace_config):
+        """Test each request works in its own directory, removed at the end even when the request raises"""
+        with scratch_workspace('ipe-01123000') as first, scratch_workspace('ipe-01123000') as nested:
+            assert nested is first
+            assert first.path.startswith(workspace_config['workspace_tmpfs_root'])
+
+            # A concurrent request runs in a context of its own
+            def failing_request():
+                with scratch_workspace('ipe-01123000') as second:
+                    paths.append(second.path)
+                    raise RuntimeError('module failed')
+
+            paths = []
+            with pytest.raises(RuntimeError):
+                contextvars.Context().run(failing_request)
+            assert paths[0] != first.path
+            assert not os.path.exists(paths[0])
+            assert current_workspace() is first
+        assert not os.path.exists(first.path)
+        assert current_workspace() is None
+
+    def test_temp_directory_in_workspace(self, workspace_config):
+        """Test get_local_temp_directory places files in the workspace of the request"""
+        file_config = {'s3url': 's3.us-east-1.amazonaws.com', 's3uri': 's3://test-bucket', 'region': 'us-east-1'}
+        with patch('djangoApps.init_param_app.util.file_management.get_config', return_value=file_config), \
+                patch('djangoApps.init_param_app.util.gage_file_management.get_api_version', return_value='1.0.0'):
+            gage_file_mgmt = GageFileManagement()
+        with scratch_workspace('ipe-01123000') as workspace:
+            directory = gage_file_mgmt.get_local_temp_directory('PARAMS', '01123000')
+            assert directory == os.path.join(workspace.path, 'PARAMS', '01123000', '')
+            assert os.path.isdir(directory)
+
+    def test_quota(self, workspace_config):
+        """Test a workspace larger than its quota raises"""
+        with scratch_workspace('ipe-01123000') as workspace:
+            with open(os.path.join(workspace.directory('PARAMS', '01123000'), 'big.bin'), 'wb') as big:
+                big.write(b'0' * (1024 * 1024 + 1))
+            with pytest.raises(WorkspaceQuotaExceeded):
+                workspace.check_quota()
+
+    def test_tmpfs_without_room_falls_back_to_disk(self, workspace_config):
+        """Test the disk root is used when tmpfs has no room for the quota"""
+        with patch('djangoApps.init_param_app.util.workspace.shutil.disk_usage') as mock_disk_usage:
+            mock_disk_usage.return_value.free = 1024
+            with scratch_workspace('ipe-01123000') as workspace:
+                assert workspace.path.startswith(workspace_config['workspace_root'])
+
+    def test_clean_orphaned_workspaces(self, workspace_config, tmp_path):
+        """Test the janitor removes workspaces of dead processes, and old ones of other hosts or without owner"""
+        root = tmp_path / 'disk'
+        owners = (('live', socket.gethostname(), os.getpid()), ('dead', socket.gethostname(), 2 ** 22 + 1),
+                  ('old-live', socket.gethostname(), os.getpid()), ('remote', 'other-host', 7),
+                  ('old-remote', 'other-host', 7), ('old-unowned', None, None))
+        old = time.time() - 7200
+        for name, host, pid in owners:
+            (root / name).mkdir(parents=True)
+            if host is not None:
+                (root / name / OWNER_FILENAME).write_text(json.dumps({'host': host, 'pid': pid}))
+            if name.startswith('old'):
+                os.utime(root / name, (old, old))
+
+        with patch('djangoApps.init_param_app.util.workspace.process_alive', side_effect=lambda pid: pid == os.getpid()):
+            removed = clean_orphaned_workspaces()
+
+        assert sorted(os.path.basename(path) for path in removed) == ['dead', 'old-remote', 'old-unowned']
+        assert os.path.isdir(root / 'live') and os.path.isdir(root / 'old-live')